@@ -2,6 +2,7 @@ from flask import Flask, jsonify
 from flask_mqtt import Mqtt
 from fatigue_detector import YOLOv11FatigueDetector
 from crowd_detector import YOLOv11CrowdDetector
+from mqtt_protocol import parse_frame_message
 from PIL import Image
 from io import BytesIO
 import cv2
@@ -43,6 +44,9 @@ FATIGUE_FRAME_TOPIC = 'mqtt-fatigue-frame'
 CROWD_RESULT_TOPIC = 'mqtt-crowd-result'
 FATIGUE_RESULT_TOPIC = 'mqtt-fatigue-result'
 
+# Task of each frame topic, for parse_frame_message
+FRAME_TASKS = {CROWD_FRAME_TOPIC: 'crowd', FATIGUE_FRAME_TOPIC: 'fatigue'}
+
 # Global variables to store latest received messages
 latest_crowd_frame = None
 latest_fatigue_frame = None
@@ -89,13 +93,12 @@ def handle_connect(client, userdata, flags, rc):
 def handle_mqtt_message(clientt, userdata, message):
     global latest_crowd_frame, latest_fatigue_frame
     topic = message.topic
-    payload = message.payload.decode('utf-8')
 
     try:
-        # parse the payload
-        data = json.loads(payload.replace("'", '"'))
-        frame_data = data['frame']
-        id = data['id']
+        # parse the payload (JSON, or the single-quoted dicts of older clients)
+        frame_message = parse_frame_message(message.payload, topic, task=FRAME_TASKS.get(topic))
+        frame_data = frame_message.frame
+        id = frame_message.id
 
         if topic == CROWD_FRAME_TOPIC:
             latest_crowd_frame = frame_data
@@ -129,8 +132,8 @@ def handle_mqtt_message(clientt, userdata, message):
         #         'fatigue_status': fatigue_status
         #     }, default=custom_serializer))
 
-    except json.JSONDecodeError:
-        print(f'Error decoding JSON from topic {topic}')
+    except ValueError as e:
+        print(f'Error decoding message from topic {topic}: {e}')
     except Exception as e:
         print(f'Error processing message from {topic}: {e}')
 
@@ -1,16 +1,31 @@
-from flask import Flask, render_template, Response
+from flask import Flask, render_template, Response, request, jsonify, send_from_directory
 from flask_mqtt import Mqtt
 from crowd_detector import YOLOv11CrowdDetector
-from fatigue_detector import YOLOv11FatigueDetector
+from fatigue_detector import YOLOv11FatigueDetector, FatigueState
+from camera_stream import CameraStream
+from frame_bus import FrameBus, fork_supported
+from mjpeg_broadcaster import MjpegBroadcaster
+from frame_decoder import FrameDecoder
+from mqtt_publisher import ResultPublisher
+from mqtt_protocol import CameraRouter, frame_topic, parse_frame_message, parse_topic, result_message, result_topic
+from cluster import Membership, shared_topic, worker_topic
+from profiler import Profiler, command_authorized
+import metrics
+import memory
+import atexit
+import functools
+import hmac
+import os
+import socket
+import sys
+import threading
+import time
 import cv2
 import logging
 import json
 from datetime import datetime
 import base64
-from PIL import Image
 import numpy as np
-from io import BytesIO
-import gc
 
 # Konfigurasi Logging yang Lebih Komprehensif
 logging.basicConfig(
@@ -24,6 +39,46 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Sumber kamera; dengan CAMERA_DECIMATION = n hanya setiap frame ke-n yang di-decode
+CAMERA_SOURCE = 1
+CAMERA_DECIMATION = 1
+
+# Mode multiproses: capture dan inferensi berjalan di proses terpisah dan
+# berbagi frame lewat shared memory (lihat frame_bus.FrameBus)
+MULTIPROCESS = False
+
+# Kualitas JPEG dan lebar frame (None = resolusi kamera) untuk /video_feed
+STREAM_JPEG_QUALITY = 80
+STREAM_WIDTH = None
+
+# Frame MQTT: sisi terpanjang minimum setelah decode tereduksi (ukuran input
+# model) dan maksimum sebelum diperkecil (None = tidak diperkecil)
+DECODE_MIN_SIZE = 640
+DECODE_MAX_SIZE = 1280
+
+# Anggaran memori proses (MiB), interval sampling RSS (detik) dan threshold GC
+# (generasi 0, 1, 2) selama inferensi
+MEMORY_BUDGET_MB = 2048
+MEMORY_SAMPLE_INTERVAL = 10.0
+GC_THRESHOLDS = (10000, 50, 100)
+
+# Direktori hasil profiling on-demand (POST /admin/profile atau topik MQTT admin)
+PROFILE_DIR = 'profiles'
+
+# Token untuk route /admin/* (header "Authorization: Bearer <token>") dan
+# topik MQTT admin (field "token" di payload). Capture berisi stack frame dan
+# path source, jadi tanpa token route dan topik admin dimatikan
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Scale-out: proses dengan WORKER_GROUP yang sama membagi kamera di antara
+# mereka (lihat cluster); None = satu proses melayani semua kamera. Per task:
+# "shared" = shared subscription MQTT (broker membagi frame; untuk task tanpa
+# state antar frame), "sharded" = consistent hashing kamera ke worker (state
+# per kamera tetap di satu worker dan pindah saat worker mati)
+WORKER_GROUP = os.environ.get('WORKER_GROUP')
+WORKER_ID = os.environ.get('WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+TASK_DISTRIBUTION = {"crowd": "shared", "fatigue": "sharded"}
+
 
 class AppManager:
     _instance = None
@@ -37,6 +92,17 @@ class AppManager:
         if hasattr(self, 'initialized'):
             return
 
+        # Proses worker di-fork, jadi harus dimulai sebelum thread MQTT dan
+        # detector dibuat di proses ini. Tanpa fork (Windows, macOS) aplikasi
+        # kembali ke mode thread
+        self.frame_bus = None
+        if MULTIPROCESS:
+            if fork_supported():
+                self.frame_bus = self._init_frame_bus()
+            else:
+                logger.warning(f"MULTIPROCESS membutuhkan start method fork, yang tidak dapat dipakai di "
+                               f"{sys.platform}; kamera dan inferensi berjalan di thread")
+
         # Inisialisasi sumber daya sekali
         self.app = Flask(__name__)
         self.mqtt = self._setup_mqtt()
@@ -45,7 +111,9 @@ class AppManager:
         self.crowd_detector = YOLOv11CrowdDetector()
         self.fatigue_detector = YOLOv11FatigueDetector()
 
-        self.camera = self._init_camera()
+        # Pada mode multiproses kamera dibaca oleh proses capture; bila frame
+        # bus tidak berjalan kamera dibaca di proses ini
+        self.camera = None if self.frame_bus is not None else self._init_camera()
 
         self.initialized = True
 
@@ -54,29 +122,47 @@ class AppManager:
         self.app.config['MQTT_BROKER_URL'] = 'localhost'
         self.app.config['MQTT_BROKER_PORT'] = 1883
         self.app.config['MQTT_REFRESH_TIME'] = 1.0
+        if WORKER_GROUP:
+            # Last will mengosongkan heartbeat retained, sehingga worker lain
+            # langsung mengambil alih kamera bila proses ini mati
+            self.app.config['MQTT_LAST_WILL_TOPIC'] = worker_topic(WORKER_GROUP, WORKER_ID)
+            self.app.config['MQTT_LAST_WILL_MESSAGE'] = ''
+            self.app.config['MQTT_LAST_WILL_QOS'] = 1
+            self.app.config['MQTT_LAST_WILL_RETAIN'] = True
 
         mqtt = Mqtt(self.app)
         return mqtt
 
 
     def _init_camera(self):
-        """Inisialisasi kamera dengan error handling"""
+        """Inisialisasi kamera dengan error handling
+
+        Satu thread membaca kamera untuk semua endpoint; setiap endpoint
+        mengambil frame terbaru tanpa mengambil frame milik endpoint lain.
+        """
         try:
-            camera = cv2.VideoCapture(1)
-            if not camera.isOpened():
-                logger.error("Kamera tidak dapat diakses")
-                return None
-            return camera
+            return CameraStream(CAMERA_SOURCE, name="camera", decimation=CAMERA_DECIMATION).start()
         except Exception as e:
             logger.error(f"Gagal menginisialisasi kamera: {e}")
             return None
 
+    def _init_frame_bus(self):
+        """Mulai proses capture dan proses inferensi crowd/fatigue"""
+        try:
+            frame_bus = FrameBus([CAMERA_SOURCE], decimation=CAMERA_DECIMATION).start()
+            atexit.register(frame_bus.stop)
+            return frame_bus
+        except Exception as e:
+            logger.error(f"Gagal menjalankan frame bus: {e}")
+            return None
+
 
 # Gunakan metode singleton untuk manajemen aplikasi
 app_manager = AppManager()
 app = app_manager.app
 mqtt = app_manager.mqtt
-camera= app_manager._init_camera()
+camera = app_manager.camera
+frame_bus = app_manager.frame_bus
 crowd_detector = app_manager.crowd_detector
 fatigue_detector = app_manager.fatigue_detector
 
@@ -85,23 +171,154 @@ CROWD_FRAME_TOPIC = 'mqtt-crowd-frame'
 FATIGUE_FRAME_TOPIC = 'mqtt-fatigue-frame'
 CROWD_RESULT_TOPIC = 'mqtt-crowd-result'
 FATIGUE_RESULT_TOPIC = 'mqtt-fatigue-result'
+PROFILE_TOPIC = 'mqtt-admin-profile'
+PROFILE_RESULT_TOPIC = 'mqtt-admin-profile-result'
+
+# QoS per topik hasil, topik yang hasilnya digabung menjadi satu pesan per
+# RESULT_BATCH_INTERVAL detik (dikirim ke "<topik>-batch"), dan ukuran antrean
+# keluar sebelum hasil terlama dibuang
+RESULT_QOS = {CROWD_RESULT_TOPIC: 0, FATIGUE_RESULT_TOPIC: 0}
+RESULT_BATCH_TOPICS = ()
+RESULT_BATCH_INTERVAL = 0.5
+RESULT_QUEUE_SIZE = 1024
+
+# Profiler on-demand; tidak ada overhead selama tidak ada capture yang berjalan
+profiler = Profiler(PROFILE_DIR)
+
+# Topik per kamera: frame di "<task>/<kamera>/frame", hasil di "<task>/<kamera>/result"
+# (lihat mqtt_protocol); topik lama di atas tetap dilayani
+FRAME_TASKS = {CROWD_FRAME_TOPIC: "crowd", FATIGUE_FRAME_TOPIC: "fatigue"}
+LEGACY_RESULT_TOPICS = {"crowd": CROWD_RESULT_TOPIC, "fatigue": FATIGUE_RESULT_TOPIC}
+
+
+# State per kamera: frame terakhir, zona crowd (sesuai resolusi kamera) dan
+# timer fatigue, sehingga kamera yang berbeda tidak saling memengaruhi
+class CameraState:
+    def __init__(self, camera):
+        self.camera = camera
+        self.latest_frame = None
+        self.zone = None
+        self.zone_size = None
+        self.fatigue = FatigueState()
+
+    def zone_for(self, frame):
+        height, width = frame.shape[:2]
+        if self.zone_size != (width, height):
+            self.zone = crowd_detector.make_zone(width, height)
+            self.zone_size = (width, height)
+        return self.zone
+
+
+# Distribusi frame satu task: None bila tidak ada WORKER_GROUP
+def distribution(task):
+    return TASK_DISTRIBUTION.get(task, "sharded") if WORKER_GROUP else None
+
+
+# Satu router per task, karena nomor urut frame (seq) dihitung per topik. Pada
+# shared subscription celah seq adalah frame milik worker lain, bukan frame hilang
+camera_routers = {task: CameraRouter(CameraState, name=f"mqtt_{task}", count_gaps=distribution(task) != "shared")
+                  for task in ("crowd", "fatigue")}
+
+
+# Kamera yang pindah ke worker lain setelah worker bergabung/keluar kehilangan state-nya di sini
+def rebalance_cameras(ring):
+    logger.info(f"Worker group {WORKER_GROUP}: {', '.join(ring.nodes)}")
+    for task, router in camera_routers.items():
+        if distribution(task) != "sharded":
+            continue
+        for camera in router.cameras():
+            if ring.node_for(camera) != WORKER_ID and router.discard(camera):
+                logger.info(f"Kamera {camera} ({task}) pindah ke worker {ring.node_for(camera)}")
+
+
+membership = Membership(
+    WORKER_GROUP,
+    WORKER_ID,
+    lambda topic, payload, qos, retain: mqtt.publish(topic, payload, qos, retain),
+    on_change=rebalance_cameras,
+) if WORKER_GROUP else None
+if membership is not None:
+    membership.start()
+    atexit.register(membership.stop)
+
+
+# Frame kamera milik worker lain dilewati; tanpa WORKER_GROUP semua kamera milik proses ini
+def owns_camera(task, camera):
+    return distribution(task) != "sharded" or membership.owns(camera)
+
+
+# Decoder frame: cv2.imdecode langsung ke BGR dan decode JPEG besar pada skala
+# 1/2-1/8 (model hanya memakai 640 piksel)
+frame_decoder = FrameDecoder(min_size=DECODE_MIN_SIZE, max_size=DECODE_MAX_SIZE)
 
-# Variabel Global untuk Menyimpan Frame Terakhir
-latest_crowd_frame = None
-latest_fatigue_frame = None
 
 # Fungsi untuk Memproses Frame dari Data Base64
 def process_frame(frame_data):
     try:
         if ',' in frame_data:
             frame_data = frame_data.split(',')[1]
-        frame_bytes = base64.b64decode(frame_data)
-        frame_pil = Image.open(BytesIO(frame_bytes))
-        frame = cv2.cvtColor(np.array(frame_pil), cv2.COLOR_RGB2BGR)
-        return frame
+        with metrics.stage("b64decode"):
+            frame_bytes = base64.b64decode(frame_data)
+        return decode_frame_bytes(frame_bytes)
+    except Exception as e:
+        logging.error(f"Error processing frame: {e}")
+        return None, None
+
+
+# Fungsi untuk Mendekode Gambar (JPEG/PNG) menjadi Frame BGR, beserta ukuran
+# (lebar, tinggi) gambar asli karena frame bisa didekode pada skala lebih kecil
+def decode_frame_bytes(frame_bytes):
+    try:
+        with metrics.stage("decode"):
+            frame, size = frame_decoder.decode(frame_bytes)
+        if frame is None:
+            logging.error("Error processing frame: gambar tidak dapat didekode")
+        return frame, size
     except Exception as e:
         logging.error(f"Error processing frame: {e}")
-        return None
+        return None, None
+
+
+# Dekode frame dari FrameMessage (base64 dalam JSON atau byte gambar mentah);
+# mengembalikan (frame, ukuran gambar asli)
+def decode_message_frame(message):
+    if message.encoding == "raw":
+        return decode_frame_bytes(message.frame)
+    return process_frame(message.frame)
+
+
+# Bounding box dari frame yang didekode lebih kecil dikembalikan ke koordinat
+# gambar yang dikirim klien
+def scale_detections(detection_data, frame, source_size):
+    height, width = frame.shape[:2]
+    if source_size is None or source_size == (width, height):
+        return detection_data
+    scale_x = source_size[0] / width
+    scale_y = source_size[1] / height
+    for detection in detection_data:
+        box = detection["bounding_box"]
+        for key, scale in (("x_min", scale_x), ("y_min", scale_y), ("x_max", scale_x), ("y_max", scale_y)):
+            box[key] = int(round(box[key] * scale))
+    return detection_data
+
+
+# Hasil crowd satu frame, dengan jumlah orang di zona kamera tersebut. Koordinat
+# deteksi memakai piksel gambar asli (`source_size`), bukan frame yang didekode
+def crowd_frame_result(frame, state, source_size=None):
+    detections, detection_data = crowd_detector.detect(frame)
+    detection_data = scale_detections(detection_data, frame, source_size)
+    return {"status": "success",
+            "timestamp": str(datetime.now()),
+            "num_people": len(detection_data),
+            "num_in_zone": int(state.zone_for(frame).trigger(detections=detections).sum()),
+            "detections": detection_data}
+
+
+# Hasil fatigue satu frame; timer memakai waktu capture bila dikirim klien
+def fatigue_frame_result(frame, state, ts):
+    detections = fatigue_detector.detect(frame)
+    return {"status": fatigue_detector.get_fatigue_category(detections, state.fatigue, now=ts),
+            "timestamp": str(datetime.now())}
 
 
 # konversi objek numpy.ndarray menjadi list
@@ -111,107 +328,219 @@ def custom_serializer(obj):
     raise TypeError(f"Type {type(obj)} not serializable")
 
 
-# Fungsi untuk Menghasilkan Streaming Crowd Analysis
-def generate_crowd_frames():
-    if not camera or not crowd_detector:
-        logging.error("Streaming tidak dapat dimulai: Kamera atau detektor tidak diinisialisasi.")
-        return
-
-    while camera.isOpened():
-        success, frame = camera.read()
-        if not success:
-            logging.warning("Gagal menangkap frame dari kamera.")
-            break
-        try:
-            frame, detection_data = crowd_detector.detect_and_annotate(frame)
-            num_people = len(detection_data)
-
-            # Publikasikan Hasil ke MQTT
-            mqtt_data = {"status": "success",
-                         "timestamp": str(datetime.now()),
-                         "num_people": num_people,
-                         "detections": detection_data}
-            mqtt.publish(CROWD_RESULT_TOPIC, json.dumps(mqtt_data, default=custom_serializer))
-
-            # # Encode Frame untuk Streaming
-            # ret, buffer = cv2.imencode('.jpg', frame)
-            # if ret:
-            #     yield (b'--frame\r\n'
-            #            b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-        except Exception as e:
-            logging.error(f"Error dalam memproses frame crowd: {e}")
-            break
-
-
-# Fungsi untuk Menghasilkan Streaming Fatigue Analysis
-def generate_fatigue_frames():
-    if not camera or not fatigue_detector:
-        logging.error("Streaming tidak dapat dimulai: Kamera atau detektor tidak diinisialisasi.")
-        return
-
-    while camera.isOpened():
-        success, frame = camera.read()
-        if not success:
-            logging.warning("Gagal menangkap frame dari kamera.")
-            break
-        try:
-            frame, detected_classes = fatigue_detector.detect_and_annotate(frame)
-            fatigue_status = fatigue_detector.get_fatigue_category(detected_classes)
-
-            # Publikasikan Hasil ke MQTT
-            mqtt_data = {"status": fatigue_status, "timestamp": str(datetime.now())}
-            mqtt.publish(FATIGUE_RESULT_TOPIC, json.dumps(mqtt_data, default=custom_serializer))
-
-            # Tambahkan Status ke Frame
-            cv2.putText(frame, fatigue_status, (10, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-
-            # Encode Frame untuk Streaming
-            # ret, buffer = cv2.imencode('.jpg', frame)
-            # if ret:
-            #     yield (b'--frame\r\n'
-            #            b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-        except Exception as e:
-            logging.error(f"Error dalam memproses frame fatigue: {e}")
-            break
+# Antrean keluar MQTT: serialisasi dan publikasi berjalan di thread sendiri,
+# sehingga thread inferensi tidak menunggu broker yang lambat
+result_publisher = ResultPublisher(
+    lambda topic, payload, qos: mqtt.publish(topic, payload, qos),
+    qos=RESULT_QOS,
+    batch_topic=lambda topic: f"{topic}-batch" if topic in RESULT_BATCH_TOPICS else None,
+    batch_interval=RESULT_BATCH_INTERVAL,
+    max_queue=RESULT_QUEUE_SIZE,
+    serializer=lambda data: json.dumps(data, default=custom_serializer),
+).start()
+atexit.register(result_publisher.stop)
+
+
+# Kirim hasil ke antrean publikasi MQTT (tidak memblokir)
+def publish_result(topic, data, model):
+    result_publisher.submit(topic, data, model)
+
+
+# Fungsi Inferensi Crowd untuk Streaming: anotasi frame dan publikasikan hasil
+def annotate_crowd_frame(frame):
+    frame, detection_data = crowd_detector.detect_and_annotate(frame)
+    num_people = len(detection_data)
+
+    # Publikasikan Hasil ke MQTT
+    mqtt_data = {"status": "success",
+                 "timestamp": str(datetime.now()),
+                 "num_people": num_people,
+                 "detections": detection_data}
+    publish_result(CROWD_RESULT_TOPIC, mqtt_data, "crowd")
+    return frame
+
+
+# Fungsi Inferensi Fatigue untuk Streaming: anotasi frame dan publikasikan hasil
+def annotate_fatigue_frame(frame):
+    # detect_and_annotate menganotasi frame di tempat dan mengembalikan objek deteksi
+    detections, _ = fatigue_detector.detect_and_annotate(frame)
+    fatigue_status = fatigue_detector.get_fatigue_category(detections)
+
+    # Publikasikan Hasil ke MQTT
+    mqtt_data = {"status": fatigue_status, "timestamp": str(datetime.now())}
+    publish_result(FATIGUE_RESULT_TOPIC, mqtt_data, "fatigue")
+
+    # Tambahkan Status ke Frame
+    cv2.putText(frame, fatigue_status, (10, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+    return frame
+
+
+# Hasil terbaru proses inferensi per (task, indeks kamera) pada mode
+# multiproses; frame bus app ini hanya membaca CAMERA_SOURCE (indeks 0)
+latest_bus_results = {}
+
+
+# Mode multiproses: frame dari ring shared memory diberi anotasi dari hasil
+# terbaru proses inferensi, sehingga inferensi tidak dijalankan dua kali
+def overlay_crowd_result(frame):
+    result = latest_bus_results.get(("crowd", 0))
+    if result is not None:
+        for detection in result["detections"]:
+            box = detection["bounding_box"]
+            cv2.rectangle(frame, (box["x_min"], box["y_min"]), (box["x_max"], box["y_max"]), (0, 255, 0), 2)
+        cv2.putText(frame, f"Jumlah orang: {result['num_people']}", (10, 50),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+    return frame
+
+
+def overlay_fatigue_result(frame):
+    result = latest_bus_results.get(("fatigue", 0))
+    if result is not None:
+        cv2.putText(frame, result["status"], (10, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+    return frame
+
+
+# Satu loop inferensi per analisis; setiap frame di-encode JPEG sekali dan
+# dikirim ke semua penonton (penonton yang lambat melewatkan frame). Pada mode
+# multiproses loop membaca kamera dari ring frame bus dan hanya menggambar hasil
+crowd_broadcaster = None
+fatigue_broadcaster = None
+if frame_bus is not None:
+    crowd_broadcaster = MjpegBroadcaster("crowd", frame_bus.reader(0), overlay_crowd_result,
+                                         quality=STREAM_JPEG_QUALITY, width=STREAM_WIDTH)
+    fatigue_broadcaster = MjpegBroadcaster("fatigue", frame_bus.reader(0), overlay_fatigue_result,
+                                           quality=STREAM_JPEG_QUALITY, width=STREAM_WIDTH)
+else:
+    if camera and crowd_detector:
+        crowd_broadcaster = MjpegBroadcaster("crowd", camera, annotate_crowd_frame,
+                                             quality=STREAM_JPEG_QUALITY, width=STREAM_WIDTH)
+    if camera and fatigue_detector:
+        fatigue_broadcaster = MjpegBroadcaster("fatigue", camera, annotate_fatigue_frame,
+                                               quality=STREAM_JPEG_QUALITY, width=STREAM_WIDTH)
+
+
+# Publikasikan hasil dari proses inferensi (mode multiproses) ke MQTT
+def publish_bus_results():
+    result_topics = {"crowd": CROWD_RESULT_TOPIC, "fatigue": FATIGUE_RESULT_TOPIC}
+    while True:
+        item = frame_bus.get_result(timeout=1.0)
+        if item is None:
+            continue
+        task, meta, result, timings = item
+        latest_bus_results[(task, meta.camera)] = result
+        camera_name = str(frame_bus.sources[meta.camera])
+        # Stage yang diukur di proses inferensi
+        for stage, seconds in timings.items():
+            metrics.observe(stage, seconds, model=task, camera=camera_name)
+        mqtt_data = dict(result, timestamp=str(datetime.fromtimestamp(meta.timestamp)))
+        with metrics.context(camera=camera_name):
+            publish_result(result_topics[task], mqtt_data, task)
+
+
+if frame_bus is not None:
+    threading.Thread(target=publish_bus_results, name="frame-bus-results", daemon=True).start()
+
+    # Kedalaman antrean dan frame yang dibuang oleh frame bus
+    metrics.REGISTRY.gauge("frame_bus_queue_depth", "Frames waiting for an inference worker.", ("task",),
+                           callback=lambda: {(task,): depth for task, depth in frame_bus.queue_depths().items()})
+    metrics.REGISTRY.counter("frame_bus_frames_dropped_total", "Frames the inference workers never processed.",
+                             ("task",),
+                             callback=lambda: {(task,): dropped for task, dropped in frame_bus.dropped_counts().items()})
 
 
 # MQTT Event Handlers
 @mqtt.on_connect()
 def handle_connect(client, userdata, flags, rc):
     print("Connected to MQTT Broker")
-    mqtt.subscribe(CROWD_FRAME_TOPIC)
-    mqtt.subscribe(FATIGUE_FRAME_TOPIC)
-    print(f"Subscribed to {CROWD_FRAME_TOPIC} and {FATIGUE_FRAME_TOPIC}")
+    topics = [PROFILE_TOPIC] if ADMIN_TOKEN else []
+    for legacy_topic, task in FRAME_TASKS.items():
+        for topic in (legacy_topic, frame_topic(task)):
+            topics.append(shared_topic(WORKER_GROUP, topic) if distribution(task) == "shared" else topic)
+    if membership is not None:
+        topics.append(membership.subscription)
+    for topic in topics:
+        mqtt.subscribe(topic)
+    print(f"Subscribed to {', '.join(topics)}")
+    if membership is not None:
+        membership.heartbeat()
+
+
+# Perintah profiling lewat MQTT, misalnya {"token": "<ADMIN_TOKEN>", "seconds": 10,
+# "memory": true}; path file hasil dipublikasikan ke PROFILE_RESULT_TOPIC setelah selesai
+def handle_profile_command(payload):
+    params = json.loads(payload.decode('utf-8') or '{}')
+    if not command_authorized(params, ADMIN_TOKEN):
+        logger.warning("Perintah profiling MQTT tanpa token admin yang valid diabaikan")
+        return
+    path = profiler.start_from(params, on_done=lambda path: mqtt.publish(
+        PROFILE_RESULT_TOPIC, json.dumps({"status": "done" if path else "failed", "path": path})))
+    if path is None:
+        mqtt.publish(PROFILE_RESULT_TOPIC, json.dumps({"status": "busy", "path": profiler.current}))
 
 
 @mqtt.on_message()
 def handle_mqtt_message(client, userdata, message):
-    global latest_crowd_frame, latest_fatigue_frame
     topic = message.topic
-    payload = message.payload.decode('utf-8')
 
     try:
-        data = json.loads(payload)
-
-        if topic == CROWD_FRAME_TOPIC:
-            latest_crowd_frame = process_frame(data['frame'])
-            if latest_crowd_frame is not None:
-                crowd_result = {"status": "success",
-                                "timestamp": str(datetime.now()),
-                                "num_people": len(crowd_detector.detect_and_annotate(latest_crowd_frame)[0])}
-                mqtt.publish(CROWD_RESULT_TOPIC, json.dumps(crowd_result))
-
-        elif topic == FATIGUE_FRAME_TOPIC:
-            latest_fatigue_frame = process_frame(data['frame'])
-            if latest_fatigue_frame is not None:
-                fatigue_result = {"status": fatigue_detector.get_fatigue_category(fatigue_detector.detect_and_annotate(latest_fatigue_frame)[1]),
-                                 "timestamp": str(datetime.now())}
-                mqtt.publish(FATIGUE_RESULT_TOPIC, json.dumps(fatigue_result))
+        if topic == PROFILE_TOPIC:
+            handle_profile_command(message.payload)
+            return
+        if membership is not None and topic.startswith(membership.subscription[:-1]):
+            membership.handle(topic, message.payload)
+            return
+
+        # Topik per kamera menyebut kameranya, jadi frame kamera lain dilewati sebelum payload di-parse
+        routed = parse_topic(topic)
+        if routed is not None and routed[0] in camera_routers and not owns_camera(*routed):
+            return
+
+        with metrics.stage("mqtt_receive", camera=""):
+            msg = parse_frame_message(message.payload, topic, task=FRAME_TASKS.get(topic))
+        if msg.task not in camera_routers:
+            logging.warning(f"Topik tidak dikenal: {topic}")
+            return
+        if not owns_camera(msg.task, msg.camera):
+            return
+
+        # Frame yang lebih lama dari frame terakhir kamera yang sama dibuang
+        router = camera_routers[msg.task]
+        if not router.accept(msg.camera, msg.seq):
+            logging.debug(f"Frame lama dari {msg.camera} dibuang (seq {msg.seq})")
+            return
+        state = router.get(msg.camera)
+
+        with metrics.context(camera=msg.camera):
+            frame, source_size = decode_message_frame(msg)
+            if frame is None:
+                return
+            state.latest_frame = frame
+
+            if msg.task == "crowd":
+                result = crowd_frame_result(frame, state, source_size)
+            else:
+                result = fatigue_frame_result(frame, state, msg.ts)
+
+            # Topik lama menerima hasil di topik hasil lama, topik per kamera di "<task>/<kamera>/result"
+            topic_out = LEGACY_RESULT_TOPICS[msg.task] if topic in FRAME_TASKS else result_topic(msg.task, msg.camera)
+            publish_result(topic_out, result_message(msg, result), msg.task)
 
     except Exception as e:
         logging.error(f"Error processing MQTT message: {e}")
 
 
+# Hapus state kamera yang sudah lama tidak mengirim frame
+def evict_idle_cameras():
+    while True:
+        time.sleep(60)
+        for task, router in camera_routers.items():
+            for camera in router.evict_idle():
+                logger.info(f"State kamera {camera} ({task}) dihapus karena tidak aktif")
+
+
+threading.Thread(target=evict_idle_cameras, name="camera-evict", daemon=True).start()
+
+
 # Flask Routes
 @app.route('/')
 def index():
@@ -230,18 +559,66 @@ def fatigue_analysis():
 
 @app.route('/video_feed/crowd')
 def video_feed_crowd():
-    return Response(generate_crowd_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    if crowd_broadcaster is None:
+        logging.error("Streaming tidak dapat dimulai: Kamera atau detektor tidak diinisialisasi.")
+        return Response(status=503)
+    return Response(crowd_broadcaster.stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
 @app.route('/video_feed/fatigue')
 def video_feed_fatigue():
-    return Response(generate_fatigue_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
-
-# Tambahkan pembersihan memori secara berkala
-@app.teardown_appcontext
-def cleanup_resources(exception=None):
-    gc.collect()
-    logger.info("Membersihkan resource aplikasi")
+    if fatigue_broadcaster is None:
+        logging.error("Streaming tidak dapat dimulai: Kamera atau detektor tidak diinisialisasi.")
+        return Response(status=503)
+    return Response(fatigue_broadcaster.stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+# Route admin hanya aktif bila ADMIN_TOKEN diset, dan hanya untuk request yang membawa token tersebut
+def require_admin_token(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "not found"}), 404
+        auth = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+            return jsonify({"error": "unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# Profiling on-demand: POST memulai capture (?seconds=10&interval=0.005&memory=1),
+# GET menampilkan daftar capture, /admin/profile/<nama> mengunduh hasilnya
+@app.route('/admin/profile', methods=['GET', 'POST'])
+@require_admin_token
+def profile_endpoint():
+    if request.method == 'GET':
+        return jsonify({"running": profiler.current, "captures": profiler.captures()})
+    try:
+        path = profiler.start_from(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if path is None:
+        return jsonify({"error": "capture already running", "running": profiler.current}), 409
+    return jsonify({"path": path, "name": os.path.basename(path)}), 202
+
+
+@app.route('/admin/profile/<path:name>')
+@require_admin_token
+def profile_download(name):
+    return send_from_directory(os.path.abspath(PROFILE_DIR), name, as_attachment=True)
+
+
+# Manajemen memori tanpa gc.collect() per request: objek startup (model)
+# dibekukan agar tidak ditelusuri GC, threshold GC dinaikkan, dan koleksi penuh
+# hanya dijalankan saat RSS melewati anggaran
+memory.tune_gc(GC_THRESHOLDS)
+memory.install_gc_metrics()
+memory_monitor = memory.MemoryMonitor(budget_bytes=MEMORY_BUDGET_MB << 20,
+                                      interval=MEMORY_SAMPLE_INTERVAL).start()
 
 if __name__ == "__main__":
     app.run(debug=True, port=5000)
\ No newline at end of file
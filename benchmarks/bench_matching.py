@@ -0,0 +1,98 @@
+"""
+Micro-benchmark for face_tracking/tracker/matching.py.
+
+Times the IoU kernel, the assignment step and Kalman motion gating at 10,
+100 and 500 tracks against as many detections, next to the scalar double
+loop the IoU kernel replaced and the per-track gating loop.
+
+    python benchmarks/bench_matching.py [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import scipy.linalg
+
+FACE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "face-recognition-master")
+sys.path.insert(0, FACE_DIR)
+
+from face_tracking.tracker import matching  # noqa: E402
+from face_tracking.tracker.kalman_filter import KalmanFilter  # noqa: E402
+from face_tracking.tracker.track_table import tlbr_to_xyah  # noqa: E402
+
+
+def make_boxes(rng, n, jitter=None):
+    """Random tlbr boxes, or the given boxes moved by up to `jitter` pixels."""
+    if jitter is None:
+        xy = rng.uniform(0, 1800, (n, 2))
+        wh = rng.uniform(20, 120, (n, 2))
+        return np.hstack([xy, xy + wh])
+    return jitter + rng.normal(0, 3, jitter.shape)
+
+
+def loop_ious(atlbrs, btlbrs):
+    """The scalar double loop ious() used before vectorization."""
+    ious = np.zeros((len(atlbrs), len(btlbrs)), dtype=np.float64)
+    for i, box1 in enumerate(atlbrs):
+        for j, box2 in enumerate(btlbrs):
+            ious[i, j] = matching.bbox_iou(box1, box2)
+    return ious
+
+
+def loop_gating(kf, means, covariances, measurements):
+    """Per-track scipy gating, as gate_cost_matrix computed it before."""
+    rows = []
+    for mean, covariance in zip(means, covariances):
+        mean, covariance = kf.project(mean, covariance)
+        cholesky_factor = np.linalg.cholesky(covariance)
+        z = scipy.linalg.solve_triangular(
+            cholesky_factor, (measurements - mean).T, lower=True, check_finite=False
+        )
+        rows.append(np.sum(z * z, axis=0))
+    return np.stack(rows)
+
+
+def timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return 1e3 * float(np.median(times))
+
+
+def main(repeat):
+    rng = np.random.default_rng(0)
+    kf = KalmanFilter()
+    print(
+        f"{'tracks':>6} {'loop ious':>12} {'ious':>10} {'assignment':>12}"
+        f" {'loop gating':>12} {'gating':>10}  (median ms)"
+    )
+    for n in (10, 100, 500):
+        tracks = make_boxes(rng, n)
+        dets = make_boxes(rng, n, jitter=tracks)
+        cost = 1 - matching.ious(tracks, dets)
+        means, covariances = kf.multi_predict(*kf.multi_initiate(tlbr_to_xyah(tracks)))
+        measurements = tlbr_to_xyah(dets)
+
+        loop_ms = timeit(lambda: loop_ious(tracks, dets), max(1, repeat // 10))
+        ious_ms = timeit(lambda: matching.ious(tracks, dets), repeat)
+        assign_ms = timeit(lambda: matching.linear_assignment(cost, thresh=0.8), repeat)
+        loop_gating_ms = timeit(lambda: loop_gating(kf, means, covariances, measurements), repeat)
+        assert np.allclose(
+            loop_gating(kf, means, covariances, measurements),
+            kf.multi_gating_distance(means, covariances, measurements),
+        )
+        gating_ms = timeit(lambda: kf.multi_gating_distance(means, covariances, measurements), repeat)
+        print(
+            f"{n:>6} {loop_ms:>12.3f} {ious_ms:>10.3f} {assign_ms:>12.3f}"
+            f" {loop_gating_ms:>12.3f} {gating_ms:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per measurement.")
+    main(parser.parse_args().repeat)
@@ -0,0 +1,325 @@
+"""
+Benchmark suite for the serving models.
+
+Measures throughput and p50/p99 latency of the crowd and fatigue detectors,
+SCRFD, Yolov5Face, ArcFace embedding, gallery search at several sizes and
+BYTETracker.update at several track counts. Runs offline on synthetic frames
+or a directory of recorded frames, and writes machine-readable results so
+runs can be compared across commits:
+
+    python benchmarks/bench_suite.py --output before.json
+    python benchmarks/bench_suite.py --output after.json --baseline before.json
+
+Cases whose weights or dependencies are missing are recorded as skipped.
+ArcFace falls back to random weights, which does not change its speed.
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FACE_DIR = os.path.join(ROOT_DIR, "face-recognition-master")
+sys.path.insert(0, FACE_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from bench_tracker import IMG_H, IMG_W, TRACKER_ARGS, simulate  # noqa: E402
+
+IMAGE_EXTENSIONS = ("png", "jpg", "jpeg", "bmp")
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    """The detectors load their weights from paths relative to their project."""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def load_frames(path, count, shape=(480, 640)):
+    """Recorded BGR frames from `path`, or synthetic ones when no path is given."""
+    if path:
+        files = sorted(f for f in glob.glob(os.path.join(path, "*")) if f.lower().endswith(IMAGE_EXTENSIONS))
+        frames = [cv2.imread(f) for f in files[:count]]
+        frames = [f for f in frames if f is not None]
+        if not frames:
+            raise SystemExit(f"No images found in {path}")
+        return frames
+    rng = np.random.default_rng(0)
+    # Smooth noise, so resizing and JPEG-like statistics are closer to camera frames
+    frames = []
+    for _ in range(count):
+        small = rng.integers(0, 256, (shape[0] // 8, shape[1] // 8, 3), dtype=np.uint8)
+        frames.append(cv2.resize(small, (shape[1], shape[0]), interpolation=cv2.INTER_LINEAR))
+    return frames
+
+
+def measure(fn, warmup, iters, items=1):
+    """
+    Time `fn` after `warmup` untimed calls.
+
+    Returns:
+        dict: Latency percentiles in ms per call and throughput in items/s.
+    """
+    for _ in range(warmup):
+        fn()
+    times = np.empty(iters)
+    for i in range(iters):
+        start = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - start
+    return {
+        "iters": iters,
+        "p50_ms": 1e3 * float(np.percentile(times, 50)),
+        "p99_ms": 1e3 * float(np.percentile(times, 99)),
+        "mean_ms": 1e3 * float(times.mean()),
+        "throughput": items * iters / float(times.sum()),
+    }
+
+
+def cycle(frames):
+    index = [0]
+
+    def next_frame():
+        frame = frames[index[0] % len(frames)]
+        index[0] += 1
+        return frame
+
+    return next_frame
+
+
+# Every benchmark yields (case, params, setup) where setup() returns
+# (fn, items per call); setup errors mark the case as skipped.
+
+
+def bench_crowd(opt, frames):
+    def setup():
+        with working_directory(ROOT_DIR):
+            from crowd_detector import YOLOv11CrowdDetector
+
+            detector = YOLOv11CrowdDetector()
+        next_frame = cycle(frames)
+        return lambda: detector.detect(next_frame()), 1
+
+    yield "crowd", {"model": "YOLOv11CrowdDetector"}, setup
+
+
+def bench_fatigue(opt, frames):
+    def setup():
+        with working_directory(ROOT_DIR):
+            from fatigue_detector import YOLOv11FatigueDetector
+
+            detector = YOLOv11FatigueDetector()
+        next_frame = cycle(frames)
+        return lambda: detector.detect(next_frame()), 1
+
+    yield "fatigue", {"model": "YOLOv11FatigueDetector"}, setup
+
+
+def bench_scrfd(opt, frames):
+    def setup():
+        from face_detection.scrfd.detector import SCRFD
+
+        model_file = os.path.join(FACE_DIR, "face_detection/scrfd/weights/scrfd_2.5g_bnkps.onnx")
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(model_file)
+        detector = SCRFD(model_file=model_file)
+        next_frame = cycle(frames)
+        return lambda: detector.detect(next_frame()), 1
+
+    yield "scrfd", {"model": "scrfd_2.5g_bnkps", "input_size": [128, 128]}, setup
+
+
+def bench_yolov5_face(opt, frames):
+    def setup():
+        from face_detection.yolov5_face.detector import Yolov5Face
+
+        model_file = os.path.join(FACE_DIR, "face_detection/yolov5_face/weights/yolov5n-face.pt")
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(model_file)
+        detector = Yolov5Face(model_file=model_file)
+        next_frame = cycle(frames)
+        return lambda: detector.detect(next_frame()), 1
+
+    yield "yolov5_face", {"model": "yolov5n-face"}, setup
+
+
+def bench_arcface(opt, frames):
+    import torch
+
+    from face_recognition.arcface.model import iresnet100, iresnet_inference
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    path = os.path.join(FACE_DIR, "face_recognition/arcface/weights/arcface_r100.pth")
+    weights = "arcface_r100" if os.path.exists(path) else "random"
+
+    for batch in (1, 8, 32):
+
+        def setup(batch=batch):
+            if weights == "random":
+                model = iresnet100().to(device).eval()
+            else:
+                model = iresnet_inference(model_name="r100", path=path, device=device)
+            faces = torch.rand(batch, 3, 112, 112, device=device).sub_(0.5).mul_(2.0)
+
+            @torch.no_grad()
+            def embed():
+                model(faces)
+                if device.type == "cuda":
+                    torch.cuda.synchronize()
+
+            return embed, batch
+
+        yield f"arcface_b{batch}", {"model": "r100", "batch": batch, "weights": weights, "device": str(device)}, setup
+
+
+def bench_gallery(opt, frames):
+    from face_recognition.arcface.gallery import Gallery
+
+    for size in (1_000, 10_000, 100_000):
+        for storage in ("float32", "int8"):
+
+            def setup(size=size, storage=storage):
+                rng = np.random.default_rng(0)
+                embs = rng.normal(size=(size, 512)).astype(np.float32)
+                embs /= np.linalg.norm(embs, axis=1, keepdims=True)
+                gallery = Gallery(np.arange(size).astype(str), embs, storage=storage, rerank=10)
+                queries = embs[rng.integers(0, size, 64)] + rng.normal(0, 0.05, (64, 512)).astype(np.float32)
+                next_query = cycle(list(queries / np.linalg.norm(queries, axis=1, keepdims=True)))
+                return lambda: gallery.search(next_query()), 1
+
+            yield f"gallery_{storage}_{size}", {"size": size, "storage": storage, "rerank": 10}, setup
+
+
+def bench_tracker(opt, frames):
+    from face_tracking.tracker import BYTETracker
+
+    for n in (10, 100, 500):
+
+        def setup(n=n):
+            tracker = BYTETracker(args=dict(TRACKER_ARGS), frame_rate=30)
+            dets = simulate(np.random.default_rng(0), n, opt.warmup + opt.iters)
+            return lambda: tracker.update(next(dets), [IMG_H, IMG_W], (IMG_H, IMG_W)), 1
+
+        yield f"tracker_{n}", {"faces": n}, setup
+
+
+BENCHMARKS = {
+    "crowd": bench_crowd,
+    "fatigue": bench_fatigue,
+    "scrfd": bench_scrfd,
+    "yolov5_face": bench_yolov5_face,
+    "arcface": bench_arcface,
+    "gallery": bench_gallery,
+    "tracker": bench_tracker,
+}
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run(opt):
+    frames = load_frames(opt.frames, opt.num_frames)
+    results = []
+    for group in opt.only:
+        try:
+            cases = list(BENCHMARKS[group](opt, frames))
+        except ImportError as e:
+            results.append({"case": group, "group": group, "skipped": f"{type(e).__name__}: {e}"})
+            continue
+        for case, params, setup in cases:
+            result = {"case": case, "group": group, "params": params}
+            try:
+                fn, items = setup()
+            except (ImportError, OSError, RuntimeError) as e:
+                result["skipped"] = f"{type(e).__name__}: {e}"
+            else:
+                result.update(measure(fn, opt.warmup, opt.iters, items))
+            results.append(result)
+            print_result(result)
+    return {"environment": environment(), "frames": opt.frames or "synthetic", "results": results}
+
+
+def print_result(result):
+    if "skipped" in result:
+        print(f"{result['case']:<24} skipped ({result['skipped']})")
+    else:
+        print(
+            f"{result['case']:<24} p50 {result['p50_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms"
+            f"  {result['throughput']:>10.1f} items/s"
+        )
+
+
+def compare(report, baseline):
+    """Print the p50 and throughput change of every case measured in both runs."""
+    before = {r["case"]: r for r in baseline["results"] if "skipped" not in r}
+    print(f"\nAgainst {baseline['environment'].get('commit') or 'baseline'}:")
+    for result in report["results"]:
+        base = before.get(result["case"])
+        if base is None or "skipped" in result:
+            continue
+        print(
+            f"{result['case']:<24} p50 {result['p50_ms'] / base['p50_ms']:>6.2f}x"
+            f"  throughput {result['throughput'] / base['throughput']:>6.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the serving models.")
+    parser.add_argument(
+        "--only",
+        type=lambda s: s.split(","),
+        default=list(BENCHMARKS),
+        help=f"Comma-separated benchmarks to run (default: {','.join(BENCHMARKS)}).",
+    )
+    parser.add_argument("--frames", type=str, default=None, help="Directory of recorded frames (default: synthetic).")
+    parser.add_argument("--num-frames", type=int, default=32, help="Frames cycled through by the detectors.")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed calls before measuring.")
+    parser.add_argument("--iters", type=int, default=50, help="Timed calls per case.")
+    parser.add_argument("--output", type=str, default=None, help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON results of an earlier run to compare with.")
+    opt = parser.parse_args()
+
+    unknown = set(opt.only) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    report = run(opt)
+    if opt.output:
+        with open(opt.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if opt.baseline:
+        with open(opt.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Micro-benchmark for BYTETracker.update.
+
+Simulates a crowd of 10, 100 and 500 faces moving at constant speed with
+noisy, occasionally missing detections, and reports the median time of one
+tracker update per frame.
+
+    python benchmarks/bench_tracker.py [--frames 100] [--gate-motion]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+FACE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "face-recognition-master")
+sys.path.insert(0, FACE_DIR)
+
+from face_tracking.tracker.byte_tracker import BYTETracker  # noqa: E402
+
+TRACKER_ARGS = {
+    "match_thresh": 0.8,
+    "track_buffer": 30,
+    "track_thresh": 0.5,
+    "aspect_ratio_thresh": 1.6,
+    "min_box_area": 10,
+}
+IMG_H, IMG_W = 2160, 3840
+
+
+def simulate(rng, n, frames):
+    """Per-frame (N, 5) detections of `n` moving faces, ~10% missed per frame."""
+    pos = rng.uniform([0, 0], [IMG_W - 100, IMG_H - 100], (n, 2))
+    vel = rng.normal(0, 3, (n, 2))
+    size = rng.uniform(30, 90, n)
+    for _ in range(frames):
+        pos += vel
+        seen = rng.random(n) > 0.1
+        xy = pos[seen] + rng.normal(0, 1.5, (seen.sum(), 2))
+        w = size[seen] * rng.uniform(0.95, 1.05, seen.sum())
+        dets = np.column_stack([xy, xy[:, 0] + w, xy[:, 1] + 1.2 * w, rng.uniform(0.3, 1.0, seen.sum())])
+        yield dets.astype(np.float32)
+
+
+def bench(n, frames, gate_motion=False):
+    rng = np.random.default_rng(0)
+    tracker = BYTETracker(args=dict(TRACKER_ARGS, gate_motion=gate_motion), frame_rate=30)
+    times = []
+    for dets in simulate(rng, n, frames):
+        start = time.perf_counter()
+        tracker.update(dets, [IMG_H, IMG_W], (IMG_H, IMG_W))
+        times.append(time.perf_counter() - start)
+    # Skip the first frames while tracks are still being confirmed
+    return 1e3 * np.median(times[5:])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=100, help="Frames simulated per crowd size.")
+    parser.add_argument("--gate-motion", action="store_true", help="Gate associations with the Kalman filter.")
+    opt = parser.parse_args()
+
+    print(f"{'faces':>6} {'update (median ms)':>20}")
+    for n in (10, 100, 500):
+        print(f"{n:>6} {bench(n, opt.frames, opt.gate_motion):>20.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Minimal in-process MQTT 3.1.1 broker for load tests.
+
+Stands in for Mosquitto when load-testing the MQTT paths: it accepts
+CONNECT, SUBSCRIBE/UNSUBSCRIBE (with `+` and `#` filters), PUBLISH at QoS
+0-2 and PINGREQ, and forwards every message to the matching subscribers at
+QoS 0. There is no authentication, retained messages, wills or session
+state; it is not meant for production.
+
+    python benchmarks/mqtt_broker.py --port 1883
+"""
+import argparse
+import asyncio
+import logging
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+def encode_length(length):
+    out = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        out.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(out)
+
+
+def packet(kind, body, flags=0):
+    return bytes([kind << 4 | flags]) + encode_length(len(body)) + body
+
+
+def encode_string(text):
+    data = text.encode("utf-8")
+    return struct.pack("!H", len(data)) + data
+
+
+def topic_matches(pattern, topic):
+    """MQTT filter matching with single-level `+` and multi-level `#` wildcards."""
+    pattern_levels = pattern.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(pattern_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels) or (level != "+" and level != topic_levels[i]):
+            return False
+    return len(pattern_levels) == len(topic_levels)
+
+
+class _Session:
+    def __init__(self, writer):
+        self.writer = writer
+        self.filters = set()
+
+
+class MiniBroker:
+    """Broker running on its own event loop thread; `start()` returns once it listens."""
+
+    def __init__(self, host="127.0.0.1", port=1883):
+        self.host = host
+        self.port = port
+        self.sessions = set()
+        self.messages = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mqtt-broker", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._serve, self.host, self.port))
+        # Report the real port when started with port 0
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            for session in list(self.sessions):
+                session.writer.close()
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    async def _read_packet(self, reader):
+        header = (await reader.readexactly(1))[0]
+        length, shift = 0, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return header >> 4, header & 0x0F, await reader.readexactly(length)
+
+    async def _serve(self, reader, writer):
+        session = _Session(writer)
+        self.sessions.add(session)
+        try:
+            while True:
+                kind, flags, body = await self._read_packet(reader)
+                if kind == CONNECT:
+                    writer.write(packet(CONNACK, b"\x00\x00"))
+                elif kind == PUBLISH:
+                    self._publish(writer, flags, body)
+                elif kind == PUBREL:
+                    writer.write(packet(PUBCOMP, body[:2]))
+                elif kind == SUBSCRIBE:
+                    writer.write(packet(SUBACK, body[:2] + bytes(self._subscribe(session, body[2:]))))
+                elif kind == UNSUBSCRIBE:
+                    self._unsubscribe(session, body[2:])
+                    writer.write(packet(UNSUBACK, body[:2]))
+                elif kind == PINGREQ:
+                    writer.write(packet(PINGRESP, b""))
+                elif kind == DISCONNECT:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+
+    def _publish(self, writer, flags, body):
+        qos = (flags >> 1) & 0x03
+        (topic_length,) = struct.unpack("!H", body[:2])
+        topic = body[2 : 2 + topic_length].decode("utf-8")
+        offset = 2 + topic_length
+        if qos:
+            packet_id = body[offset : offset + 2]
+            offset += 2
+            writer.write(packet(PUBACK if qos == 1 else PUBREC, packet_id))
+
+        # Encoded once and written to every subscriber at QoS 0
+        self.messages += 1
+        outgoing = packet(PUBLISH, body[:2 + topic_length] + body[offset:])
+        for session in self.sessions:
+            if any(topic_matches(f, topic) for f in session.filters):
+                session.writer.write(outgoing)
+
+    def _subscribe(self, session, body):
+        granted = []
+        while body:
+            (length,) = struct.unpack("!H", body[:2])
+            session.filters.add(body[2 : 2 + length].decode("utf-8"))
+            body = body[3 + length :]  # filter plus its requested QoS byte
+            granted.append(0)
+        return granted
+
+    def _unsubscribe(self, session, body):
+        while body:
+            (length,) = struct.unpack("!H", body[:2])
+            session.filters.discard(body[2 : 2 + length].decode("utf-8"))
+            body = body[2 + length :]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimal MQTT broker for load tests.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    opt = parser.parse_args()
+
+    broker = MiniBroker(opt.host, opt.port).start()
+    print(f"MQTT broker stand-in listening on {opt.host}:{broker.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        broker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+MQTT load generator for the frame topics of the Flask apps.
+
+Publishes frames from N simulated cameras at a fixed rate to
+`mqtt-crowd-frame`/`mqtt-fatigue-frame` and measures the end-to-end latency
+of the results by correlating their `id` field. Each rate in `--rate` runs
+for `--duration` seconds, so a ramp shows where the service saturates:
+
+    python benchmarks/mqtt_loadgen.py --cameras 4 --rate 1,2,5,10 --duration 20
+
+Payload formats:
+    base64   {"id", "camera", "frame": "<base64 JPEG>"}  (what the clients send)
+    datauri  the same with a "data:image/jpeg;base64," prefix
+    raw      the JPEG bytes themselves; results are matched in FIFO order
+
+Results carrying the `id` are matched on the result topic (`--reply field`,
+app4.py) or on `<result topic>-<id>` (`--reply suffix`, app-5.py). With
+`--routed` every camera publishes schema version 1 messages (with `seq` and
+`ts`) to its own `<task>/<camera>/frame` topic and results are read from
+`<task>/<camera>/result`, see mqtt_protocol.py.
+`--broker` runs the in-process broker stand-in on `--port`; `--echo` adds a
+responder that answers every frame immediately, to measure the overhead of
+the broker and this tool alone.
+
+A step is marked saturated when fewer than 95% of its frames got a result
+within `--drain` seconds after the step.
+"""
+import argparse
+import base64
+import glob
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+import paho.mqtt.client as paho
+
+from mqtt_broker import MiniBroker
+
+TASK_TOPICS = {
+    "crowd": ("mqtt-crowd-frame", "mqtt-crowd-result"),
+    "fatigue": ("mqtt-fatigue-frame", "mqtt-fatigue-result"),
+}
+IMAGE_EXTENSIONS = ("png", "jpg", "jpeg", "bmp")
+SATURATION_RATIO = 0.95
+
+
+def new_client(client_id=""):
+    if hasattr(paho, "CallbackAPIVersion"):
+        return paho.Client(paho.CallbackAPIVersion.VERSION1, client_id=client_id)
+    return paho.Client(client_id=client_id)
+
+
+def load_jpegs(path, count, width, height, quality):
+    """JPEG-encoded frames from a directory, or synthetic ones."""
+    if path:
+        files = sorted(f for f in glob.glob(os.path.join(path, "*")) if f.lower().endswith(IMAGE_EXTENSIONS))
+        frames = [cv2.imread(f) for f in files[:count]]
+    else:
+        rng = np.random.default_rng(0)
+        frames = [
+            cv2.resize(rng.integers(0, 256, (height // 8, width // 8, 3), dtype=np.uint8), (width, height))
+            for _ in range(count)
+        ]
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    return [cv2.imencode(".jpg", f, params)[1].tobytes() for f in frames if f is not None]
+
+
+class PayloadFactory:
+    """Builds payloads around frames encoded once up front; only the id changes per message."""
+
+    def __init__(self, jpegs, fmt):
+        self.fmt = fmt
+        self.jpegs = jpegs
+        prefix = "data:image/jpeg;base64," if fmt == "datauri" else ""
+        self.encoded = [json.dumps(prefix + base64.b64encode(j).decode("ascii")) for j in jpegs]
+
+    def build(self, index, message_id, camera, routed=False):
+        if self.fmt == "raw":
+            return self.jpegs[index % len(self.jpegs)]
+        frame = self.encoded[index % len(self.encoded)]
+        if routed:
+            return (
+                f'{{"v": 1, "camera": "{camera}", "seq": {index}, "ts": {time.time()}, '
+                f'"id": "{message_id}", "frame": {frame}}}'
+            )
+        return f'{{"id": "{message_id}", "camera": "{camera}", "frame": {frame}}}'
+
+
+class LatencyRecorder:
+    """Matches results to sent frames by id, or in FIFO order when results carry no id."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = {}
+        self.fifo = {}
+        self.latencies = []
+        self.unmatched = 0
+
+    def reset(self):
+        with self.lock:
+            self.sent.clear()
+            self.fifo.clear()
+            self.latencies = []
+            self.unmatched = 0
+
+    def on_sent(self, result_topic, message_id):
+        now = time.perf_counter()
+        with self.lock:
+            self.sent[result_topic, message_id] = now
+            self.fifo.setdefault(result_topic, deque()).append(message_id)
+
+    def on_result(self, result_topic, payload):
+        now = time.perf_counter()
+        message_id = None
+        try:
+            message_id = json.loads(payload).get("id")
+        except (ValueError, AttributeError):
+            pass
+        with self.lock:
+            if message_id is None:
+                pending = self.fifo.get(result_topic)
+                # Skip ids that were already matched by id
+                while pending and (result_topic, pending[0]) not in self.sent:
+                    pending.popleft()
+                message_id = pending.popleft() if pending else None
+            sent = self.sent.pop((result_topic, str(message_id)), None) if message_id is not None else None
+            if sent is None:
+                self.unmatched += 1
+            else:
+                self.latencies.append(now - sent)
+
+
+def camera_topics(opt, tasks, camera):
+    """(frame topic, result topic) pairs one camera publishes to."""
+    if opt.routed:
+        return [(f"{task}/cam{camera}/frame", f"{task}/cam{camera}/result") for task in tasks]
+    return [TASK_TOPICS[task] for task in tasks]
+
+
+def start_echo(host, port, topics, reply):
+    """Responder answering every frame at once, standing in for the service."""
+    client = new_client("loadgen-echo")
+    frame_to_result = {frame: result for frame, result in topics}
+
+    def on_connect(c, userdata, flags, rc):
+        c.subscribe([(frame, 0) for frame in frame_to_result])
+
+    def on_message(c, userdata, message):
+        result_topic = frame_to_result[message.topic]
+        try:
+            message_id = json.loads(message.payload).get("id")
+        except ValueError:
+            message_id = None
+        result = json.dumps({"status": "success", "id": message_id})
+        if reply == "suffix" and message_id is not None:
+            result_topic = f"{result_topic}-{message_id}"
+        c.publish(result_topic, result)
+
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(host, port)
+    client.loop_start()
+    return client
+
+
+def run_step(opt, client, recorder, factory, tasks, rate):
+    """Publish at `rate` frames/s per camera for `opt.duration` seconds."""
+    recorder.reset()
+    stop = threading.Event()
+    counts = [0] * opt.cameras
+
+    def camera_loop(camera):
+        topics = camera_topics(opt, tasks, camera)
+        interval = 1.0 / rate
+        next_time = time.perf_counter() + camera * interval / opt.cameras
+        for n in itertools.count():
+            if stop.is_set():
+                return
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_time += interval
+            for frame_topic, result_topic in topics:
+                message_id = f"{camera}-{rate}-{n}"
+                if opt.reply == "suffix":
+                    client.subscribe(f"{result_topic}-{message_id}")
+                    result_topic = f"{result_topic}-{message_id}"
+                recorder.on_sent(result_topic, message_id)
+                payload = factory.build(n, message_id, f"cam{camera}", opt.routed)
+                client.publish(frame_topic, payload, qos=opt.qos)
+                counts[camera] += 1
+
+    threads = [threading.Thread(target=camera_loop, args=(c,), daemon=True) for c in range(opt.cameras)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(opt.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    # Results still in flight after the step get a grace period
+    time.sleep(opt.drain)
+
+    with recorder.lock:
+        latencies = np.array(recorder.latencies)
+        unmatched = recorder.unmatched
+    sent = sum(counts)
+    received = len(latencies)
+    step = {
+        "rate_per_camera": rate,
+        "cameras": opt.cameras,
+        "sent": sent,
+        "received": received,
+        "lost": sent - received,
+        "unmatched": unmatched,
+        "offered_fps": sent / elapsed,
+        "completed_fps": received / elapsed,
+    }
+    if received:
+        step.update(
+            p50_ms=1e3 * float(np.percentile(latencies, 50)),
+            p90_ms=1e3 * float(np.percentile(latencies, 90)),
+            p99_ms=1e3 * float(np.percentile(latencies, 99)),
+            max_ms=1e3 * float(latencies.max()),
+        )
+    # Saturated once results stop keeping up with the offered load
+    step["saturated"] = received < SATURATION_RATIO * sent
+    return step
+
+
+def print_step(step):
+    latency = (
+        f"p50 {step['p50_ms']:8.1f}  p99 {step['p99_ms']:8.1f}  max {step['max_ms']:8.1f} ms"
+        if step["received"]
+        else "no results"
+    )
+    print(
+        f"{step['rate_per_camera']:>6g}/s x{step['cameras']:<3} offered {step['offered_fps']:7.1f} fps"
+        f"  completed {step['completed_fps']:7.1f} fps  lost {step['lost']:5d}  {latency}"
+        + ("  SATURATED" if step["saturated"] else "")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT load generator for the frame topics.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="MQTT broker host.")
+    parser.add_argument("--port", type=int, default=1883, help="MQTT broker port.")
+    parser.add_argument("--broker", action="store_true", help="Run the in-process broker stand-in on --port.")
+    parser.add_argument("--echo", action="store_true", help="Answer frames in-process instead of a real service.")
+    parser.add_argument("--task", choices=["crowd", "fatigue", "both"], default="crowd")
+    parser.add_argument("--cameras", type=int, default=1, help="Simulated cameras publishing in parallel.")
+    parser.add_argument(
+        "--rate", type=lambda s: [float(r) for r in s.split(",")], default=[1.0],
+        help="Frames per second per camera; a comma-separated list runs a ramp.",
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per rate step.")
+    parser.add_argument("--drain", type=float, default=2.0, help="Seconds to wait for late results after a step.")
+    parser.add_argument("--format", choices=["base64", "datauri", "raw"], default="base64", help="Frame payload format.")
+    parser.add_argument("--reply", choices=["field", "suffix"], default="field", help="How results carry the id.")
+    parser.add_argument("--routed", action="store_true", help="Publish to per-camera <task>/<camera>/frame topics.")
+    parser.add_argument("--qos", type=int, choices=[0, 1, 2], default=0, help="QoS of the published frames.")
+    parser.add_argument("--frames", type=str, default=None, help="Directory of frames to send (default: synthetic).")
+    parser.add_argument("--width", type=int, default=640, help="Width of synthetic frames.")
+    parser.add_argument("--height", type=int, default=480, help="Height of synthetic frames.")
+    parser.add_argument("--quality", type=int, default=80, help="JPEG quality.")
+    parser.add_argument("--output", type=str, default=None, help="Write the results as JSON to this file.")
+    opt = parser.parse_args()
+
+    broker = MiniBroker(opt.host, opt.port).start() if opt.broker else None
+    tasks = list(TASK_TOPICS) if opt.task == "both" else [opt.task]
+    topics = list(dict.fromkeys(pair for camera in range(opt.cameras) for pair in camera_topics(opt, tasks, camera)))
+    echo = start_echo(opt.host, opt.port, topics, opt.reply) if opt.echo else None
+
+    factory = PayloadFactory(load_jpegs(opt.frames, 16, opt.width, opt.height, opt.quality), opt.format)
+    recorder = LatencyRecorder()
+
+    client = new_client("loadgen")
+    connected = threading.Event()
+    client.on_connect = lambda c, userdata, flags, rc: connected.set()
+    client.on_message = lambda c, userdata, message: recorder.on_result(message.topic, message.payload)
+    client.max_queued_messages_set(0)
+    client.connect(opt.host, opt.port)
+    client.loop_start()
+    connected.wait(5)
+    if opt.reply == "field":
+        client.subscribe([(result, 0) for _, result in topics])
+    time.sleep(0.5)
+
+    size = len(factory.build(0, "0-0-0", "cam0"))
+    print(f"Publishing {opt.format} frames of ~{size / 1024:.0f} KB to {', '.join(f for f, _ in topics[:4])}")
+    steps = []
+    try:
+        for rate in opt.rate:
+            step = run_step(opt, client, recorder, factory, tasks, rate)
+            print_step(step)
+            steps.append(step)
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        if echo is not None:
+            echo.loop_stop()
+            echo.disconnect()
+        if broker is not None:
+            broker.stop()
+
+    saturated = next((s for s in steps if s["saturated"]), None)
+    if saturated is not None:
+        print(f"Saturated at {saturated['offered_fps']:.1f} offered fps ({saturated['rate_per_camera']:g}/s per camera)")
+
+    if opt.output:
+        report = {
+            "config": {k: v for k, v in vars(opt).items() if k != "output"},
+            "steps": steps,
+            "saturation_fps": saturated["offered_fps"] if saturated else None,
+        }
+        with open(opt.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
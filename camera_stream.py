@@ -0,0 +1,280 @@
+import glob
+import logging
+import os
+import threading
+import time
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ("png", "jpg", "jpeg", "bmp")
+
+
+class ImageFolderCapture:
+    """
+    `cv2.VideoCapture` stand-in that plays the images of a directory in file
+    name order, used to run the camera pipelines without cameras (e.g. in tests).
+    """
+
+    def __init__(self, path, fps=30.0, loop=False):
+        self.files = sorted(
+            f for f in glob.glob(os.path.join(path, "*")) if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        self.fps = fps
+        self.loop = loop
+        self.position = 0
+        self._current = None
+
+    def isOpened(self):
+        return len(self.files) > 0
+
+    def grab(self):
+        if self.position >= len(self.files):
+            if not self.loop or not self.files:
+                return False
+            self.position = 0
+        self._current = self.files[self.position]
+        self.position += 1
+        return True
+
+    def retrieve(self):
+        frame = cv2.imread(self._current) if self._current is not None else None
+        return frame is not None, frame
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        return 0.0
+
+    def release(self):
+        self.files = []
+
+
+def is_live(source):
+    """Cameras and network streams are live; files and image directories are recorded."""
+    source = str(source)
+    return source.isdigit() or "://" in source
+
+
+def open_capture(source, loop=False):
+    """
+    Open a frame source.
+
+    Args:
+        source (int or str): Device index, video file, RTSP/HTTP URL, or a
+            directory of images ("dir:<path>" or an existing directory).
+        loop (bool): Replay an image directory when it ends.
+
+    Returns:
+        A `cv2.VideoCapture` or an `ImageFolderCapture`.
+    """
+    source = str(source)
+    if source.isdigit():
+        return cv2.VideoCapture(int(source))
+    if source.startswith("dir:") or os.path.isdir(source):
+        path = source[len("dir:") :] if source.startswith("dir:") else source
+        return ImageFolderCapture(path, loop=loop)
+    return cv2.VideoCapture(source)
+
+
+class LatestSlot:
+    """
+    Single-value slot tagged with a sequence number, read by any number of
+    consumers.
+
+    Every `publish` replaces the value. Consumers pass the last sequence
+    number they saw to `read` and get the newest value after it, so a slow
+    consumer skips values instead of queueing them and consumers never take
+    values away from each other.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._timestamp = None
+        self._value = None
+        self._closed = False
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def seq(self):
+        """Sequence number of the newest value (0 before the first one)."""
+        return self._seq
+
+    def publish(self, value, timestamp=None):
+        with self._cond:
+            self._seq += 1
+            self._timestamp = time.time() if timestamp is None else timestamp
+            self._value = value
+            self._cond.notify_all()
+
+    def read(self, last_seq=0, timeout=None):
+        """
+        Wait for a value newer than `last_seq`.
+
+        Args:
+            last_seq (int): Sequence number of the last value the caller got.
+            timeout (float, optional): Maximum time to wait in seconds.
+
+        Returns:
+            tuple or None: (seq, timestamp, value), or None on timeout or once
+            the slot is closed and the caller has seen its last value.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > last_seq or self._closed, timeout)
+            if self._seq > last_seq:
+                return self._seq, self._timestamp, self._value
+            return None
+
+    def values(self, timeout=None):
+        """Yield (seq, timestamp, value) for every value this consumer gets to see."""
+        last_seq = 0
+        while True:
+            item = self.read(last_seq, timeout)
+            if item is None:
+                if self._closed:
+                    return
+                continue
+            last_seq = item[0]
+            yield item
+
+    def close(self):
+        """Wake up every waiting consumer; they still get the last value."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class CameraStream:
+    """
+    One capture per camera, read by a background grabber thread and shared by
+    any number of consumers.
+
+    The grabber keeps only the newest frame in a slot tagged with a sequence
+    number. Consumers pass the last sequence number they saw to `read` and get
+    the newest frame after it, so a slow consumer skips frames instead of
+    queueing them, inference never waits on camera I/O, and consumers never
+    take frames away from each other. All consumers receive the same array:
+    frames must be treated as read-only (annotate a copy).
+
+    With `decimation=n` only every n-th frame is decoded (the others are only
+    grabbed, which keeps the device buffer drained). Live sources are reopened
+    after a failure; recorded ones are played at their own frame rate and end
+    the stream (or restart with `loop=True`).
+    """
+
+    def __init__(self, source, name=None, decimation=1, loop=False, reconnect_delay=2.0, on_frame=None):
+        """
+        Args:
+            source (int or str): See `open_capture`.
+            name (str, optional): Name used in log messages.
+            decimation (int): Decode and publish every n-th frame.
+            loop (bool): Restart recorded sources when they end.
+            reconnect_delay (float): Seconds to wait before reopening a live source.
+            on_frame (callable, optional): Called from the grabber thread after
+                every published frame.
+        """
+        self.source = source
+        self.name = name if name is not None else str(source)
+        self.decimation = max(1, int(decimation))
+        self.loop = loop
+        self.live = is_live(source)
+        self.reconnect_delay = reconnect_delay
+        self.on_frame = on_frame
+
+        self._slot = LatestSlot()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.frames_grabbed = 0
+        self.reconnects = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._grab_loop, name=f"camera-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop the grabber and wake up every waiting consumer."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._close()
+
+    @property
+    def closed(self):
+        return self._slot.closed
+
+    @property
+    def seq(self):
+        """Sequence number of the newest frame (0 before the first one)."""
+        return self._slot.seq
+
+    def read(self, last_seq=0, timeout=None):
+        """
+        Wait for a frame newer than `last_seq`.
+
+        Returns:
+            tuple or None: (seq, timestamp, frame), see `LatestSlot.read`.
+        """
+        return self._slot.read(last_seq, timeout)
+
+    def frames(self, timeout=None):
+        """Yield (seq, timestamp, frame) for every frame this consumer gets to see."""
+        return self._slot.values(timeout)
+
+    def _publish(self, frame):
+        self._slot.publish(frame)
+        if self.on_frame is not None:
+            self.on_frame(self)
+
+    def _close(self):
+        self._slot.close()
+        if self.on_frame is not None:
+            self.on_frame(self)
+
+    def _grab_loop(self):
+        while not self._stop.is_set():
+            cap = open_capture(self.source, loop=self.loop)
+            if not cap.isOpened():
+                logger.error(f"[{self.name}] Cannot open source {self.source}")
+                if not self.live:
+                    break
+            else:
+                # Recorded sources are played at their own frame rate
+                fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+                interval = 0.0 if self.live else 1.0 / fps
+                next_time = time.monotonic()
+
+                while not self._stop.is_set():
+                    if not cap.grab():
+                        break
+                    self.frames_grabbed += 1
+                    if self.frames_grabbed % self.decimation == 0:
+                        ok, frame = cap.retrieve()
+                        if ok:
+                            self._publish(frame)
+
+                    if interval:
+                        next_time += interval
+                        time.sleep(max(0.0, next_time - time.monotonic()))
+            cap.release()
+
+            if not self.live and not self.loop:
+                break
+            if self.live:
+                self.reconnects += 1
+                logger.warning(f"[{self.name}] Source lost, reconnecting in {self.reconnect_delay}s")
+                self._stop.wait(self.reconnect_delay)
+
+        self._close()
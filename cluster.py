@@ -0,0 +1,201 @@
+"""
+Spreading cameras over several inference workers.
+
+Two ways of splitting the frames of `<task>/+/frame` between the workers of
+a group:
+
+    shared    every worker subscribes to `$share/<group>/<task>/+/frame`
+              and the broker hands each frame to one of them. Suits
+              stateless tasks; consecutive frames of a camera may land on
+              different workers.
+    sharded   every worker subscribes to `<task>/+/frame` and only
+              processes the cameras a consistent hash ring assigns to it,
+              so per-camera state (fatigue timers, trackers) stays on one
+              worker. Frames of other cameras are dropped by topic, before
+              their payload is parsed.
+
+Workers find each other through retained heartbeats on
+`cluster/<group>/workers/<worker>`. The last will of a worker clears its
+heartbeat, so when it dies the others rebuild the ring and take over its
+cameras; a worker whose heartbeats stop without a last will (network
+partition) is dropped after `timeout` seconds. A retained heartbeat older
+than `timeout` when it arrives (left by a worker whose will was never
+delivered) is ignored, which needs the worker clocks to agree to well
+within `timeout`. Adding a worker only moves the cameras the ring assigns
+to it.
+"""
+import bisect
+import hashlib
+import json
+import logging
+import threading
+import time
+import weakref
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_PREFIX = "cluster"
+
+REBALANCES = metrics.REGISTRY.counter(
+    "cluster_rebalances_total", "Changes of the worker set that moved cameras between workers.", ("group",)
+)
+
+# Memberships reported by the worker gauge
+_memberships = weakref.WeakSet()
+
+metrics.REGISTRY.gauge(
+    "cluster_workers", "Workers of the group seen by this worker.", ("group",),
+    callback=lambda: {(m.group,): len(m.ring.nodes) for m in list(_memberships)},
+)
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hashing of keys (camera IDs) onto nodes, with `replicas` virtual nodes per node."""
+
+    def __init__(self, nodes=(), replicas=100):
+        self.replicas = replicas
+        self.nodes = sorted(set(nodes))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._nodes = [n for _, n in points]
+
+    def node_for(self, key):
+        """Node owning `key`, or None for an empty ring."""
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+def _heartbeat_age(payload):
+    """Seconds since a heartbeat was sent, from its `ts`; 0 when it has none."""
+    try:
+        return max(0.0, time.time() - float(json.loads(payload)["ts"]))
+    except (ValueError, TypeError, KeyError):
+        return 0.0
+
+
+def worker_topic(group, worker):
+    """Heartbeat topic of a worker; also the topic of its last will."""
+    return f"{CLUSTER_PREFIX}/{group}/workers/{worker}"
+
+
+def shared_topic(group, topic):
+    """MQTT shared subscription of `topic` for the workers of `group`."""
+    return f"$share/{group}/{topic}"
+
+
+class Membership:
+    """
+    Membership of one worker in a group and the hash ring built from it.
+
+    The caller wires it to its MQTT client: set an empty retained message on
+    `worker_topic(group, worker_id)` as the last will before connecting,
+    subscribe to `subscription` on every connect, call `heartbeat` once
+    connected and pass the messages of the subscription to `handle`.
+    `on_change(ring)` runs whenever workers join or leave.
+    """
+
+    def __init__(self, group, worker_id, publish, heartbeat_interval=5.0, timeout=15.0, on_change=None):
+        """
+        Args:
+            group (str): Name of the worker group.
+            worker_id (str): Unique name of this worker.
+            publish (callable): publish(topic, payload, qos, retain) of the MQTT client.
+            heartbeat_interval (float): Seconds between heartbeats.
+            timeout (float): Seconds without heartbeat after which a worker is dropped.
+            on_change (callable, optional): on_change(ring) after the workers changed.
+        """
+        self.group = group
+        self.worker_id = worker_id
+        self.publish = publish
+        self.heartbeat_interval = heartbeat_interval
+        self.timeout = timeout
+        self.on_change = on_change
+
+        self._seen = {worker_id: time.monotonic()}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.ring = HashRing([worker_id])
+        _memberships.add(self)
+
+    @property
+    def topic(self):
+        return worker_topic(self.group, self.worker_id)
+
+    @property
+    def subscription(self):
+        return worker_topic(self.group, "+")
+
+    def owner(self, camera):
+        return self.ring.node_for(camera)
+
+    def owns(self, camera):
+        return self.ring.node_for(camera) == self.worker_id
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="cluster-heartbeat", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Leave the group; the other workers take over this worker's cameras."""
+        self._stop.set()
+        self.publish(self.topic, "", 1, True)
+
+    def handle(self, topic, payload):
+        """Process a message received on `subscription`."""
+        worker = topic.rsplit("/", 1)[-1]
+        if worker == self.worker_id:
+            return
+        age = _heartbeat_age(payload) if payload else 0.0
+        with self._lock:
+            if payload:
+                changed = worker not in self._seen
+                if changed and age > self.timeout:
+                    logger.debug(f"Ignoring stale heartbeat of worker {worker} ({age:.0f}s old)")
+                    return
+                self._seen[worker] = time.monotonic() - age
+            else:
+                changed = self._seen.pop(worker, None) is not None
+        if changed:
+            logger.info(f"Worker {worker} {'joined' if payload else 'left'} group {self.group}")
+            self._rebuild()
+
+    def heartbeat(self):
+        payload = json.dumps({"worker": self.worker_id, "ts": time.time()})
+        self.publish(self.topic, payload, 1, True)
+
+    def _expire(self):
+        deadline = time.monotonic() - self.timeout
+        with self._lock:
+            self._seen[self.worker_id] = time.monotonic()
+            expired = [w for w, seen in self._seen.items() if seen < deadline]
+            for worker in expired:
+                del self._seen[worker]
+        for worker in expired:
+            logger.warning(f"Worker {worker} of group {self.group} timed out")
+        return bool(expired)
+
+    def _rebuild(self):
+        with self._lock:
+            self.ring = HashRing(self._seen)
+        REBALANCES.inc(group=self.group)
+        if self.on_change is not None:
+            self.on_change(self.ring)
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+                if self._expire():
+                    self._rebuild()
+            except Exception as e:
+                logger.error(f"Cluster heartbeat failed: {e}")
@@ -5,6 +5,8 @@ from ultralytics import YOLO
 from pathlib import Path
 import openvino as ov
 
+import metrics
+
 ZONE_POLYGON = np.array([
     [0, 0],
     [1, 0],
@@ -58,25 +60,19 @@ class YOLOv11CrowdDetector:
             text_scale=2,
         )
 
-    def detect_and_annotate(self, frame):
+    def make_zone(self, width, height, polygon=ZONE_POLYGON):
+        """Zona untuk resolusi satu kamera, dari polygon relatif (0-1)"""
+        return sv.PolygonZone(polygon=(polygon * np.array([width, height])).astype(int))
+
+    def detect(self, frame):
+        """Deteksi tanpa mengubah frame, sehingga aman untuk frame bersama (shared memory)"""
         # Deteksi menggunakan YOLOv11
         result = self.det_model(frame)[0]
-        detections = sv.Detections.from_ultralytics(result).with_nms().with_nmm()
-        detections = detections[detections.confidence > 0.5]
-
-        # Anotasi bounding box dan label
-        labels = [
-            f"{class_name} {confidence: .2f}"
-            for class_name, confidence
-            in zip(detections['class_name'], detections.confidence)
-        ]
+        metrics.observe_inference(result.speed, "crowd", self.device)
 
-        frame = self.box_annotator.annotate(scene=frame, detections=detections)
-        frame = self.label_annotator.annotate(scene=frame, detections=detections, labels=labels)
-
-        # Anotasi zona
-        self.zone.trigger(detections=detections)
-        frame: ndarray = self.zone_annotator.annotate(scene=frame)
+        with metrics.stage("nms", model="crowd"):
+            detections = sv.Detections.from_ultralytics(result).with_nms().with_nmm()
+            detections = detections[detections.confidence > 0.5]
 
         # Ekstrak data bounding box, class, dan confidence untuk setiap deteksi
         detection_data = []
@@ -91,4 +87,24 @@ class YOLOv11CrowdDetector:
                 }
             })
 
+        return detections, detection_data
+
+    def detect_and_annotate(self, frame):
+        detections, detection_data = self.detect(frame)
+
+        with metrics.stage("annotate", model="crowd"):
+            # Anotasi bounding box dan label
+            labels = [
+                f"{class_name} {confidence: .2f}"
+                for class_name, confidence
+                in zip(detections['class_name'], detections.confidence)
+            ]
+
+            frame = self.box_annotator.annotate(scene=frame, detections=detections)
+            frame = self.label_annotator.annotate(scene=frame, detections=detections, labels=labels)
+
+            # Anotasi zona
+            self.zone.trigger(detections=detections)
+            frame: ndarray = self.zone_annotator.annotate(scene=frame)
+
         return frame, detection_data  # Kembalikan frame yang sudah dianotasi beserta data deteksi
\ No newline at end of file
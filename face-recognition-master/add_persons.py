@@ -1,16 +1,19 @@
 import argparse
+import hashlib
 import os
 import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
 import numpy as np
 import torch
-from torchvision import transforms
 
+from face_alignment.alignment import norm_crop_batch
 from face_detection.scrfd.detector import SCRFD
 # from face_detection.yolov5_face.detector import Yolov5Face
 from face_recognition.arcface.model import iresnet_inference
-from face_recognition.arcface.utils import read_features
+from face_recognition.arcface.feature_store import open_store
 
 # Check if CUDA is available and set the device accordingly
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -24,122 +27,212 @@ recognizer = iresnet_inference(
     model_name="r100", path="face_recognition/arcface/weights/arcface_r100.pth", device=device
 )
 
+# Images processed in the current run, kept inside the new persons directory
+CHECKPOINT_FILE = ".enrollment_checkpoint"
+
 
 @torch.no_grad()
-def get_feature(face_image):
+def get_features(face_images):
     """
-    Extract facial features from an image using the face recognition model.
+    Extract facial features from a batch of aligned faces using the face recognition model.
 
     Args:
-        face_image (numpy.ndarray): Input facial image.
+        face_images (numpy.ndarray): Aligned BGR faces of shape (N, 112, 112, 3).
 
     Returns:
-        numpy.ndarray: Extracted facial features.
+        numpy.ndarray: Extracted facial features, one row per face.
     """
-    # Define a series of image preprocessing steps
-    face_preprocess = transforms.Compose(
-        [
-            transforms.ToTensor(),
-            transforms.Resize((112, 112)),
-            transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5]),
-        ]
-    )
-
-    # Convert the image to RGB format
-    face_image = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB)
+    # BGR to RGB, HWC to CHW and scale to [-1, 1] (ToTensor + Normalize(0.5, 0.5))
+    batch = torch.from_numpy(np.ascontiguousarray(face_images[..., ::-1]))
+    batch = batch.permute(0, 3, 1, 2).to(device).float().div_(127.5).sub_(1.0)
 
-    # Apply the defined preprocessing to the image
-    face_image = face_preprocess(face_image).unsqueeze(0).to(device)
-
-    # Use the model to obtain facial features
-    emb_img_face = recognizer(face_image)[0].cpu().numpy()
+    # Use the model to obtain facial features for the whole batch
+    emb_img_faces = recognizer(batch).cpu().numpy()
 
     # Normalize the features
-    images_emb = emb_img_face / np.linalg.norm(emb_img_face)
+    images_emb = emb_img_faces / np.linalg.norm(emb_img_faces, axis=1, keepdims=True)
     return images_emb
 
 
-def add_persons(backup_dir, add_persons_dir, faces_save_dir, features_path):
+def list_images(add_persons_dir):
     """
-    Add a new person to the face recognition database.
+    List the images of every new person.
 
     Args:
-        backup_dir (str): Directory to save backup data.
-        add_persons_dir (str): Directory containing images of the new person.
-        faces_save_dir (str): Directory to save the extracted faces.
-        features_path (str): Path to save face features.
-    """
-    # Initialize lists to store names and features of added images
-    images_name = []
-    images_emb = []
+        add_persons_dir (str): Directory containing one sub-directory per person.
 
-    # Read the folder with images of the new person, extract faces, and save them
-    for name_person in os.listdir(add_persons_dir):
+    Returns:
+        list: (name_person, image_path) tuples.
+    """
+    jobs = []
+    for name_person in sorted(os.listdir(add_persons_dir)):
         person_image_path = os.path.join(add_persons_dir, name_person)
+        if not os.path.isdir(person_image_path):
+            continue
+        for image_name in sorted(os.listdir(person_image_path)):
+            if image_name.endswith(("png", "jpg", "jpeg")):
+                jobs.append((name_person, os.path.join(person_image_path, image_name)))
+    return jobs
 
-        # Create a directory to save the faces of the person
-        person_face_path = os.path.join(faces_save_dir, name_person)
-        os.makedirs(person_face_path, exist_ok=True)
 
-        for image_name in os.listdir(person_image_path):
-            if image_name.endswith(("png", "jpg", "jpeg")):
-                input_image = cv2.imread(os.path.join(person_image_path, image_name))
+def read_checkpoint(checkpoint_path):
+    """Read the hashes of images already processed by an interrupted run."""
+    if not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, "r") as f:
+        return {line.strip() for line in f if line.strip()}
 
-                # Detect faces and landmarks using the face detector
-                bboxes, landmarks = detector.detect(image=input_image)
 
-                # Extract faces
-                for i in range(len(bboxes)):
-                    # Get the number of files in the person's path
-                    number_files = len(os.listdir(person_face_path))
+def load_and_detect(image_path, done):
+    """
+    Read, hash, decode an image and detect its faces (runs in a worker thread).
+
+    Args:
+        image_path (str): Path of the image.
+        done (set): Hashes of images that must not be processed again.
 
-                    # Get the location of the face
-                    x1, y1, x2, y2, score = bboxes[i]
+    Returns:
+        tuple: (digest, image, bboxes, aligned_faces); image is None when the
+        image is already done or cannot be decoded.
+    """
+    with open(image_path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()
+    if digest in done:
+        return digest, None, [], []
+
+    input_image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if input_image is None:
+        return digest, None, [], []
+
+    # Detect faces and landmarks using the face detector
+    bboxes, landmarks = detector.detect(image=input_image)
+    if len(bboxes) == 0:
+        return digest, input_image, [], []
+
+    # Align the faces the same way recognize.py does before embedding
+    aligned_faces = norm_crop_batch(input_image, landmarks)
+    return digest, input_image, bboxes, aligned_faces
+
+
+def add_persons(
+    backup_dir,
+    add_persons_dir,
+    faces_save_dir,
+    features_path,
+    store_dtype="float32",
+    workers=4,
+    batch_size=32,
+):
+    """
+    Add a new person to the face recognition database.
 
-                    # Extract the face from the image
-                    face_image = input_image[y1:y2, x1:x2]
+    Images are decoded, run through the detector and aligned in a thread
+    pool, and the aligned faces are embedded in batches. Every batch is appended to the
+    feature store together with the hash of its source image, so a rerun
+    after a crash, or a later run with the same images, skips them.
 
-                    # Path to save the face
-                    path_save_face = os.path.join(person_face_path, f"{number_files}.jpg")
+    Args:
+        backup_dir (str): Directory to save backup data.
+        add_persons_dir (str): Directory containing images of the new person.
+        faces_save_dir (str): Directory to save the extracted faces.
+        features_path (str): Path to save face features.
+        store_dtype (str): Embedding dtype used when the feature store is created.
+        workers (int): Number of threads decoding images and detecting faces.
+        batch_size (int): Number of faces embedded per forward pass.
+    """
+    store = open_store(features_path, dtype=store_dtype)
+    checkpoint_path = os.path.join(add_persons_dir, CHECKPOINT_FILE)
 
-                    # Save the face to the database
-                    cv2.imwrite(path_save_face, face_image)
+    # Content hashes of images already enrolled or processed by an interrupted run
+    done = store.sources() | read_checkpoint(checkpoint_path)
+    if len(store) > 0:
+        print("Update features!")
 
-                    # Extract features from the face
-                    images_emb.append(get_feature(face_image=face_image))
-                    images_name.append(name_person)
+    # Next file number for every person, counted once instead of once per face
+    face_numbers = {}
+
+    pending_faces = []  # (name_person, digest, face_image, aligned_face)
+    pending_digests = []
+    num_added = 0
+    num_skipped = 0
+
+    def flush():
+        nonlocal num_added
+        if pending_faces:
+            names = [face[0] for face in pending_faces]
+            sources = [face[1] for face in pending_faces]
+            images_emb = get_features(np.stack([face[3] for face in pending_faces]))
+            store.append(names, images_emb, sources=sources)
+            num_added += len(pending_faces)
+
+            for name_person, _, face_image, _ in pending_faces:
+                # Create a directory to save the faces of the person
+                person_face_path = os.path.join(faces_save_dir, name_person)
+                if name_person not in face_numbers:
+                    os.makedirs(person_face_path, exist_ok=True)
+                    face_numbers[name_person] = len(os.listdir(person_face_path))
+
+                # Save the face to the database
+                path_save_face = os.path.join(person_face_path, f"{face_numbers[name_person]}.jpg")
+                face_numbers[name_person] += 1
+                cv2.imwrite(path_save_face, face_image)
+
+        # Checkpoint after the store append so a crash never loses faces
+        with open(checkpoint_path, "a") as f:
+            f.writelines(digest + "\n" for digest in pending_digests)
+
+        pending_faces.clear()
+        pending_digests.clear()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        jobs = iter(list_images(add_persons_dir))
+
+        while True:
+            # Keep a bounded number of decoded images in memory
+            while len(in_flight) < 2 * workers:
+                job = next(jobs, None)
+                if job is None:
+                    break
+                in_flight.append((job[0], pool.submit(load_and_detect, job[1], done)))
+            if not in_flight:
+                break
+
+            name_person, future = in_flight.popleft()
+            digest, input_image, bboxes, aligned_faces = future.result()
+            if digest in done:
+                num_skipped += 1
+                continue
+            done.add(digest)
+
+            # Extract faces
+            for i in range(len(bboxes)):
+                # Get the location of the face
+                x1, y1, x2, y2, score = bboxes[i]
+
+                # Extract the face from the image
+                face_image = input_image[y1:y2, x1:x2]
+                pending_faces.append((name_person, digest, face_image, aligned_faces[i]))
+
+            pending_digests.append(digest)
+            if len(pending_faces) >= batch_size:
+                flush()
+
+    flush()
 
     # Check if no new person is found
-    if images_emb == [] and images_name == []:
+    if num_added == 0 and num_skipped == 0:
         print("No new person found!")
         return None
 
-    # Convert lists to arrays
-    images_emb = np.array(images_emb)
-    images_name = np.array(images_name)
-
-    # Read existing features if available
-    features = read_features(features_path)
-
-    if features is not None:
-        # Unpack existing features
-        old_images_name, old_images_emb = features
-
-        # Combine new features with existing features
-        images_name = np.hstack((old_images_name, images_name))
-        images_emb = np.vstack((old_images_emb, images_emb))
-
-        print("Update features!")
-
-    # Save the combined features
-    np.savez_compressed(features_path, images_name=images_name, images_emb=images_emb)
-
     # Move the data of the new person to the backup data directory
+    os.remove(checkpoint_path)
     for sub_dir in os.listdir(add_persons_dir):
         dir_to_move = os.path.join(add_persons_dir, sub_dir)
         shutil.move(dir_to_move, backup_dir, copy_function=shutil.copytree)
 
-    print("Successfully added new person!")
+    print(f"Successfully added new person! ({num_added} faces added, {num_skipped} images skipped)")
 
 
 if __name__ == "__main__":
@@ -169,6 +262,25 @@ if __name__ == "__main__":
         default="./datasets/face_features/feature",
         help="Path to save face features.",
     )
+    parser.add_argument(
+        "--store-dtype",
+        type=str,
+        default="float32",
+        choices=["float32", "float16"],
+        help="Embedding dtype used when the feature store is created.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of threads decoding images and detecting faces.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=32,
+        help="Number of faces embedded per forward pass.",
+    )
     opt = parser.parse_args()
 
     # Run the main function
@@ -1,6 +1,5 @@
 import cv2
 import numpy as np
-from skimage import transform as trans
 
 # Define a standard set of destination landmarks for ArcFace alignment
 arcface_dst = np.array(
@@ -15,20 +14,16 @@ arcface_dst = np.array(
 )
 
 
-def estimate_norm(lmk, image_size=112, mode="arcface"):
+def _destination(image_size):
     """
-    Estimate the transformation matrix for aligning facial landmarks.
+    Scale the ArcFace destination landmarks to the output image size.
 
     Args:
-        lmk (numpy.ndarray): 2D array of shape (5, 2) representing facial landmarks.
         image_size (int): Desired output image size.
-        mode (str): Alignment mode, currently only "arcface" is supported.
 
     Returns:
-        numpy.ndarray: Transformation matrix (2x3) for aligning facial landmarks.
+        numpy.ndarray: 2D array of shape (5, 2) with the destination landmarks.
     """
-    # Check input conditions
-    assert lmk.shape == (5, 2)
     assert image_size % 112 == 0 or image_size % 128 == 0
 
     # Adjust ratio and x-coordinate difference based on image size
@@ -42,15 +37,99 @@ def estimate_norm(lmk, image_size=112, mode="arcface"):
     # Scale and shift the destination landmarks
     dst = arcface_dst * ratio
     dst[:, 0] += diff_x
+    return dst
+
+
+def estimate_norm_batch(lmks, image_size=112, mode="arcface"):
+    """
+    Estimate the alignment transforms for all faces of a frame at once.
+
+    The least-squares similarity transform (rotation, uniform scale and
+    translation) between two 2D point sets has a closed form: with centered
+    source points (x, y) and destination points (u, v),
+
+        a = sum(x * u + y * v) / sum(x^2 + y^2)
+        b = sum(x * v - y * u) / sum(x^2 + y^2)
+
+    and the transform is [[a, -b, tx], [b, a, ty]]. This is the same solution
+    as Umeyama's method, computed for every face with a few array operations.
 
-    # Estimate the similarity transformation
-    tform = trans.SimilarityTransform()
-    tform.estimate(lmk, dst)
-    M = tform.params[0:2, :]
+    Args:
+        lmks (numpy.ndarray): Array of shape (N, 5, 2) with facial landmarks.
+        image_size (int): Desired output image size.
+        mode (str): Alignment mode, currently only "arcface" is supported.
+
+    Returns:
+        numpy.ndarray: Transformation matrices of shape (N, 2, 3).
+    """
+    lmks = np.asarray(lmks, dtype=np.float64).reshape(-1, 5, 2)
+    dst = _destination(image_size).astype(np.float64)
+
+    # Center both point sets
+    src_mean = lmks.mean(axis=1)
+    dst_mean = dst.mean(axis=0)
+    src = lmks - src_mean[:, None, :]
+    dst = dst - dst_mean
+
+    # Closed-form similarity parameters
+    norm = np.sum(src * src, axis=(1, 2))
+    norm[norm == 0] = 1.0
+    a = (src[:, :, 0] @ dst[:, 0] + src[:, :, 1] @ dst[:, 1]) / norm
+    b = (src[:, :, 0] @ dst[:, 1] - src[:, :, 1] @ dst[:, 0]) / norm
+
+    M = np.empty((len(lmks), 2, 3), dtype=np.float64)
+    M[:, 0, 0] = a
+    M[:, 0, 1] = -b
+    M[:, 1, 0] = b
+    M[:, 1, 1] = a
+    M[:, 0, 2] = dst_mean[0] - (a * src_mean[:, 0] - b * src_mean[:, 1])
+    M[:, 1, 2] = dst_mean[1] - (b * src_mean[:, 0] + a * src_mean[:, 1])
 
     return M
 
 
+def estimate_norm(lmk, image_size=112, mode="arcface"):
+    """
+    Estimate the transformation matrix for aligning facial landmarks.
+
+    Args:
+        lmk (numpy.ndarray): 2D array of shape (5, 2) representing facial landmarks.
+        image_size (int): Desired output image size.
+        mode (str): Alignment mode, currently only "arcface" is supported.
+
+    Returns:
+        numpy.ndarray: Transformation matrix (2x3) for aligning facial landmarks.
+    """
+    # Check input conditions
+    assert lmk.shape == (5, 2)
+
+    return estimate_norm_batch(lmk[None], image_size, mode)[0]
+
+
+def norm_crop_batch(img, landmarks, image_size=112, mode="arcface"):
+    """
+    Align and crop every face of a frame into one contiguous batch.
+
+    Args:
+        img (numpy.ndarray): Input frame.
+        landmarks (numpy.ndarray): Array of shape (N, 5, 2) with facial landmarks.
+        image_size (int): Desired output image size.
+        mode (str): Alignment mode, currently only "arcface" is supported.
+
+    Returns:
+        numpy.ndarray: Aligned faces of shape (N, image_size, image_size, C),
+        ready to be embedded as a single batch.
+    """
+    M = estimate_norm_batch(landmarks, image_size, mode)
+
+    # Warp every face straight into its slot of the output batch
+    batch = np.zeros((len(M), image_size, image_size) + img.shape[2:], dtype=img.dtype)
+    for i in range(len(M)):
+        cv2.warpAffine(img, M[i], (image_size, image_size), dst=batch[i], borderValue=0.0)
+
+    return batch
+
+
 def norm_crop(img, landmark, image_size=112, mode="arcface"):
     """
     Normalize and crop a facial image based on provided landmarks.
@@ -6,7 +6,6 @@ import math
 import os
 import random
 import shutil
-import time
 from itertools import repeat
 from multiprocessing.pool import ThreadPool
 from pathlib import Path
@@ -305,9 +304,10 @@ class LoadWebcam:  # for inference
 
 
 class LoadStreams:  # multiple IP or RTSP cameras
-    def __init__(self, sources="streams.txt", img_size=640):
+    def __init__(self, sources="streams.txt", img_size=640, vid_stride=4):
         self.mode = "stream"
         self.img_size = img_size
+        self.vid_stride = vid_stride  # decode every vid_stride-th frame
 
         if os.path.isfile(sources):
             with open(sources, "r") as f:
@@ -329,7 +329,7 @@ class LoadStreams:  # multiple IP or RTSP cameras
             h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
             fps = cap.get(cv2.CAP_PROP_FPS) % 100
             _, self.imgs[i] = cap.read()  # guarantee first frame
-            thread = Thread(target=self.update, args=([i, cap]), daemon=True)
+            thread = Thread(target=self.update, args=([i, cap, s]), daemon=True)
             print(f" success ({w}x{h} at {fps:.2f} FPS).")
             thread.start()
         print("")  # newline
@@ -346,17 +346,20 @@ class LoadStreams:  # multiple IP or RTSP cameras
                 "WARNING: Different stream shapes detected. For optimal performance supply similarly-shaped streams."
             )
 
-    def update(self, index, cap):
-        # Read next stream frame in a daemon thread
+    def update(self, index, cap, stream):
+        # Read next stream frame in a daemon thread. grab() blocks until the
+        # camera delivers a frame, so no sleep is needed to pace the loop
         n = 0
         while cap.isOpened():
             n += 1
-            # _, self.imgs[index] = cap.read()
-            cap.grab()
-            if n == 4:  # read every 4th frame
-                _, self.imgs[index] = cap.retrieve()
-                n = 0
-            time.sleep(0.01)  # wait time
+            if not cap.grab():
+                print(f"WARNING: Video stream {stream} unresponsive, reconnecting...")
+                cap.open(eval(stream) if stream.isnumeric() else stream)
+                continue
+            if n % self.vid_stride == 0:  # read every vid_stride-th frame
+                success, im = cap.retrieve()
+                if success:
+                    self.imgs[index] = im
 
     def __iter__(self):
         self.count = -1
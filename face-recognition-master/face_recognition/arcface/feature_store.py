@@ -0,0 +1,390 @@
+import json
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "meta.json"
+STORE_VERSION = 1
+SUPPORTED_DTYPES = ("float32", "float16")
+GENERATION_FILE = re.compile(r"^(embeddings\.\d+\.bin|index\.\d+\.jsonl)$")
+
+
+class FeatureStore:
+    """
+    On-disk face gallery: a memory-mapped embedding matrix plus an append-only
+    name index.
+
+    Layout of the store directory:
+
+        meta.json                  dim, dtype and the current generation
+        embeddings.<gen>.bin       raw (rows, dim) matrix, appended in place
+        index.<gen>.jsonl          one line per operation:
+                                   {"op": "add", "row": 3, "name": "Tirta",
+                                    "source": "<sha1 of the source image>"}
+                                   {"op": "del", "row": 3}
+
+    Enrollment appends rows and index lines without touching existing data.
+    Deletions only write tombstones; once more than `max_deleted_ratio` of
+    the rows are deleted, `compact` rewrites the live rows into a new
+    generation in the background and switches `meta.json` atomically, so
+    readers holding a memory map of the previous generation keep working.
+    Files of other generations that cannot be removed yet (Windows refuses
+    while they are mapped) are removed by a later compaction or open.
+    """
+
+    def __init__(self, root, dim=512, dtype="float32", create=False, max_deleted_ratio=0.25):
+        """
+        Open (or create) a feature store.
+
+        Args:
+            root (str): Store directory.
+            dim (int): Embedding dimension, used when creating the store.
+            dtype (str): "float32" or "float16", used when creating the store.
+            create (bool): Create the store if it does not exist yet.
+            max_deleted_ratio (float): Fraction of deleted rows that triggers a
+                background compaction after a delete; None disables it.
+        """
+        self.root = root
+        self.max_deleted_ratio = max_deleted_ratio
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._compact_thread = None
+
+        meta_path = os.path.join(root, META_FILE)
+        if not os.path.exists(meta_path):
+            if not create:
+                raise FileNotFoundError(f"No feature store at {root}")
+            if dtype not in SUPPORTED_DTYPES:
+                raise ValueError(f"Unsupported store dtype: {dtype}")
+            os.makedirs(root, exist_ok=True)
+            self._write_meta({"version": STORE_VERSION, "dim": int(dim), "dtype": dtype, "generation": 0})
+
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        self.dim = int(meta["dim"])
+        self.dtype = np.dtype(meta["dtype"])
+        self.generation = int(meta["generation"])
+        self._row_bytes = self.dim * self.dtype.itemsize
+
+        self._load_index()
+        self._remove_stale_generations()
+
+    @staticmethod
+    def exists(root):
+        return os.path.exists(os.path.join(root, META_FILE))
+
+    def _path(self, kind, generation=None):
+        generation = self.generation if generation is None else generation
+        ext = "bin" if kind == "embeddings" else "jsonl"
+        return os.path.join(self.root, f"{kind}.{generation}.{ext}")
+
+    def _write_meta(self, meta):
+        tmp_path = os.path.join(self.root, META_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.root, META_FILE))
+
+    def _load_index(self):
+        """Replay the index log into the in-memory name list and alive mask."""
+        names = []
+        sources = []
+        deleted = set()
+        # Byte offset just past the last valid line; the next append starts there
+        valid_size = 0
+        index_path = self._path("index")
+        if os.path.exists(index_path):
+            with open(index_path, "rb") as f:
+                for line in f:
+                    # A torn last line from an interrupted append.
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    if entry["op"] == "add":
+                        if entry["row"] != len(names):
+                            break
+                        names.append(entry["name"])
+                        sources.append(entry.get("source"))
+                    elif entry["op"] == "del":
+                        deleted.add(entry["row"])
+                    valid_size += len(line)
+
+        self._index_size = valid_size
+        self._names = names
+        self._sources = sources
+        self._alive = np.ones(len(names), dtype=bool)
+        for row in deleted:
+            if row < len(names):
+                self._alive[row] = False
+
+        # Rows written to the embedding file without a matching index entry
+        # belong to an interrupted append and are ignored.
+        emb_path = self._path("embeddings")
+        on_disk = os.path.getsize(emb_path) // self._row_bytes if os.path.exists(emb_path) else 0
+        self._num_rows = min(len(names), on_disk)
+        del self._names[self._num_rows :]
+        del self._sources[self._num_rows :]
+        self._alive = self._alive[: self._num_rows]
+
+    def __len__(self):
+        return int(self._alive.sum())
+
+    @property
+    def num_deleted(self):
+        return self._num_rows - len(self)
+
+    def _matrix(self):
+        """Memory map of every row in the current generation, deleted or not."""
+        if self._num_rows == 0:
+            return np.empty((0, self.dim), dtype=self.dtype)
+        return np.memmap(
+            self._path("embeddings"), dtype=self.dtype, mode="r", shape=(self._num_rows, self.dim)
+        )
+
+    def load(self):
+        """
+        Return the live gallery.
+
+        Returns:
+            tuple: (names, embeddings). Without tombstones the embeddings are a
+            read-only memory map of the store file (no copy is made); otherwise
+            only the live rows are gathered.
+        """
+        with self._lock:
+            names = np.array(self._names)
+            matrix = self._matrix()
+            if self.num_deleted == 0:
+                return names, matrix
+            return names[self._alive], np.asarray(matrix[self._alive])
+
+    def sources(self):
+        """Return the set of source identifiers (image hashes) of the live rows."""
+        with self._lock:
+            return {
+                source
+                for source, alive in zip(self._sources, self._alive)
+                if alive and source is not None
+            }
+
+    def append(self, names, embeddings, sources=None):
+        """
+        Append embeddings to the store.
+
+        Args:
+            names (list[str]): One name per embedding.
+            embeddings (numpy.ndarray): Array of shape (N, dim).
+            sources (list[str], optional): Identifier of the image each
+                embedding was extracted from, recorded in the index.
+
+        Returns:
+            numpy.ndarray: Row numbers assigned to the new embeddings.
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=self.dtype).reshape(-1, self.dim)
+        if len(names) != len(embeddings):
+            raise ValueError("names and embeddings must have the same length")
+        if sources is None:
+            sources = [None] * len(names)
+
+        with self._lock:
+            start = self._num_rows
+            rows = np.arange(start, start + len(embeddings))
+
+            # Data first, index second: the index line is the commit point.
+            with open(self._path("embeddings"), "ab") as f:
+                f.truncate(start * self._row_bytes)
+                f.write(embeddings.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            lines = "".join(
+                _add_entry(int(row), str(name), source) + "\n"
+                for row, name, source in zip(rows, names, sources)
+            )
+            self._append_index(lines)
+
+            self._names.extend(str(name) for name in names)
+            self._sources.extend(sources)
+            self._alive = np.concatenate([self._alive, np.ones(len(rows), dtype=bool)])
+            self._num_rows += len(rows)
+
+        return rows
+
+    def _append_index(self, lines):
+        data = lines.encode("utf-8")
+        with open(self._path("index"), "ab") as f:
+            # Cut a torn line left by an interrupted append, so the new
+            # entries do not get glued onto it.
+            f.truncate(self._index_size)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._index_size += len(data)
+
+    def delete(self, rows):
+        """Mark rows as deleted by appending tombstones to the index."""
+        with self._lock:
+            rows = [int(row) for row in rows if row < self._num_rows and self._alive[row]]
+            if not rows:
+                return 0
+            self._append_index("".join(_del_entry(row) + "\n" for row in rows))
+            self._alive[rows] = False
+        if self.max_deleted_ratio is not None:
+            self.maybe_compact(self.max_deleted_ratio)
+        return len(rows)
+
+    def delete_name(self, name):
+        """Delete every embedding enrolled under `name`."""
+        with self._lock:
+            rows = [row for row, row_name in enumerate(self._names) if row_name == name]
+            return self.delete(rows)
+
+    def compact(self, background=False):
+        """
+        Drop deleted rows by rewriting the live rows into a new generation.
+
+        Args:
+            background (bool): Run the compaction in a daemon thread.
+
+        Returns:
+            threading.Thread or None: The compaction thread when running in
+            the background.
+        """
+        if background:
+            if self._compact_thread is not None and self._compact_thread.is_alive():
+                return self._compact_thread
+            self._compact_thread = threading.Thread(target=self.compact, daemon=True)
+            self._compact_thread.start()
+            return self._compact_thread
+
+        with self._compact_lock:
+            self._compact()
+        return None
+
+    def _compact(self):
+        # Snapshot the live rows, then write the new generation without
+        # holding the store lock, so searches and appends continue meanwhile.
+        with self._lock:
+            if self.num_deleted == 0:
+                return
+            new_generation = self.generation + 1
+            snapshot_rows = self._num_rows
+            live_rows = np.flatnonzero(self._alive)
+            matrix = self._matrix()
+            names = [self._names[row] for row in live_rows]
+            sources = [self._sources[row] for row in live_rows]
+
+        emb_path = self._path("embeddings", new_generation)
+        index_path = self._path("index", new_generation)
+        with open(emb_path, "wb") as f:
+            # Copy in chunks so the whole gallery is never materialized.
+            for start in range(0, len(live_rows), 4096):
+                f.write(np.ascontiguousarray(matrix[live_rows[start : start + 4096]]).tobytes())
+        with open(index_path, "w") as f:
+            for row, (name, source) in enumerate(zip(names, sources)):
+                f.write(_add_entry(row, name, source) + "\n")
+
+        with self._lock:
+            # Carry over what happened during the copy: rows appended since
+            # the snapshot and tombstones written for snapshotted rows.
+            alive = self._alive[live_rows]
+            new_rows = np.arange(snapshot_rows, self._num_rows)
+            lines = [_del_entry(row) for row in np.flatnonzero(~alive)]
+            with open(emb_path, "ab") as f:
+                if len(new_rows):
+                    f.write(np.ascontiguousarray(self._matrix()[new_rows]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            for offset, row in enumerate(new_rows):
+                new_row = len(names) + offset
+                lines.append(_add_entry(new_row, self._names[row], self._sources[row]))
+                if not self._alive[row]:
+                    lines.append(_del_entry(new_row))
+            names.extend(self._names[row] for row in new_rows)
+            sources.extend(self._sources[row] for row in new_rows)
+            alive = np.concatenate([alive, self._alive[new_rows]])
+            with open(index_path, "a") as f:
+                f.write("".join(line + "\n" for line in lines))
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._write_meta(
+                {
+                    "version": STORE_VERSION,
+                    "dim": self.dim,
+                    "dtype": self.dtype.name,
+                    "generation": new_generation,
+                }
+            )
+            self.generation = new_generation
+            self._names = names
+            self._sources = sources
+            self._alive = alive
+            self._num_rows = len(names)
+            self._index_size = os.path.getsize(index_path)
+
+        self._remove_stale_generations()
+
+    def _remove_stale_generations(self):
+        """Remove the files of every generation but the current one, as far as possible."""
+        current = {os.path.basename(self._path(kind)) for kind in ("embeddings", "index")}
+        for name in os.listdir(self.root):
+            if GENERATION_FILE.match(name) and name not in current:
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # Still mapped by a reader; retried on the next compaction or open
+                    logger.warning(f"Cannot remove old feature store file {name} yet: {e}")
+
+    def maybe_compact(self, max_deleted_ratio=0.25):
+        """Start a background compaction once enough rows are tombstoned."""
+        if self._num_rows and self.num_deleted / self._num_rows > max_deleted_ratio:
+            return self.compact(background=True)
+        return None
+
+
+def _add_entry(row, name, source):
+    entry = {"op": "add", "row": row, "name": name}
+    if source is not None:
+        entry["source"] = source
+    return json.dumps(entry)
+
+
+def _del_entry(row):
+    return json.dumps({"op": "del", "row": int(row)})
+
+
+def open_store(feature_path, dtype="float32", dim=512):
+    """
+    Open the feature store at `feature_path`, creating it if needed.
+
+    A legacy `<feature_path>.npz` gallery is imported into a newly created
+    store so existing enrollments are kept.
+
+    Args:
+        feature_path (str): Store directory (the legacy npz path without extension).
+        dtype (str): Embedding dtype for a new store.
+        dim (int): Embedding dimension for a new store.
+
+    Returns:
+        FeatureStore: The opened store.
+    """
+    legacy_path = feature_path + ".npz"
+    if not FeatureStore.exists(feature_path) and os.path.exists(legacy_path):
+        data = np.load(legacy_path, allow_pickle=True)
+        images_name, images_emb = data["images_name"], data["images_emb"]
+        store = FeatureStore(feature_path, dim=images_emb.shape[-1], dtype=dtype, create=True)
+        store.append(list(images_name), images_emb.reshape(len(images_name), -1))
+        return store
+
+    return FeatureStore(feature_path, dim=dim, dtype=dtype, create=True)
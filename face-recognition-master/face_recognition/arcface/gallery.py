@@ -0,0 +1,128 @@
+import numpy as np
+
+STORAGE_TYPES = ("float32", "float16", "int8")
+
+# Bytes of float32 rows converted at a time during the coarse scan; small
+# enough for the conversion buffer to stay in the L2 cache during its GEMV
+SCAN_CHUNK_BYTES = 512 << 10
+
+
+def quantize_int8(embeddings):
+    """
+    Scalar-quantize embeddings to int8 with one scale per vector.
+
+    Args:
+        embeddings (numpy.ndarray): Array of shape (N, D).
+
+    Returns:
+        tuple: (codes, scales) where codes is an (N, D) int8 array and scales
+        an (N,) float32 array such that embeddings ~= codes * scales[:, None].
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    scales = np.abs(embeddings).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(embeddings / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class Gallery:
+    """
+    Face gallery with compact in-memory codes and exact re-ranking.
+
+    The coarse search scans float16 or int8 codes; the best `rerank`
+    candidates are then scored again against the exact embeddings. Pass the
+    memory map returned by `read_features` as `embeddings` so re-ranking only
+    pages in the few candidate rows instead of keeping the float32 matrix in
+    memory.
+
+    float16 and int8 are memory options: they hold the gallery in 1/2 and
+    1/4 of the float32 size, but NumPy has no fast low-precision GEMV, so
+    their rows are converted to float32 in cache-sized chunks. That is
+    slower than float32 for galleries that fit in the cache and about as
+    fast for large ones. float32 is the default.
+    """
+
+    def __init__(self, names, embeddings, storage="float32", rerank=10):
+        """
+        Build the gallery.
+
+        Args:
+            names (numpy.ndarray): Name of every embedding.
+            embeddings (numpy.ndarray): Array of shape (N, D) with normalized embeddings.
+            storage (str): Coarse code type: "float32", "float16" or "int8".
+            rerank (int): Number of coarse candidates re-scored exactly.
+        """
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Unsupported gallery storage: {storage}")
+
+        self.names = names
+        self.storage = storage
+        self.rerank = rerank
+        self._exact = embeddings
+        self._scales = None
+
+        if storage == "float32":
+            self._codes = np.asarray(embeddings, dtype=np.float32)
+        elif storage == "float16":
+            self._codes = np.asarray(embeddings, dtype=np.float16)
+        else:
+            self._codes, self._scales = quantize_int8(embeddings)
+
+    def __len__(self):
+        return len(self._codes)
+
+    @property
+    def nbytes(self):
+        """Memory held by the coarse codes (and scales)."""
+        nbytes = self._codes.nbytes
+        if self._scales is not None:
+            nbytes += self._scales.nbytes
+        return nbytes
+
+    def _coarse_scores(self, query):
+        if self.storage == "float32":
+            return self._codes @ query
+
+        scores = np.empty(len(self._codes), dtype=np.float32)
+        chunk_rows = max(1, SCAN_CHUNK_BYTES // (self._codes.shape[1] * 4))
+        buffer = np.empty((chunk_rows, self._codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(self._codes), chunk_rows):
+            codes = self._codes[start : start + chunk_rows]
+            chunk = buffer[: len(codes)]
+            np.copyto(chunk, codes, casting="unsafe")
+            np.dot(chunk, query, out=scores[start : start + len(codes)])
+        if self._scales is not None:
+            scores *= self._scales
+        return scores
+
+    def search(self, query, top_k=1):
+        """
+        Find the most similar gallery embeddings.
+
+        Args:
+            query (numpy.ndarray): Normalized query embedding of shape (D,) or (1, D).
+            top_k (int): Number of results to return.
+
+        Returns:
+            tuple: (scores, indices), both of length `top_k` and sorted by
+            decreasing similarity.
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        scores = self._coarse_scores(query)
+
+        num_candidates = min(len(scores), max(top_k, self.rerank))
+        if num_candidates < len(scores):
+            candidates = np.argpartition(-scores, num_candidates - 1)[:num_candidates]
+        else:
+            candidates = np.arange(len(scores))
+
+        if self.storage != "float32":
+            # Exact re-ranking; sorted indices keep memory-map reads sequential
+            candidates = np.sort(candidates)
+            exact = np.asarray(self._exact[candidates], dtype=np.float32)
+            candidate_scores = exact @ query
+        else:
+            candidate_scores = scores[candidates]
+
+        order = np.argsort(-candidate_scores)[:top_k]
+        return candidate_scores[order], candidates[order]
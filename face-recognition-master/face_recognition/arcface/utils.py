@@ -1,8 +1,13 @@
 import numpy as np
 
+from face_recognition.arcface.feature_store import FeatureStore
+
 
 def read_features(feature_path):
     try:
+        if FeatureStore.exists(feature_path):
+            return FeatureStore(feature_path).load()
+
         data = np.load(feature_path + ".npz", allow_pickle=True)
         images_name = data["images_name"]
         images_emb = data["images_emb"]
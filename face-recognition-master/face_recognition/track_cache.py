@@ -0,0 +1,131 @@
+import threading
+import time
+
+
+def face_quality(bbox, score):
+    """
+    Score how useful a detection is for recognition.
+
+    Args:
+        bbox: Detection box (x1, y1, x2, y2) in frame pixels, e.g. a row of
+            the `bboxes` returned by `SCRFD.detect_tracking`.
+        score (float): Detector confidence of the face, e.g. `outputs[j, 4]`.
+            Not the fifth column of `bboxes`, which is scaled with the box and
+            cut to an integer.
+
+    Returns:
+        float: Detection score weighted by the shorter side of the box, so
+        larger and more confident faces rank higher.
+    """
+    x1, y1, x2, y2 = bbox[:4]
+    return float(score) * float(max(0, min(x2 - x1, y2 - y1)))
+
+
+class TrackRecognitionCache:
+    """
+    Per-track recognition results, used to skip ArcFace on faces that are
+    already confidently known.
+
+    A track is (re-)recognized when it is new, when its cached score is below
+    `confident_score` (at most every `retry_interval` seconds, so unknown
+    faces do not run every frame), when the current face quality beats the
+    cached one by `quality_gain`, or when the entry is older than `ttl`
+    seconds. Entries are evicted once the tracker no longer holds the track.
+    """
+
+    def __init__(self, confident_score=0.6, quality_gain=1.25, ttl=5.0, retry_interval=0.5):
+        """
+        Args:
+            confident_score (float): Score above which a result is reused.
+            quality_gain (float): Quality ratio that triggers a refresh.
+            ttl (float): Maximum age of a result in seconds.
+            retry_interval (float): Minimum delay between retries of low-score tracks.
+        """
+        self.confident_score = confident_score
+        self.retry_interval = retry_interval
+        self.quality_gain = quality_gain
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, track_id):
+        return track_id in self._entries
+
+    def get(self, track_id):
+        """Return the cached entry of a track, or None."""
+        return self._entries.get(track_id)
+
+    def needs_recognition(self, track_id, quality, now=None):
+        """
+        Decide whether a track has to go through recognition again.
+
+        Args:
+            track_id (int): Tracker ID.
+            quality (float): Quality of the current face (see `face_quality`).
+            now (float, optional): Current time in seconds.
+
+        Returns:
+            bool: True if the face should be embedded and matched.
+        """
+        entry = self._entries.get(track_id)
+        if entry is None:
+            return True
+        now = time.monotonic() if now is None else now
+        age = now - entry["timestamp"]
+        return (
+            (entry["score"] < self.confident_score and age >= self.retry_interval)
+            or quality > entry["quality"] * self.quality_gain
+            or age > self.ttl
+        )
+
+    def update(self, track_id, embedding, score, name, quality, now=None):
+        """
+        Store a recognition result for a track.
+
+        The best result is kept: a lower score only replaces the cached one
+        when the name changed (e.g. the tracker swapped identities) or the
+        cached entry expired. The timestamp is refreshed either way.
+
+        Returns:
+            dict: The cache entry of the track.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(track_id)
+            if (
+                entry is None
+                or name != entry["name"]
+                or score >= entry["score"]
+                or now - entry["timestamp"] > self.ttl
+            ):
+                entry = {
+                    "embedding": embedding,
+                    "score": float(score),
+                    "name": name,
+                    "quality": float(quality),
+                }
+                self._entries[track_id] = entry
+            else:
+                entry["quality"] = max(entry["quality"], float(quality))
+            entry["timestamp"] = now
+            return entry
+
+    def evict(self, active_track_ids):
+        """
+        Drop entries of tracks the tracker has removed.
+
+        Args:
+            active_track_ids: IDs of the tracked and lost tracks.
+
+        Returns:
+            list: IDs of the evicted tracks.
+        """
+        active_track_ids = set(active_track_ids)
+        with self._lock:
+            removed = [track_id for track_id in self._entries if track_id not in active_track_ids]
+            for track_id in removed:
+                del self._entries[track_id]
+        return removed
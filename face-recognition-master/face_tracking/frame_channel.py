@@ -0,0 +1,75 @@
+import threading
+from collections import namedtuple
+
+# Everything the recognition side needs from one tracked frame. The arrays are
+# created fresh for every frame and never modified after being published.
+FrameSnapshot = namedtuple(
+    "FrameSnapshot",
+    [
+        "seq",
+        "timestamp",
+        "raw_image",
+        "detection_bboxes",
+        "detection_scores",
+        "detection_landmarks",
+        "tracking_ids",
+        "tracking_bboxes",
+        "tracking_det_indices",
+        "active_track_ids",
+    ],
+)
+
+
+class FrameChannel:
+    """
+    Single-slot handoff of frame snapshots from the tracking thread to one or
+    more recognition workers.
+
+    Publishing replaces a snapshot nobody has taken yet, so consumers always
+    get the latest frame and never fall behind. `take` removes the snapshot
+    from the slot, so every frame is recognized at most once even with
+    several workers, and blocks on a condition variable instead of spinning
+    while no frame is available.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._slot = None
+        self._closed = False
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, snapshot):
+        """Make `snapshot` the next frame handed to a consumer."""
+        with self._cond:
+            if self._slot is not None:
+                self.dropped += 1
+            self._slot = snapshot
+            self.published += 1
+            self._cond.notify()
+
+    def take(self, timeout=None):
+        """
+        Wait for the next snapshot and remove it from the slot.
+
+        Args:
+            timeout (float, optional): Maximum time to wait in seconds.
+
+        Returns:
+            FrameSnapshot or None: None on timeout or once the channel is closed.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._slot is not None or self._closed, timeout)
+            snapshot, self._slot = self._slot, None
+            return snapshot
+
+    def close(self):
+        """Wake up every waiting consumer; later `take` calls return None."""
+        with self._cond:
+            self._closed = True
+            self._slot = None
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
@@ -0,0 +1,3 @@
+from .byte_tracker import BYTETracker, STrack
+
+__all__ = ["BYTETracker", "STrack"]
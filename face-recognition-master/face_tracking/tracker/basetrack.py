@@ -11,8 +11,6 @@ class TrackState(object):
 
 
 class BaseTrack(object):
-    _count = 0
-
     track_id = 0
     is_activated = False
     state = TrackState.New
@@ -32,11 +30,6 @@ class BaseTrack(object):
     def end_frame(self):
         return self.frame_id
 
-    @staticmethod
-    def next_id():
-        BaseTrack._count += 1
-        return BaseTrack._count
-
     def activate(self, *args):
         raise NotImplementedError
 
@@ -1,101 +1,40 @@
-import os
-import sys
-
-import torch
-
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-sys.path.append(BASE_DIR)
-
-import matching
 import numpy as np
 
+from . import matching
 from .basetrack import BaseTrack, TrackState
 from .kalman_filter import KalmanFilter
+from .track_table import TrackTable, tlbr_to_xyah
 
 
 class STrack(BaseTrack):
-    shared_kalman = KalmanFilter()
+    """
+    One track as returned by BYTETracker.update: a copy of its row in the
+    tracker's TrackTable, taken at the end of the frame.
+    """
 
-    def __init__(self, tlwh, score):
-        # wait activate
+    def __init__(self, tlwh, score, det_index=-1):
         self._tlwh = np.asarray(tlwh, dtype=np.float64)
-        self.kalman_filter = None
+        # Row of the detection this track was last updated with, in the
+        # output_results passed to BYTETracker.update
+        self.det_index = det_index
         self.mean, self.covariance = None, None
         self.is_activated = False
 
         self.score = score
         self.tracklet_len = 0
 
-    def predict(self):
-        mean_state = self.mean.copy()
-        if self.state != TrackState.Tracked:
-            mean_state[7] = 0
-        self.mean, self.covariance = self.kalman_filter.predict(
-            mean_state, self.covariance
-        )
-
-    @staticmethod
-    def multi_predict(stracks):
-        if len(stracks) > 0:
-            multi_mean = np.asarray([st.mean.copy() for st in stracks])
-            multi_covariance = np.asarray([st.covariance for st in stracks])
-            for i, st in enumerate(stracks):
-                if st.state != TrackState.Tracked:
-                    multi_mean[i][7] = 0
-            multi_mean, multi_covariance = STrack.shared_kalman.multi_predict(
-                multi_mean, multi_covariance
-            )
-            for i, (mean, cov) in enumerate(zip(multi_mean, multi_covariance)):
-                stracks[i].mean = mean
-                stracks[i].covariance = cov
-
-    def activate(self, kalman_filter, frame_id):
-        """Start a new tracklet"""
-        self.kalman_filter = kalman_filter
-        self.track_id = self.next_id()
-        self.mean, self.covariance = self.kalman_filter.initiate(
-            self.tlwh_to_xyah(self._tlwh)
-        )
-
-        self.tracklet_len = 0
-        self.state = TrackState.Tracked
-        if frame_id == 1:
-            self.is_activated = True
-        # self.is_activated = True
-        self.frame_id = frame_id
-        self.start_frame = frame_id
-
-    def re_activate(self, new_track, frame_id, new_id=False):
-        self.mean, self.covariance = self.kalman_filter.update(
-            self.mean, self.covariance, self.tlwh_to_xyah(new_track.tlwh)
-        )
-        self.tracklet_len = 0
-        self.state = TrackState.Tracked
-        self.is_activated = True
-        self.frame_id = frame_id
-        if new_id:
-            self.track_id = self.next_id()
-        self.score = new_track.score
-
-    def update(self, new_track, frame_id):
-        """
-        Update a matched track
-        :type new_track: STrack
-        :type frame_id: int
-        :type update_feature: bool
-        :return:
-        """
-        self.frame_id = frame_id
-        self.tracklet_len += 1
-
-        new_tlwh = new_track.tlwh
-        self.mean, self.covariance = self.kalman_filter.update(
-            self.mean, self.covariance, self.tlwh_to_xyah(new_tlwh)
-        )
-        self.state = TrackState.Tracked
-        self.is_activated = True
-
-        self.score = new_track.score
+    @classmethod
+    def from_table(cls, table, row):
+        track = cls(table.tlwh([row])[0], float(table.score[row]), int(table.det_index[row]))
+        track.mean = table.mean[row].copy()
+        track.covariance = table.covariance[row].copy()
+        track.track_id = int(table.track_id[row])
+        track.state = int(table.state[row])
+        track.is_activated = bool(table.is_activated[row])
+        track.frame_id = int(table.frame_id[row])
+        track.start_frame = int(table.start_frame[row])
+        track.tracklet_len = int(table.tracklet_len[row])
+        return track
 
     @property
     # @jit(nopython=True)
@@ -154,10 +93,6 @@ class STrack(BaseTrack):
 
 class BYTETracker(object):
     def __init__(self, args, frame_rate=30):
-        self.tracked_stracks = []  # type: list[STrack]
-        self.lost_stracks = []  # type: list[STrack]
-        self.removed_stracks = []  # type: list[STrack]
-
         self.frame_id = 0
         self.args = args
         # self.det_thresh = args.track_thresh
@@ -165,194 +100,160 @@ class BYTETracker(object):
         self.buffer_size = int(frame_rate / 30.0 * args["track_buffer"])
         self.max_time_lost = self.buffer_size
         self.kalman_filter = KalmanFilter()
+        # Tracked and lost tracks; removed ones are dropped at the end of a frame
+        self.tracks = TrackTable(self.kalman_filter)
+        # Last track ID handed out. Every tracker numbers its tracks from 1,
+        # independently of other trackers in the process.
+        self.last_track_id = 0
+
+    @property
+    def tracked_stracks(self):
+        return self._stracks(self.tracks.rows(TrackState.Tracked))
+
+    @property
+    def lost_stracks(self):
+        return self._stracks(self.tracks.rows(TrackState.Lost))
+
+    def _stracks(self, rows):
+        return [STrack.from_table(self.tracks, row) for row in rows]
+
+    def active_track_ids(self):
+        """IDs of the tracks that are still tracked or lost (not removed)."""
+        return self.tracks.track_id.tolist()
 
     def update(self, output_results, img_info, img_size):
         self.frame_id += 1
-        activated_starcks = []
-        refind_stracks = []
-        lost_stracks = []
-        removed_stracks = []
+        tracks = self.tracks
 
+        if hasattr(output_results, "cpu"):
+            output_results = output_results.cpu().numpy()
+        output_results = np.asarray(output_results, dtype=np.float64)
         if output_results.shape[1] == 5:
             scores = output_results[:, 4]
-            bboxes = output_results[:, :4]
         else:
-            output_results = output_results.cpu().numpy()
             scores = output_results[:, 4] * output_results[:, 5]
-            bboxes = output_results[:, :4]  # x1y1x2y2
         img_h, img_w = img_info[0], img_info[1]
         scale = min(img_size[0] / float(img_h), img_size[1] / float(img_w))
-        bboxes /= scale
-
-        remain_inds = scores > self.args["track_thresh"]
-        inds_low = scores > 0.1
-        inds_high = scores < self.args["track_thresh"]
-
-        inds_second = np.logical_and(inds_low, inds_high)
-        dets_second = bboxes[inds_second.to(torch.bool)]
-        dets = bboxes[remain_inds]
-        scores_keep = scores[remain_inds]
-        scores_second = scores[inds_second.to(torch.bool)]
-
-        if len(dets) > 0:
-            """Detections"""
-            detections = [
-                STrack(STrack.tlbr_to_tlwh(tlbr), s)
-                for (tlbr, s) in zip(dets, scores_keep)
-            ]
-        else:
-            detections = []
+        bboxes = output_results[:, :4] / scale  # x1y1x2y2
+
+        # Original detection rows, kept on the tracks so callers can look up
+        # the landmarks of the detection a track was matched with
+        inds_keep = np.flatnonzero(scores > self.args["track_thresh"])
+        inds_second = np.flatnonzero(
+            np.logical_and(scores > 0.1, scores < self.args["track_thresh"])
+        )
 
         """ Add newly detected tracklets to tracked_stracks"""
-        unconfirmed = []
-        tracked_stracks = []  # type: list[STrack]
-        for track in self.tracked_stracks:
-            if not track.is_activated:
-                unconfirmed.append(track)
-            else:
-                tracked_stracks.append(track)
+        tracked = tracks.state == TrackState.Tracked
+        unconfirmed = np.flatnonzero(tracked & ~tracks.is_activated)
 
         """ Step 2: First association, with high score detection boxes"""
-        strack_pool = joint_stracks(tracked_stracks, self.lost_stracks)
+        strack_pool = np.concatenate(
+            [
+                np.flatnonzero(tracked & tracks.is_activated),
+                tracks.rows(TrackState.Lost),
+            ]
+        )
         # Predict the current location with KF
-        STrack.multi_predict(strack_pool)
-        dists = matching.iou_distance(strack_pool, detections)
+        tracks.predict(strack_pool)
+        dists = self._association_cost(strack_pool, bboxes[inds_keep])
         # if not self.args.mot20:
         #     dists = matching.fuse_score(dists, detections)
         matches, u_track, u_detection = matching.linear_assignment(
             dists, thresh=self.args["match_thresh"]
         )
-
-        for itracked, idet in matches:
-            track = strack_pool[itracked]
-            det = detections[idet]
-            if track.state == TrackState.Tracked:
-                track.update(detections[idet], self.frame_id)
-                activated_starcks.append(track)
-            else:
-                track.re_activate(det, self.frame_id, new_id=False)
-                refind_stracks.append(track)
+        self._update_rows(strack_pool[matches[:, 0]], inds_keep[matches[:, 1]], bboxes, scores)
 
         """ Step 3: Second association, with low score detection boxes"""
         # association the untrack to the low score detections
-        if len(dets_second) > 0:
-            """Detections"""
-            detections_second = [
-                STrack(STrack.tlbr_to_tlwh(tlbr), s)
-                for (tlbr, s) in zip(dets_second, scores_second)
-            ]
-        else:
-            detections_second = []
-        r_tracked_stracks = [
-            strack_pool[i]
-            for i in u_track
-            if strack_pool[i].state == TrackState.Tracked
-        ]
-        dists = matching.iou_distance(r_tracked_stracks, detections_second)
+        u_track = strack_pool[np.asarray(u_track, dtype=int)]
+        r_tracked_stracks = u_track[tracks.state[u_track] == TrackState.Tracked]
+        dists = self._association_cost(r_tracked_stracks, bboxes[inds_second])
         matches, u_track, u_detection_second = matching.linear_assignment(
             dists, thresh=0.5
         )
-        for itracked, idet in matches:
-            track = r_tracked_stracks[itracked]
-            det = detections_second[idet]
-            if track.state == TrackState.Tracked:
-                track.update(det, self.frame_id)
-                activated_starcks.append(track)
-            else:
-                track.re_activate(det, self.frame_id, new_id=False)
-                refind_stracks.append(track)
-
-        for it in u_track:
-            track = r_tracked_stracks[it]
-            if not track.state == TrackState.Lost:
-                track.mark_lost()
-                lost_stracks.append(track)
+        self._update_rows(
+            r_tracked_stracks[matches[:, 0]], inds_second[matches[:, 1]], bboxes, scores
+        )
+        tracks.state[r_tracked_stracks[np.asarray(u_track, dtype=int)]] = TrackState.Lost
 
         """Deal with unconfirmed tracks, usually tracks with only one beginning frame"""
-        detections = [detections[i] for i in u_detection]
-        dists = matching.iou_distance(unconfirmed, detections)
+        inds_keep = inds_keep[np.asarray(u_detection, dtype=int)]
+        dists = matching.iou_distance(tracks.tlbr(unconfirmed), bboxes[inds_keep])
         # if not self.args.mot20:
         #     dists = matching.fuse_score(dists, detections)
         matches, u_unconfirmed, u_detection = matching.linear_assignment(
             dists, thresh=0.7
         )
-        for itracked, idet in matches:
-            unconfirmed[itracked].update(detections[idet], self.frame_id)
-            activated_starcks.append(unconfirmed[itracked])
-        for it in u_unconfirmed:
-            track = unconfirmed[it]
-            track.mark_removed()
-            removed_stracks.append(track)
+        self._update_rows(unconfirmed[matches[:, 0]], inds_keep[matches[:, 1]], bboxes, scores)
+        tracks.state[unconfirmed[np.asarray(u_unconfirmed, dtype=int)]] = TrackState.Removed
 
         """ Step 4: Init new stracks"""
-        for inew in u_detection:
-            track = detections[inew]
-            if track.score < self.det_thresh:
-                continue
-            track.activate(self.kalman_filter, self.frame_id)
-            activated_starcks.append(track)
+        inds_new = inds_keep[np.asarray(u_detection, dtype=int)]
+        inds_new = inds_new[scores[inds_new] >= self.det_thresh]
+        tracks.add(
+            bboxes[inds_new],
+            scores[inds_new],
+            inds_new,
+            self._next_ids(len(inds_new)),
+            self.frame_id,
+        )
+
         """ Step 5: Update state"""
-        for track in self.lost_stracks:
-            if self.frame_id - track.end_frame > self.max_time_lost:
-                track.mark_removed()
-                removed_stracks.append(track)
-
-        # print('Ramained match {} s'.format(t4-t3))
-
-        self.tracked_stracks = [
-            t for t in self.tracked_stracks if t.state == TrackState.Tracked
-        ]
-        self.tracked_stracks = joint_stracks(self.tracked_stracks, activated_starcks)
-        self.tracked_stracks = joint_stracks(self.tracked_stracks, refind_stracks)
-        self.lost_stracks = sub_stracks(self.lost_stracks, self.tracked_stracks)
-        self.lost_stracks.extend(lost_stracks)
-        self.lost_stracks = sub_stracks(self.lost_stracks, self.removed_stracks)
-        self.removed_stracks.extend(removed_stracks)
-        self.tracked_stracks, self.lost_stracks = remove_duplicate_stracks(
-            self.tracked_stracks, self.lost_stracks
+        expired = (tracks.state == TrackState.Lost) & (
+            self.frame_id - tracks.frame_id > self.max_time_lost
         )
-        # get scores of lost tracks
-        output_stracks = [track for track in self.tracked_stracks if track.is_activated]
-
-        return output_stracks
-
-
-def joint_stracks(tlista, tlistb):
-    exists = {}
-    res = []
-    for t in tlista:
-        exists[t.track_id] = 1
-        res.append(t)
-    for t in tlistb:
-        tid = t.track_id
-        if not exists.get(tid, 0):
-            exists[tid] = 1
-            res.append(t)
-    return res
-
-
-def sub_stracks(tlista, tlistb):
-    stracks = {}
-    for t in tlista:
-        stracks[t.track_id] = t
-    for t in tlistb:
-        tid = t.track_id
-        if stracks.get(tid, 0):
-            del stracks[tid]
-    return list(stracks.values())
-
-
-def remove_duplicate_stracks(stracksa, stracksb):
-    pdist = matching.iou_distance(stracksa, stracksb)
-    pairs = np.where(pdist < 0.15)
-    dupa, dupb = list(), list()
-    for p, q in zip(*pairs):
-        timep = stracksa[p].frame_id - stracksa[p].start_frame
-        timeq = stracksb[q].frame_id - stracksb[q].start_frame
-        if timep > timeq:
-            dupb.append(q)
-        else:
-            dupa.append(p)
-    resa = [t for i, t in enumerate(stracksa) if not i in dupa]
-    resb = [t for i, t in enumerate(stracksb) if not i in dupb]
-    return resa, resb
+        tracks.state[expired] = TrackState.Removed
+
+        remove_duplicate_stracks(tracks)
+        tracks.drop_removed()
+
+        output_stracks = np.flatnonzero(
+            (tracks.state == TrackState.Tracked) & tracks.is_activated
+        )
+        return self._stracks(output_stracks)
+
+    def _next_ids(self, count):
+        """Reserve `count` new track IDs."""
+        ids = np.arange(self.last_track_id + 1, self.last_track_id + 1 + count, dtype=np.int64)
+        self.last_track_id += count
+        return ids
+
+    def _association_cost(self, rows, tlbrs):
+        """
+        IoU distance between the tracks at `rows` and detection boxes. With
+        `gate_motion` enabled in the tracker arguments, pairs the Kalman
+        motion model finds implausible are excluded from the matching.
+        """
+        dists = matching.iou_distance(self.tracks.tlbr(rows), tlbrs)
+        if self.args.get("gate_motion", False):
+            dists = matching.gate_cost_matrix(
+                self.kalman_filter,
+                dists,
+                (self.tracks.mean[rows], self.tracks.covariance[rows]),
+                tlbr_to_xyah(tlbrs),
+            )
+        return dists
+
+    def _update_rows(self, rows, det_indices, bboxes, scores):
+        """Correct `rows` with the detections at `det_indices` of this frame."""
+        self.tracks.update(
+            rows, bboxes[det_indices], scores[det_indices], det_indices, self.frame_id
+        )
+
+
+def remove_duplicate_stracks(tracks):
+    """
+    Remove one of every tracked/lost pair of tracks that overlap almost
+    entirely, keeping the one that has been alive longer.
+    """
+    rows_a = tracks.rows(TrackState.Tracked)
+    rows_b = tracks.rows(TrackState.Lost)
+    pdist = matching.iou_distance(tracks.tlbr(rows_a), tracks.tlbr(rows_b))
+    p, q = np.nonzero(pdist < 0.15)
+    if len(p) == 0:
+        return
+    timep = tracks.frame_id[rows_a[p]] - tracks.start_frame[rows_a[p]]
+    timeq = tracks.frame_id[rows_b[q]] - tracks.start_frame[rows_b[q]]
+    tracks.state[rows_b[q[timep > timeq]]] = TrackState.Removed
+    tracks.state[rows_a[p[timep <= timeq]]] = TrackState.Removed
@@ -1,6 +1,5 @@
 # vim: expandtab:ts=4:sw=4
 import numpy as np
-import scipy.linalg
 
 """
 Table for the 0.95 quantile of the chi-square distribution with N degrees of
@@ -86,6 +85,39 @@ class KalmanFilter(object):
         covariance = np.diag(np.square(std))
         return mean, covariance
 
+    def multi_initiate(self, measurement):
+        """Create tracks from unassociated measurements (Vectorized version).
+        Parameters
+        ----------
+        measurement : ndarray
+            The Nx4 dimensional bounding box coordinates (x, y, a, h).
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the Nx8 mean matrix and Nx8x8 covariance matrices of the
+            new tracks.
+        """
+        mean = np.concatenate([measurement, np.zeros_like(measurement)], axis=1)
+
+        h = measurement[:, 3]
+        std = np.stack(
+            [
+                2 * self._std_weight_position * h,
+                2 * self._std_weight_position * h,
+                1e-2 * np.ones_like(h),
+                2 * self._std_weight_position * h,
+                10 * self._std_weight_velocity * h,
+                10 * self._std_weight_velocity * h,
+                1e-5 * np.ones_like(h),
+                10 * self._std_weight_velocity * h,
+            ],
+            axis=1,
+        )
+        covariance = np.zeros((len(measurement), 8, 8))
+        diagonal = np.arange(8)
+        covariance[:, diagonal, diagonal] = np.square(std)
+        return mean, covariance
+
     def predict(self, mean, covariance):
         """Run Kalman filter prediction step.
 
@@ -189,17 +221,73 @@ class KalmanFilter(object):
         ]
         sqr = np.square(np.r_[std_pos, std_vel]).T
 
-        motion_cov = []
-        for i in range(len(mean)):
-            motion_cov.append(np.diag(sqr[i]))
-        motion_cov = np.asarray(motion_cov)
+        motion_cov = np.zeros_like(covariance)
+        diagonal = np.arange(8)
+        motion_cov[:, diagonal, diagonal] = sqr
 
         mean = np.dot(mean, self._motion_mat.T)
-        left = np.dot(self._motion_mat, covariance).transpose((1, 0, 2))
-        covariance = np.dot(left, self._motion_mat.T) + motion_cov
+        covariance = self._motion_mat @ covariance @ self._motion_mat.T + motion_cov
 
         return mean, covariance
 
+    def multi_project(self, mean, covariance):
+        """Project state distributions to measurement space (Vectorized version).
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean matrix of the object states.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices of the object states.
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the Nx4 projected means and Nx4x4 projected covariance
+            matrices of the given state estimates.
+        """
+        std = np.stack(
+            [
+                self._std_weight_position * mean[:, 3],
+                self._std_weight_position * mean[:, 3],
+                1e-1 * np.ones_like(mean[:, 3]),
+                self._std_weight_position * mean[:, 3],
+            ],
+            axis=1,
+        )
+
+        # The observation model selects the first four state dimensions
+        projected_mean = mean[:, :4].copy()
+        projected_cov = covariance[:, :4, :4].copy()
+        diagonal = np.arange(4)
+        projected_cov[:, diagonal, diagonal] += np.square(std)
+        return projected_mean, projected_cov
+
+    def multi_update(self, mean, covariance, measurement):
+        """Run Kalman filter correction step (Vectorized version).
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional predicted mean matrix.
+        covariance : ndarray
+            The Nx8x8 dimensional predicted covariance matrices.
+        measurement : ndarray
+            The Nx4 dimensional measurements (x, y, a, h), one per state.
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the measurement-corrected state distributions.
+        """
+        projected_mean, projected_cov = self.multi_project(mean, covariance)
+
+        # K = P H^T S^-1, solved for every state at once (S is symmetric)
+        kalman_gain = np.linalg.solve(
+            projected_cov, covariance[:, :, :4].transpose(0, 2, 1)
+        ).transpose(0, 2, 1)
+        innovation = measurement - projected_mean
+
+        new_mean = mean + np.einsum("nij,nj->ni", kalman_gain, innovation)
+        new_covariance = covariance - kalman_gain @ projected_cov @ kalman_gain.transpose(0, 2, 1)
+        return new_mean, new_covariance
+
     def update(self, mean, covariance, measurement):
         """Run Kalman filter correction step.
 
@@ -220,23 +308,10 @@ class KalmanFilter(object):
             Returns the measurement-corrected state distribution.
 
         """
-        projected_mean, projected_cov = self.project(mean, covariance)
-
-        chol_factor, lower = scipy.linalg.cho_factor(
-            projected_cov, lower=True, check_finite=False
+        new_mean, new_covariance = self.multi_update(
+            mean[None], covariance[None], np.asarray(measurement)[None]
         )
-        kalman_gain = scipy.linalg.cho_solve(
-            (chol_factor, lower),
-            np.dot(covariance, self._update_mat.T).T,
-            check_finite=False,
-        ).T
-        innovation = measurement - projected_mean
-
-        new_mean = mean + np.dot(innovation, kalman_gain.T)
-        new_covariance = covariance - np.linalg.multi_dot(
-            (kalman_gain, projected_cov, kalman_gain.T)
-        )
-        return new_mean, new_covariance
+        return new_mean[0], new_covariance[0]
 
     def gating_distance(
         self, mean, covariance, measurements, only_position=False, metric="maha"
@@ -265,20 +340,59 @@ class KalmanFilter(object):
             squared Mahalanobis distance between (mean, covariance) and
             `measurements[i]`.
         """
-        mean, covariance = self.project(mean, covariance)
+        return self.multi_gating_distance(
+            mean[None], covariance[None], measurements, only_position, metric
+        )[0]
+
+    def multi_gating_distance(
+        self, mean, covariance, measurements, only_position=False, metric="maha"
+    ):
+        """Compute gating distances between N state distributions and M
+        measurements at once (Vectorized version of `gating_distance`).
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean matrix of the state distributions.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices of the state distributions.
+        measurements : ndarray
+            An Mx4 dimensional matrix of M measurements (x, y, a, h).
+        only_position : Optional[bool]
+            If True, distance computation is done with respect to the bounding
+            box center position only.
+        Returns
+        -------
+        ndarray
+            Returns an NxM matrix whose (i, j) element is the squared
+            Mahalanobis distance between state i and `measurements[j]`.
+        """
+        mean, covariance = self.multi_project(mean, covariance)
+        measurements = np.asarray(measurements, dtype=np.float64).reshape(-1, 4)
         if only_position:
-            mean, covariance = mean[:2], covariance[:2, :2]
+            mean, covariance = mean[:, :2], covariance[:, :2, :2]
             measurements = measurements[:, :2]
+        if len(measurements) == 0:
+            return np.zeros((len(mean), 0))
 
-        d = measurements - mean
         if metric == "gaussian":
-            return np.sum(d * d, axis=1)
+            d = measurements[None, :, :] - mean[:, None, :]
+            return np.sum(d * d, axis=2)
         elif metric == "maha":
-            cholesky_factor = np.linalg.cholesky(covariance)
-            z = scipy.linalg.solve_triangular(
-                cholesky_factor, d.T, lower=True, check_finite=False, overwrite_b=True
+            # Expand (m - u)^T S^-1 (m - u) into a quadratic, a linear and a
+            # constant term so every pair is covered by two matrix products.
+            # Centering both sets first keeps the terms small.
+            center = measurements.mean(axis=0)
+            measurements = measurements - center
+            mean = mean - center
+            precision = np.linalg.inv(covariance)
+            k = measurements.shape[1]
+            quadratic = (measurements[:, :, None] * measurements[:, None, :]).reshape(-1, k * k)
+            linear = np.einsum("nij,nj->ni", precision, mean)
+            squared_maha = (
+                precision.reshape(-1, k * k) @ quadratic.T
+                - 2 * linear @ measurements.T
+                + np.einsum("ni,ni->n", linear, mean)[:, None]
             )
-            squared_maha = np.sum(z * z, axis=0)
-            return squared_maha
+            return np.maximum(squared_maha, 0)
         else:
             raise ValueError("invalid distance metric")
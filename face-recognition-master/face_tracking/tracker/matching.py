@@ -1,18 +1,24 @@
-import os
-import sys
-
-import kalman_filter
 import numpy as np
 from scipy.optimize import linear_sum_assignment
 from scipy.spatial.distance import cdist
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-sys.path.append(BASE_DIR)
+from . import kalman_filter
 
 # Other function definitions remain the same
 
 
 def linear_assignment(cost_matrix, thresh):
+    """
+    Match rows to columns, accepting only pairs with cost <= thresh.
+
+    Pairs above the threshold are forbidden and leaving a row or column
+    unmatched costs thresh / 2, as with lapjv's cost_limit in the reference
+    ByteTrack implementation, so a row whose best assignment exceeds the
+    threshold is reported as unmatched. When every row and column has at most
+    one candidate pair, the matching is read off directly and the Hungarian
+    solve is skipped; otherwise it only runs on the rows and columns that
+    have a candidate.
+    """
     if cost_matrix.size == 0:
         return (
             np.empty((0, 2), dtype=int),
@@ -20,12 +26,40 @@ def linear_assignment(cost_matrix, thresh):
             tuple(range(cost_matrix.shape[1])),
         )
 
-    row_ind, col_ind = linear_sum_assignment(cost_matrix)
-    matches = np.array(
-        [[r, c] for r, c in zip(row_ind, col_ind) if cost_matrix[r, c] <= thresh]
-    )
-    unmatched_a = np.array([i for i in range(cost_matrix.shape[0]) if i not in row_ind])
-    unmatched_b = np.array([i for i in range(cost_matrix.shape[1]) if i not in col_ind])
+    candidates = cost_matrix <= thresh
+    row_has = candidates.any(axis=1)
+    col_has = candidates.any(axis=0)
+
+    if not row_has.any():
+        matches = np.empty((0, 2), dtype=int)
+    elif candidates.sum(axis=1).max() <= 1 and candidates.sum(axis=0).max() <= 1:
+        # Fast path: no conflicts, every candidate pair is a match
+        matches = np.argwhere(candidates)
+    else:
+        rows = np.flatnonzero(row_has)
+        cols = np.flatnonzero(col_has)
+        n_rows, n_cols = len(rows), len(cols)
+
+        # Extended cost matrix as built by lapjv(extend_cost=True, cost_limit=thresh):
+        # leaving a row or a column unmatched costs thresh / 2
+        extended = np.zeros((n_rows + n_cols, n_cols + n_rows), dtype=np.float64)
+        extended[:n_rows, :n_cols] = np.where(
+            candidates[np.ix_(rows, cols)], cost_matrix[np.ix_(rows, cols)], thresh + 1e5
+        )
+        extended[:n_rows, n_cols:] = thresh / 2.0
+        extended[n_rows:, :n_cols] = thresh / 2.0
+
+        row_ind, col_ind = linear_sum_assignment(extended)
+        keep = (row_ind < n_rows) & (col_ind < n_cols)
+        keep[keep] = candidates[rows[row_ind[keep]], cols[col_ind[keep]]]
+        matches = np.stack([rows[row_ind[keep]], cols[col_ind[keep]]], axis=1)
+
+    matched_a = np.zeros(cost_matrix.shape[0], dtype=bool)
+    matched_b = np.zeros(cost_matrix.shape[1], dtype=bool)
+    matched_a[matches[:, 0]] = True
+    matched_b[matches[:, 1]] = True
+    unmatched_a = np.flatnonzero(~matched_a)
+    unmatched_b = np.flatnonzero(~matched_b)
 
     return matches, tuple(unmatched_a), tuple(unmatched_b)
 
@@ -67,9 +101,22 @@ def ious(atlbrs, btlbrs):
     :rtype ious np.ndarray
     """
     ious = np.zeros((len(atlbrs), len(btlbrs)), dtype=np.float64)
-    for i, box1 in enumerate(atlbrs):
-        for j, box2 in enumerate(btlbrs):
-            ious[i, j] = bbox_iou(box1, box2)
+    if ious.size == 0:
+        return ious
+
+    a = np.asarray(atlbrs, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(btlbrs, dtype=np.float64).reshape(-1, 4)
+
+    # Pairwise intersection through broadcasting: (N, 1) against (1, M)
+    inter_w = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    inter_h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    inter_area = np.maximum(inter_w, 0) * np.maximum(inter_h, 0)
+
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union_area = area_a[:, None] + area_b[None, :] - inter_area
+
+    np.divide(inter_area, union_area, out=ious, where=union_area > 0)
     return ious
 
 
@@ -144,17 +191,43 @@ def embedding_distance(tracks, detections, metric="cosine"):
     return cost_matrix
 
 
+def _track_states(tracks):
+    """Stacked Kalman means and covariances of a list of tracks.
+
+    A (means, covariances) tuple of arrays is passed through unchanged.
+    """
+    if isinstance(tracks, tuple):
+        return tracks
+    means = np.asarray([track.mean for track in tracks], dtype=np.float64)
+    covariances = np.asarray([track.covariance for track in tracks], dtype=np.float64)
+    return means, covariances
+
+
+def _measurements(detections):
+    """Detections as an (M, 4) xyah array; arrays are passed through."""
+    if isinstance(detections, np.ndarray):
+        return detections
+    return np.asarray([det.to_xyah() for det in detections], dtype=np.float64)
+
+
 def gate_cost_matrix(kf, cost_matrix, tracks, detections, only_position=False):
+    """
+    Forbid track-detection pairs that are implausible under the Kalman
+    motion model (squared Mahalanobis distance above the chi-square 95%
+    quantile). All pairs are gated with one batched computation.
+
+    :type tracks: list[STrack] | tuple(means, covariances)
+    :type detections: list[STrack] | np.ndarray of xyah measurements
+    """
     if cost_matrix.size == 0:
         return cost_matrix
     gating_dim = 2 if only_position else 4
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
-    measurements = np.asarray([det.to_xyah() for det in detections])
-    for row, track in enumerate(tracks):
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position
-        )
-        cost_matrix[row, gating_distance > gating_threshold] = np.inf
+    means, covariances = _track_states(tracks)
+    gating_distance = kf.multi_gating_distance(
+        means, covariances, _measurements(detections), only_position
+    )
+    cost_matrix[gating_distance > gating_threshold] = np.inf
     return cost_matrix
 
 
@@ -163,13 +236,12 @@ def fuse_motion(kf, cost_matrix, tracks, detections, only_position=False, lambda
         return cost_matrix
     gating_dim = 2 if only_position else 4
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
-    measurements = np.asarray([det.to_xyah() for det in detections])
-    for row, track in enumerate(tracks):
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position, metric="maha"
-        )
-        cost_matrix[row, gating_distance > gating_threshold] = np.inf
-        cost_matrix[row] = lambda_ * cost_matrix[row] + (1 - lambda_) * gating_distance
+    means, covariances = _track_states(tracks)
+    gating_distance = kf.multi_gating_distance(
+        means, covariances, _measurements(detections), only_position, metric="maha"
+    )
+    cost_matrix[gating_distance > gating_threshold] = np.inf
+    cost_matrix[:] = lambda_ * cost_matrix + (1 - lambda_) * gating_distance
     return cost_matrix
 
 
@@ -0,0 +1,139 @@
+import numpy as np
+
+from .basetrack import TrackState
+
+
+class TrackTable(object):
+    """
+    Columnar storage of every live track of a BYTETracker.
+
+    Row i of each column describes the same track: the Kalman state lives in
+    contiguous (N, 8) means and (N, 8, 8) covariances, and the bookkeeping of
+    STrack (state, ID, score, frames) in one array per field. Sets of tracks
+    (tracked, lost, unconfirmed, ...) are boolean masks or row index arrays
+    over the table, so prediction, correction and state changes run once per
+    frame over all affected rows instead of once per track object.
+    """
+
+    _columns = (
+        "mean",
+        "covariance",
+        "track_id",
+        "state",
+        "is_activated",
+        "score",
+        "det_index",
+        "frame_id",
+        "start_frame",
+        "tracklet_len",
+    )
+
+    def __init__(self, kalman_filter):
+        self.kalman_filter = kalman_filter
+        self.mean = np.empty((0, 8), dtype=np.float64)
+        self.covariance = np.empty((0, 8, 8), dtype=np.float64)
+        self.track_id = np.empty(0, dtype=np.int64)
+        self.state = np.empty(0, dtype=np.int8)
+        self.is_activated = np.empty(0, dtype=bool)
+        self.score = np.empty(0, dtype=np.float64)
+        self.det_index = np.empty(0, dtype=np.int64)
+        self.frame_id = np.empty(0, dtype=np.int64)
+        self.start_frame = np.empty(0, dtype=np.int64)
+        self.tracklet_len = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.track_id)
+
+    def rows(self, state):
+        """Row indices of the tracks in `state`, in table order."""
+        return np.flatnonzero(self.state == state)
+
+    def add(self, tlbrs, scores, det_indices, track_ids, frame_id):
+        """
+        Start new tracks from unmatched detections.
+
+        Args:
+            tlbrs (numpy.ndarray): (N, 4) boxes as (x1, y1, x2, y2).
+            scores (numpy.ndarray): (N,) detection scores.
+            det_indices (numpy.ndarray): (N,) rows of the detections in the
+                tracker input.
+            track_ids (numpy.ndarray): (N,) IDs of the new tracks.
+            frame_id (int): Current frame.
+        """
+        n = len(tlbrs)
+        if n == 0:
+            return
+        mean, covariance = self.kalman_filter.multi_initiate(tlbr_to_xyah(tlbrs))
+        self.mean = np.concatenate([self.mean, mean])
+        self.covariance = np.concatenate([self.covariance, covariance])
+        self.track_id = np.concatenate([self.track_id, track_ids])
+        self.state = np.concatenate([self.state, np.full(n, TrackState.Tracked, dtype=np.int8)])
+        # Only tracks started on the first frame are confirmed right away
+        self.is_activated = np.concatenate([self.is_activated, np.full(n, frame_id == 1)])
+        self.score = np.concatenate([self.score, scores])
+        self.det_index = np.concatenate([self.det_index, det_indices])
+        self.frame_id = np.concatenate([self.frame_id, np.full(n, frame_id)])
+        self.start_frame = np.concatenate([self.start_frame, np.full(n, frame_id)])
+        self.tracklet_len = np.concatenate([self.tracklet_len, np.zeros(n, dtype=np.int64)])
+
+    def predict(self, rows):
+        """Run the Kalman prediction step for `rows`; lost tracks stop growing."""
+        if len(rows) == 0:
+            return
+        mean = self.mean[rows]
+        mean[self.state[rows] != TrackState.Tracked, 7] = 0
+        self.mean[rows], self.covariance[rows] = self.kalman_filter.multi_predict(
+            mean, self.covariance[rows]
+        )
+
+    def update(self, rows, tlbrs, scores, det_indices, frame_id):
+        """
+        Correct `rows` with their matched detections.
+
+        Tracked rows extend their tracklet; lost rows are re-activated with a
+        fresh tracklet, as STrack.update / STrack.re_activate did.
+        """
+        if len(rows) == 0:
+            return
+        self.mean[rows], self.covariance[rows] = self.kalman_filter.multi_update(
+            self.mean[rows], self.covariance[rows], tlbr_to_xyah(tlbrs)
+        )
+        refound = self.state[rows] != TrackState.Tracked
+        self.tracklet_len[rows] = np.where(refound, 0, self.tracklet_len[rows] + 1)
+        self.state[rows] = TrackState.Tracked
+        self.is_activated[rows] = True
+        self.score[rows] = scores
+        self.det_index[rows] = det_indices
+        self.frame_id[rows] = frame_id
+
+    def tlwh(self, rows=slice(None)):
+        """Current boxes of `rows` as (top left x, top left y, width, height)."""
+        ret = self.mean[rows, :4].copy()
+        ret[:, 2] *= ret[:, 3]
+        ret[:, :2] -= ret[:, 2:] / 2
+        return ret
+
+    def tlbr(self, rows=slice(None)):
+        """Current boxes of `rows` as (min x, min y, max x, max y)."""
+        ret = self.tlwh(rows)
+        ret[:, 2:] += ret[:, :2]
+        return ret
+
+    def drop_removed(self):
+        """Forget removed tracks; their IDs are never handed out again."""
+        keep = self.state != TrackState.Removed
+        if keep.all():
+            return
+        for column in self._columns:
+            setattr(self, column, getattr(self, column)[keep])
+
+
+def tlbr_to_xyah(tlbrs):
+    """Convert (N, 4) boxes from (x1, y1, x2, y2) to (center x, center y, w / h, h)."""
+    tlbrs = np.asarray(tlbrs, dtype=np.float64).reshape(-1, 4)
+    ret = np.empty_like(tlbrs)
+    wh = tlbrs[:, 2:] - tlbrs[:, :2]
+    ret[:, :2] = tlbrs[:, :2] + wh / 2
+    ret[:, 2] = wh[:, 0] / wh[:, 1]
+    ret[:, 3] = wh[:, 1]
+    return ret
@@ -1,3 +1,5 @@
+import os
+import sys
 import threading
 import time
 
@@ -5,16 +7,22 @@ import cv2
 import numpy as np
 import torch
 import yaml
-from torchvision import transforms
 
-from face_alignment.alignment import norm_crop
+from face_alignment.alignment import norm_crop_batch
 from face_detection.scrfd.detector import SCRFD
 # from face_detection.yolov5_face.detector import Yolov5Face
+from face_recognition.arcface.gallery import Gallery
 from face_recognition.arcface.model import iresnet_inference
-from face_recognition.arcface.utils import compare_encodings, read_features
+from face_recognition.arcface.utils import read_features
+from face_recognition.track_cache import TrackRecognitionCache, face_quality
+from face_tracking.frame_channel import FrameChannel, FrameSnapshot
 from face_tracking.tracker.byte_tracker import BYTETracker
 from face_tracking.tracker.visualize import plot_tracking
 
+# camera_stream.py lives at the repository root, shared with the Flask apps
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from camera_stream import CameraStream  # noqa: E402
+
 # Device configuration
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -30,17 +38,27 @@ recognizer = iresnet_inference(
 # Load precomputed face features and names
 images_names, images_embs = read_features(feature_path="./datasets/face_features/feature")
 
+# Gallery codes: "float32" is the fastest; "float16" and "int8" use 1/2 and
+# 1/4 of the memory, with exact re-ranking of the best candidates
+GALLERY_STORAGE = "float32"
+gallery = Gallery(images_names, images_embs, storage=GALLERY_STORAGE, rerank=10)
+
 # Mapping of face IDs to names
 id_face_mapping = {}
 
-# Data mapping for tracking information
-data_mapping = {
-    "raw_image": [],
-    "tracking_ids": [],
-    "detection_bboxes": [],
-    "detection_landmarks": [],
-    "tracking_bboxes": [],
-}
+# Per-track recognition results; known faces are only re-checked on a
+# low score, a better-quality face or after the TTL
+recognition_cache = TrackRecognitionCache(confident_score=0.6, quality_gain=1.25, ttl=5.0)
+
+# Handoff of tracked frames from the tracking thread to the recognition workers
+frame_channel = FrameChannel()
+
+# Number of recognition worker threads consuming the frame channel
+num_recognition_workers = 1
+
+# Highest frame sequence number used to evict removed tracks
+last_evicted_seq = -1
+evict_lock = threading.Lock()
 
 # Flag global untuk menghentikan thread
 stop_threads = False
@@ -85,6 +103,8 @@ def process_tracking(frame, detector, tracker, args, frame_id, fps):
     tracking_ids = []
     tracking_scores = []
     tracking_bboxes = []
+    tracking_det_indices = []
+    active_track_ids = []
 
     if outputs is not None:
         online_targets = tracker.update(
@@ -102,6 +122,10 @@ def process_tracking(frame, detector, tracker, args, frame_id, fps):
                 tracking_tlwhs.append(tlwh)
                 tracking_ids.append(tid)
                 tracking_scores.append(t.score)
+                # Only tracks updated in this frame point at a current detection
+                tracking_det_indices.append(t.det_index if t.frame_id == tracker.frame_id else -1)
+
+        active_track_ids = tracker.active_track_ids()
 
         tracking_image = plot_tracking(
             img_info["raw_img"],
@@ -114,103 +138,66 @@ def process_tracking(frame, detector, tracker, args, frame_id, fps):
     else:
         tracking_image = img_info["raw_img"]
 
-    data_mapping["raw_image"] = img_info["raw_img"]
-    data_mapping["detection_bboxes"] = bboxes
-    data_mapping["detection_landmarks"] = landmarks
-    data_mapping["tracking_ids"] = tracking_ids
-    data_mapping["tracking_bboxes"] = tracking_bboxes
+    # Publish an immutable snapshot of this frame for the recognition workers
+    frame_channel.publish(
+        FrameSnapshot(
+            seq=frame_id,
+            timestamp=time.monotonic(),
+            raw_image=img_info["raw_img"],
+            detection_bboxes=bboxes,
+            detection_scores=outputs[:, 4].numpy() if outputs is not None else None,
+            detection_landmarks=landmarks,
+            tracking_ids=tuple(tracking_ids),
+            tracking_bboxes=tuple(tracking_bboxes),
+            tracking_det_indices=tuple(tracking_det_indices),
+            active_track_ids=tuple(active_track_ids),
+        )
+    )
 
     return tracking_image
 
 
 @torch.no_grad()
-def get_feature(face_image):
+def get_features(face_images):
     """
-    Extract features from a face image.
+    Extract features from a batch of aligned face images.
 
     Args:
-        face_image: The input face image.
+        face_images (numpy.ndarray): Aligned BGR faces of shape (N, 112, 112, 3).
 
     Returns:
-        numpy.ndarray: The extracted features.
+        numpy.ndarray: The extracted features, one row per face.
     """
-    face_preprocess = transforms.Compose(
-        [
-            transforms.ToTensor(),
-            transforms.Resize((112, 112)),
-            transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5]),
-        ]
-    )
+    # BGR to RGB, HWC to CHW and scale to [-1, 1] (ToTensor + Normalize(0.5, 0.5))
+    face_images = torch.from_numpy(np.ascontiguousarray(face_images[..., ::-1]))
+    face_images = face_images.permute(0, 3, 1, 2).to(device).float().div_(127.5).sub_(1.0)
 
-    # Convert to RGB
-    face_image = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB)
-
-    # Preprocess image (BGR)
-    face_image = face_preprocess(face_image).unsqueeze(0).to(device)
-
-    # Inference to get feature
-    emb_img_face = recognizer(face_image).cpu().numpy()
+    # Inference to get features for the whole batch
+    emb_img_faces = recognizer(face_images).cpu().numpy()
 
     # Convert to array
-    images_emb = emb_img_face / np.linalg.norm(emb_img_face)
+    images_emb = emb_img_faces / np.linalg.norm(emb_img_faces, axis=1, keepdims=True)
 
     return images_emb
 
 
-def recognition(face_image):
+def recognition(query_emb):
     """
-    Recognize a face image.
+    Recognize a face from its embedding.
 
     Args:
-        face_image: The input face image.
+        query_emb: The normalized face embedding.
 
     Returns:
         tuple: A tuple containing the recognition score and name.
     """
-    # Get feature from face
-    query_emb = get_feature(face_image)
-
-    score, id_min = compare_encodings(query_emb, images_embs)
-    name = images_names[id_min]
-    score = score[0]
+    scores, ids = gallery.search(query_emb)
+    name = images_names[ids[0]]
+    score = scores[0]
 
     return score, name
 
 
-def mapping_bbox(box1, box2):
-    """
-    Calculate the Intersection over Union (IoU) between two bounding boxes.
-
-    Args:
-        box1 (tuple): The first bounding box (x_min, y_min, x_max, y_max).
-        box2 (tuple): The second bounding box (x_min, y_min, x_max, y_max).
-
-    Returns:
-        float: The IoU score.
-    """
-    # Calculate the intersection area
-    x_min_inter = max(box1[0], box2[0])
-    y_min_inter = max(box1[1], box2[1])
-    x_max_inter = min(box1[2], box2[2])
-    y_max_inter = min(box1[3], box2[3])
-
-    intersection_area = max(0, x_max_inter - x_min_inter + 1) * max(
-        0, y_max_inter - y_min_inter + 1
-    )
-
-    # Calculate the area of each bounding box
-    area_box1 = (box1[2] - box1[0] + 1) * (box1[3] - box1[1] + 1)
-    area_box2 = (box2[2] - box2[0] + 1) * (box2[3] - box2[1] + 1)
-
-    # Calculate the union area
-    union_area = area_box1 + area_box2 - intersection_area
-
-    # Calculate IoU
-    iou = intersection_area / union_area
-
-    return iou
-
-
 def tracking(detector, args):
     """
     Face tracking in a separate thread.
@@ -231,12 +218,21 @@ def tracking(detector, args):
     tracker = BYTETracker(args=args, frame_rate=30)
     frame_id = 0
 
-    cap = cv2.VideoCapture(1)
+    # Frames are grabbed in the background, so detection always runs on the
+    # newest frame instead of one that waited in the camera buffer
+    camera = CameraStream(1, name="face").start()
+    last_seq = 0
 
     while not stop_threads:
-        _, img = cap.read()
+        item = camera.read(last_seq, timeout=0.5)
+        if item is None:
+            if camera.closed:
+                break
+            continue
+        last_seq, _, img = item
 
         tracking_image = process_tracking(img, detector, tracker, args, frame_id, fps)
+        frame_id += 1
 
         # Calculate and display the frame rate
         frame_count += 1
@@ -253,44 +249,81 @@ def tracking(detector, args):
             stop_threads = True
             break
 
-    cap.release()
+    # Wake up the recognition workers so they can exit
+    frame_channel.close()
+
+    camera.stop()
     cv2.destroyAllWindows()
 
 
 def recognize():
-    """Face recognition in a separate thread."""
-    global stop_threads
-    while not stop_threads:
-        raw_image = data_mapping["raw_image"]
-        detection_landmarks = data_mapping["detection_landmarks"]
-        detection_bboxes = data_mapping["detection_bboxes"]
-        tracking_ids = data_mapping["tracking_ids"]
-        tracking_bboxes = data_mapping["tracking_bboxes"]
-
-        for i in range(len(tracking_bboxes)):
-            for j in range(len(detection_bboxes)):
-                mapping_score = mapping_bbox(box1=tracking_bboxes[i], box2=detection_bboxes[j])
-                if mapping_score > 0.9:
-                    face_alignment = norm_crop(img=raw_image, landmark=detection_landmarks[j])
-
-                    score, name = recognition(face_image=face_alignment)
-                    if name is not None:
-                        if score < 0.5:
-                            caption = "UN_KNOWN"
-                        else:
-                            caption = f"{name}:{score:.2f}"
-
-                    id_face_mapping[tracking_ids[i]] = caption
-
-                    detection_bboxes = np.delete(detection_bboxes, j, axis=0)
-                    detection_landmarks = np.delete(detection_landmarks, j, axis=0)
-
-                    break
+    """
+    Face recognition in a separate thread.
 
-        if not tracking_bboxes:
-            print("Waiting for a person...")
-        else:
-            print("Person detected!")
+    Waits on the frame channel instead of polling, so the thread sleeps while
+    no new frame is available and every frame is recognized at most once.
+    Several of these threads can run as a worker pool.
+    """
+    global last_evicted_seq
+    person_in_view = None
+    while not stop_threads:
+        snapshot = frame_channel.take(timeout=0.5)
+        if snapshot is None:
+            if frame_channel.closed:
+                break
+            continue
+
+        raw_image = snapshot.raw_image
+        detection_landmarks = snapshot.detection_landmarks
+        detection_bboxes = snapshot.detection_bboxes
+        detection_scores = snapshot.detection_scores
+        tracking_ids = snapshot.tracking_ids
+        tracking_bboxes = snapshot.tracking_bboxes
+        tracking_det_indices = snapshot.tracking_det_indices
+
+        # Forget tracks that ByteTrack has removed; only the newest frame may
+        # evict, so a worker finishing an older frame cannot drop new tracks
+        with evict_lock:
+            if snapshot.seq > last_evicted_seq:
+                last_evicted_seq = snapshot.seq
+                for track_id in recognition_cache.evict(snapshot.active_track_ids):
+                    id_face_mapping.pop(track_id, None)
+
+        # Every track carries the row of the detection it was updated with, so
+        # tracks and detections are paired directly without re-matching boxes
+        matched_ids = []
+        matched_landmarks = []
+        matched_qualities = []
+        for track_id, j in zip(tracking_ids, tracking_det_indices):
+            if j < 0 or j >= len(detection_bboxes):
+                continue
+            quality = face_quality(detection_bboxes[j], detection_scores[j])
+            if recognition_cache.needs_recognition(track_id, quality):
+                matched_ids.append(track_id)
+                matched_landmarks.append(detection_landmarks[j])
+                matched_qualities.append(quality)
+
+        if matched_ids:
+            # Align all matched faces at once and embed them as one batch
+            face_alignments = norm_crop_batch(img=raw_image, landmarks=np.array(matched_landmarks))
+            query_embs = get_features(face_alignments)
+
+            for track_id, query_emb, quality in zip(matched_ids, query_embs, matched_qualities):
+                score, name = recognition(query_emb=query_emb)
+                entry = recognition_cache.update(track_id, query_emb, score, name, quality)
+                score, name = entry["score"], entry["name"]
+                if name is not None:
+                    if score < 0.5:
+                        caption = "UN_KNOWN"
+                    else:
+                        caption = f"{name}:{score:.2f}"
+
+                id_face_mapping[track_id] = caption
+
+        # Only report changes instead of printing every frame
+        if person_in_view != bool(tracking_bboxes):
+            person_in_view = bool(tracking_bboxes)
+            print("Person detected!" if person_in_view else "Waiting for a person...")
 
 
 def main():
@@ -308,13 +341,17 @@ def main():
     )
     thread_track.start()
 
-    # Start recognition thread
-    thread_recognize = threading.Thread(target=recognize)
-    thread_recognize.start()
+    # Start recognition worker threads
+    threads_recognize = [
+        threading.Thread(target=recognize) for _ in range(num_recognition_workers)
+    ]
+    for thread_recognize in threads_recognize:
+        thread_recognize.start()
 
-    # Tunggu kedua thread selesai
+    # Tunggu semua thread selesai
     thread_track.join()
-    thread_recognize.join()
+    for thread_recognize in threads_recognize:
+        thread_recognize.join()
 
 
 if __name__ == "__main__":
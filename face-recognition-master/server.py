@@ -0,0 +1,451 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime
+
+import numpy as np
+import paho.mqtt.client as mqtt
+import torch
+import yaml
+
+from face_alignment.alignment import norm_crop_batch
+from face_detection.scrfd.detector import SCRFD
+from face_recognition.arcface.gallery import STORAGE_TYPES, Gallery
+from face_recognition.arcface.model import iresnet_inference
+from face_recognition.arcface.utils import read_features
+from face_recognition.track_cache import TrackRecognitionCache, face_quality
+from face_tracking.tracker import BYTETracker
+
+# camera_stream.py lives at the repository root, shared with the Flask apps
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import camera_stream  # noqa: E402
+import memory  # noqa: E402
+import metrics  # noqa: E402
+from mqtt_publisher import ResultPublisher  # noqa: E402
+from profiler import Profiler, command_authorized  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Recognition results of camera <name> are published to "<topic>-<name>",
+# following the "mqtt-<task>-result" topics of the Flask apps
+FACE_RESULT_TOPIC = "mqtt-face-result"
+# Profile capture commands, as in app4.py: {"token": "<admin token>", "seconds": 10, "memory": true}.
+# Only subscribed when the ADMIN_TOKEN environment variable is set
+PROFILE_TOPIC = "mqtt-admin-profile"
+PROFILE_RESULT_TOPIC = "mqtt-admin-profile-result"
+
+
+class FaceStream:
+    """
+    One camera: a `camera_stream.CameraStream` reader plus the per-camera
+    tracking state.
+
+    The reader keeps only the newest frame of the camera, so the inference
+    loop always gets the latest frame of each camera and frames that arrive
+    while it is busy are dropped instead of queued. Every stream owns its
+    tracker (and therefore its track IDs) and its recognition cache; the
+    models are shared by all streams.
+    """
+
+    def __init__(self, name, source, tracker_args, frame_ready, loop=False, decimation=1, reconnect_delay=2.0):
+        """
+        Args:
+            name (str): Camera ID used in the published results.
+            source (str): Device index, video file, RTSP/HTTP URL or "dir:<path>".
+            tracker_args (dict): ByteTrack configuration.
+            frame_ready (threading.Event): Set whenever a new frame is published.
+            loop (bool): Restart files and image directories at the end.
+            decimation (int): Only decode every n-th frame of the source.
+            reconnect_delay (float): Seconds to wait before reopening a live source.
+        """
+        self.name = name
+        self.tracker_args = tracker_args
+        self.capture = camera_stream.CameraStream(
+            source,
+            name=name,
+            decimation=decimation,
+            loop=loop,
+            reconnect_delay=reconnect_delay,
+            on_frame=lambda capture: frame_ready.set(),
+        )
+        self.tracker = BYTETracker(args=tracker_args, frame_rate=30)
+        self.recognition_cache = TrackRecognitionCache(
+            confident_score=0.6, quality_gain=1.25, ttl=5.0
+        )
+        self.last_seq = 0
+        self.frames_processed = 0
+
+    def start(self):
+        self.capture.start()
+
+    def stop(self):
+        self.capture.stop(timeout=1.0)
+
+    def take(self):
+        """Newest unseen frame as (seq, timestamp, frame), or None."""
+        item = self.capture.read(self.last_seq, timeout=0)
+        if item is not None:
+            if self.last_seq:
+                metrics.count_dropped("face", item[0] - self.last_seq - 1, camera=self.name)
+            self.last_seq = item[0]
+        return item
+
+    @property
+    def finished(self):
+        """True once the reader has exited and its last frame was taken."""
+        return self.capture.closed and self.capture.seq == self.last_seq
+
+
+class FacePipelineServer:
+    """
+    Headless face detection, tracking and recognition for several cameras.
+
+    A single inference loop serves all streams round-robin: every pass takes
+    the newest frame of each camera that has one, runs the shared SCRFD
+    detector and the camera's tracker on it, then embeds the faces of all
+    cameras that need recognition in one ArcFace batch. Results are published
+    per camera over MQTT.
+    """
+
+    def __init__(
+        self,
+        streams,
+        detector,
+        recognizer,
+        gallery,
+        publish,
+        device,
+        frame_ready,
+        recognition_threshold=0.5,
+    ):
+        """
+        Args:
+            streams (list[FaceStream]): Cameras to serve.
+            detector (SCRFD): Shared face detector.
+            recognizer: Shared ArcFace model.
+            gallery (Gallery): Enrolled faces.
+            publish (callable): publish(topic, result) queueing a result dict for publishing.
+            device (torch.device): Device of the recognizer.
+            frame_ready (threading.Event): Event the streams set on every new frame.
+            recognition_threshold (float): Minimum score to report a name.
+        """
+        self.streams = streams
+        self.detector = detector
+        self.recognizer = recognizer
+        self.gallery = gallery
+        self.publish = publish
+        self.device = device
+        self.recognition_threshold = recognition_threshold
+        self.frame_ready = frame_ready
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+        for stream in self.streams:
+            stream.stop()
+        self.frame_ready.set()
+
+    def run(self):
+        for stream in self.streams:
+            stream.start()
+
+        while not self._stop.is_set():
+            self.frame_ready.wait(timeout=0.5)
+            self.frame_ready.clear()
+
+            frames = []
+            for stream in self.streams:
+                item = stream.take()
+                if item is not None:
+                    frames.append((stream, item))
+            if frames:
+                self.process(frames)
+            elif all(stream.finished for stream in self.streams):
+                break
+
+    @torch.no_grad()
+    def get_features(self, face_images):
+        """Embed a batch of aligned BGR faces of shape (N, 112, 112, 3)."""
+        face_images = torch.from_numpy(np.ascontiguousarray(face_images[..., ::-1]))
+        face_images = face_images.permute(0, 3, 1, 2).to(self.device).float().div_(127.5).sub_(1.0)
+        emb_img_faces = self.recognizer(face_images).cpu().numpy()
+        return emb_img_faces / np.linalg.norm(emb_img_faces, axis=1, keepdims=True)
+
+    def track(self, stream, frame):
+        """
+        Detect and track the faces of one frame.
+
+        Returns:
+            tuple: (tracks, pending) where tracks lists (track_id, bbox) of the
+            visible tracks and pending lists the faces to recognize as
+            (track_id, landmarks, quality).
+        """
+        with metrics.stage("detect", model="scrfd"):
+            outputs, img_info, bboxes, landmarks = self.detector.detect_tracking(image=frame)
+        tracks, pending = [], []
+        if outputs is None:
+            return tracks, pending
+
+        args = stream.tracker_args
+        tracker = stream.tracker
+        with metrics.stage("track", model="bytetrack"):
+            online_targets = tracker.update(outputs, [img_info["height"], img_info["width"]], (128, 128))
+
+        for t in online_targets:
+            tlwh = t.tlwh
+            vertical = tlwh[2] / tlwh[3] > args["aspect_ratio_thresh"]
+            if tlwh[2] * tlwh[3] <= args["min_box_area"] or vertical:
+                continue
+            x1, y1, w, h = tlwh
+            tracks.append((t.track_id, [float(x1), float(y1), float(x1 + w), float(y1 + h)]))
+
+            # Only tracks updated in this frame point at a current detection
+            j = t.det_index if t.frame_id == tracker.frame_id else -1
+            if 0 <= j < len(bboxes):
+                quality = face_quality(bboxes[j], outputs[j, 4])
+                if stream.recognition_cache.needs_recognition(t.track_id, quality):
+                    pending.append((t.track_id, landmarks[j], quality))
+
+        stream.recognition_cache.evict(tracker.active_track_ids())
+        return tracks, pending
+
+    def process(self, frames):
+        """Run one scheduling pass over the newest frame of each camera."""
+        tracked = []
+        for stream, (_, _, frame) in frames:
+            with metrics.context(camera=stream.name):
+                tracked.append(self.track(stream, frame))
+
+        # Cross-stream batch: align per frame, embed every camera's faces at once
+        aligned, owners = [], []
+        for (stream, (_, _, frame)), (_, pending) in zip(frames, tracked):
+            if pending:
+                with metrics.stage("align", camera=stream.name):
+                    aligned.append(norm_crop_batch(frame, np.array([p[1] for p in pending])))
+                owners.extend((stream, track_id, quality) for track_id, _, quality in pending)
+        if aligned:
+            # The batch serves several cameras, so it is not labelled with one
+            with metrics.stage("embed", model="arcface", camera=""):
+                query_embs = self.get_features(np.concatenate(aligned))
+            for (stream, track_id, quality), query_emb in zip(owners, query_embs):
+                with metrics.stage("search", model="gallery", camera=stream.name):
+                    scores, ids = self.gallery.search(query_emb)
+                stream.recognition_cache.update(
+                    track_id, query_emb, scores[0], self.gallery.names[ids[0]], quality
+                )
+
+        for (stream, (seq, timestamp, _)), (tracks, _) in zip(frames, tracked):
+            stream.frames_processed += 1
+            with metrics.context(camera=stream.name):
+                self.publish_result(stream, seq, timestamp, tracks)
+
+    def publish_result(self, stream, seq, timestamp, tracks):
+        faces = []
+        for track_id, bbox in tracks:
+            entry = stream.recognition_cache.get(track_id)
+            name, score = None, None
+            if entry is not None:
+                score = entry["score"]
+                name = str(entry["name"]) if score >= self.recognition_threshold else "UN_KNOWN"
+            faces.append({"track_id": int(track_id), "bbox": bbox, "name": name, "score": score})
+
+        result = {
+            "camera": stream.name,
+            "frame": seq,
+            "timestamp": str(datetime.fromtimestamp(timestamp)),
+            "num_faces": len(faces),
+            "faces": faces,
+        }
+        self.publish(f"{FACE_RESULT_TOPIC}-{stream.name}", result)
+
+
+def load_config(file_name):
+    with open(file_name, "r") as stream:
+        return yaml.safe_load(stream)
+
+
+def parse_source(index, value):
+    """Parse "<name>=<source>" (or a bare source, named cam<index>)."""
+    name, sep, spec = value.partition("=")
+    if not sep or "://" in name:
+        name, spec = f"cam{index}", value
+    return name, spec
+
+
+def connect_mqtt(host, port):
+    """Connect a paho client with a background network loop."""
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    else:
+        client = mqtt.Client()
+    client.connect(host, port)
+    client.loop_start()
+    return client
+
+
+def subscribe_profile_commands(client, profiler, token):
+    """
+    Start a profile capture for every message on PROFILE_TOPIC carrying the
+    admin token and publish where it was written.
+
+    Args:
+        client (paho.mqtt.client.Client): Connected MQTT client.
+        profiler (Profiler): Profiler running the captures.
+        token (str): Admin token the commands must carry in their "token" field.
+    """
+
+    def reply(status, path):
+        client.publish(PROFILE_RESULT_TOPIC, json.dumps({"status": status, "path": path}))
+
+    def on_message(client, userdata, message):
+        try:
+            params = json.loads(message.payload.decode("utf-8") or "{}")
+            if not command_authorized(params, token):
+                logger.warning("Ignoring profile command without a valid admin token")
+                return
+            if profiler.start_from(params, on_done=lambda path: reply("done" if path else "failed", path)) is None:
+                reply("busy", profiler.current)
+        except ValueError as e:
+            logger.error(f"Invalid profile command: {e}")
+
+    # Subscribed again after a reconnect
+    client.on_connect = lambda client, *args: client.subscribe(PROFILE_TOPIC)
+    client.message_callback_add(PROFILE_TOPIC, on_message)
+    client.subscribe(PROFILE_TOPIC)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless multi-camera face recognition server.")
+    parser.add_argument(
+        "--source",
+        action="append",
+        required=True,
+        help='Camera as "<name>=<source>": device index, video file, RTSP URL or dir:<images>. Repeatable.',
+    )
+    parser.add_argument("--loop", action="store_true", help="Replay video files and image directories.")
+    parser.add_argument("--decimation", type=int, default=1, help="Only process every n-th frame of each camera.")
+    parser.add_argument("--mqtt-host", type=str, default="localhost", help="MQTT broker host.")
+    parser.add_argument("--mqtt-port", type=int, default=1883, help="MQTT broker port.")
+    parser.add_argument("--no-mqtt", action="store_true", help="Print results instead of publishing them.")
+    parser.add_argument("--mqtt-qos", type=int, choices=[0, 1, 2], default=0, help="QoS of the published results.")
+    parser.add_argument(
+        "--batch-interval",
+        type=float,
+        default=None,
+        help=f"Publish the results of all cameras as one message on {FACE_RESULT_TOPIC}-batch per interval (s).",
+    )
+    parser.add_argument(
+        "--publish-queue", type=int, default=1024, help="Results queued for publishing before the oldest are dropped."
+    )
+    parser.add_argument(
+        "--tracking-config",
+        type=str,
+        default="./face_tracking/config/config_tracking.yaml",
+        help="ByteTrack configuration file.",
+    )
+    parser.add_argument(
+        "--features-path",
+        type=str,
+        default="./datasets/face_features/feature",
+        help="Path of the enrolled face features.",
+    )
+    parser.add_argument(
+        "--gallery-storage",
+        type=str,
+        choices=STORAGE_TYPES,
+        default="float32",
+        help="Gallery codes; float16 and int8 save memory at some search speed.",
+    )
+    parser.add_argument(
+        "--recognition-threshold", type=float, default=0.5, help="Minimum score to report a name."
+    )
+    parser.add_argument(
+        "--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port at /metrics."
+    )
+    parser.add_argument(
+        "--memory-budget-mb", type=int, default=None, help="RSS above which a full garbage collection is run."
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=str,
+        default="profiles",
+        help=f"Directory of the captures requested on {PROFILE_TOPIC} (only with ADMIN_TOKEN set).",
+    )
+    opt = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    detector = SCRFD(model_file="face_detection/scrfd/weights/scrfd_2.5g_bnkps.onnx")
+    recognizer = iresnet_inference(
+        model_name="r100", path="face_recognition/arcface/weights/arcface_r100.pth", device=device
+    )
+    images_names, images_embs = read_features(feature_path=opt.features_path)
+    gallery = Gallery(images_names, images_embs, storage=opt.gallery_storage, rerank=10)
+
+    if opt.no_mqtt:
+        client = None
+        publish = lambda topic, payload, qos: print(topic, payload, flush=True)  # noqa: E731
+    else:
+        client = connect_mqtt(opt.mqtt_host, opt.mqtt_port)
+        publish = client.publish
+        # Captures expose stack frames and source paths, so the command topic
+        # is only subscribed with a token to check the commands against
+        admin_token = os.environ.get("ADMIN_TOKEN")
+        if admin_token:
+            subscribe_profile_commands(client, Profiler(opt.profile_dir), admin_token)
+    # Results of all cameras go through one outbound queue; with --batch-interval
+    # they are coalesced into one message on "<topic>-batch" per interval
+    batch_topic = f"{FACE_RESULT_TOPIC}-batch"
+    publisher = ResultPublisher(
+        publish,
+        default_qos=opt.mqtt_qos,
+        batch_topic=(lambda topic: batch_topic) if opt.batch_interval else None,
+        batch_interval=opt.batch_interval or 0.5,
+        max_queue=opt.publish_queue,
+    ).start()
+
+    tracker_args = load_config(opt.tracking_config)
+    frame_ready = threading.Event()
+    streams = []
+    for index, value in enumerate(opt.source):
+        name, source = parse_source(index, value)
+        streams.append(
+            FaceStream(name, source, tracker_args, frame_ready, loop=opt.loop, decimation=opt.decimation)
+        )
+
+    server = FacePipelineServer(
+        streams,
+        detector,
+        recognizer,
+        gallery,
+        publisher.submit,
+        device,
+        frame_ready,
+        recognition_threshold=opt.recognition_threshold,
+    )
+    if opt.metrics_port is not None:
+        metrics.start_http_server(opt.metrics_port)
+
+    # Models and gallery are loaded: keep the collector off them from here on
+    memory.tune_gc()
+    memory.install_gc_metrics()
+    memory.MemoryMonitor(budget_bytes=opt.memory_budget_mb and opt.memory_budget_mb << 20).start()
+    logger.info(f"Serving {len(streams)} camera(s): {', '.join(s.name for s in streams)}")
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        publisher.stop()
+        if client is not None:
+            client.loop_stop()
+            client.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,9 +6,21 @@ from pathlib import Path
 import openvino as ov
 import time
 
+import metrics
+
 logging.basicConfig(level=logging.DEBUG)  # Atur level ke DEBUG untuk detail lebih lengkap
 
 
+class FatigueState:
+    """Timer mata tertutup dan mulut terbuka milik satu kamera"""
+
+    def __init__(self):
+        self.close_eye_start_time = 0
+        self.open_mouth_start_time = 0
+        self.is_close_eye = False
+        self.is_open_mouth = False
+
+
 class YOLOv11FatigueDetector:
     _instance = None
 
@@ -104,11 +116,18 @@ class YOLOv11FatigueDetector:
 
             self.det_model.predictor.model.ov_compiled_model = compiled_model
 
+    def detect(self, frame):
+        """Deteksi tanpa mengubah frame, sehingga aman untuk frame bersama (shared memory)"""
+        result = self.det_model(frame)[0]
+        metrics.observe_inference(result.speed, "fatigue", self.device)
+
+        with metrics.stage("nms", model="fatigue"):
+            detections = sv.Detections.from_ultralytics(result).with_nms().with_nmm()
+            return detections[detections.confidence > 0.5]
+
     def detect_and_annotate(self, frame):
         try:
-            result = self.det_model(frame)[0]
-            detections = sv.Detections.from_ultralytics(result).with_nms().with_nmm()
-            detections = detections[detections.confidence > 0.5]
+            detections = self.detect(frame)
             # # Mendapatkan nama kelas
             # class_names = detections['class_name']
             # # Mendapatkan bounding box
@@ -151,17 +170,21 @@ class YOLOv11FatigueDetector:
             #     for class_name, confidence in zip(detections['class_name'], detections.confidence)
             # ]
 
-            frame = self.box_annotator.annotate(scene=frame, detections=detections)
-            frame = self.label_annotator.annotate(scene=frame, detections=detections, labels=labels)
+            with metrics.stage("annotate", model="fatigue"):
+                frame = self.box_annotator.annotate(scene=frame, detections=detections)
+                frame = self.label_annotator.annotate(scene=frame, detections=detections, labels=labels)
 
             return detections, detection_data
         except Exception as e:
             logging.error(f"Error dalam anotasi deteksi: {e}")
             return frame, [0, 0, 0, 0]
 
-    def get_fatigue_category(self, detections):
+    def get_fatigue_category(self, detections, state=None, now=None):
+        # Timer per kamera (FatigueState); tanpa state dipakai timer milik detector.
+        # `now` adalah waktu capture frame bila diketahui
+        state = self if state is None else state
         try:
-            current_time = time.time()
+            current_time = time.time() if now is None else now
             threshold = 0.6
 
             # Hitung jumlah deteksi kelas "closed_eye" dengan confidence > threshold
@@ -183,48 +206,48 @@ class YOLOv11FatigueDetector:
 
             # Jika kelas "closed_eye" terdeteksi minimal 2 kali
             if close_eye_count == 2:
-                if not self.is_close_eye:
-                    self.close_eye_start_time = current_time
-                    self.is_close_eye = True
+                if not state.is_close_eye:
+                    state.close_eye_start_time = current_time
+                    state.is_close_eye = True
                 # Cek durasi mata tertutup
-                if current_time - self.close_eye_start_time >= 3:
+                if current_time - state.close_eye_start_time >= 3:
                     # Cek jika mulut juga terbuka
                     if open_mouth_score > threshold:
-                        if not self.is_open_mouth:
-                            self.open_mouth_start_time = current_time
-                            self.is_open_mouth = True
-                        elif current_time - self.open_mouth_start_time >= 2:
+                        if not state.is_open_mouth:
+                            state.open_mouth_start_time = current_time
+                            state.is_open_mouth = True
+                        elif current_time - state.open_mouth_start_time >= 2:
                             return "Fatigue Detected: Open Mouth and Close Eye"
                     else:
-                        self.is_open_mouth = False
-                        self.open_mouth_start_time = 0
+                        state.is_open_mouth = False
+                        state.open_mouth_start_time = 0
                     return "Fatigue Detected: Close Eye"
             else:
-                self.is_close_eye = False
-                self.close_eye_start_time = 0
+                state.is_close_eye = False
+                state.close_eye_start_time = 0
 
             # Deteksi mulut terbuka
 
             if open_mouth_score > threshold:
-                if not self.is_open_mouth:
-                    self.open_mouth_start_time = current_time
-                    self.is_open_mouth = True
+                if not state.is_open_mouth:
+                    state.open_mouth_start_time = current_time
+                    state.is_open_mouth = True
                 # Cek durasi mulut terbuka
-                if current_time - self.open_mouth_start_time >= 4:
+                if current_time - state.open_mouth_start_time >= 4:
                     # Cek jika mata juga terbuka
                     if close_eye_count == 2:
-                        if not self.is_close_eye:
-                            self.close_eye_start_time = current_time
-                            self.is_close_eye = True
-                        elif current_time - self.close_eye_start_time >= 1:
+                        if not state.is_close_eye:
+                            state.close_eye_start_time = current_time
+                            state.is_close_eye = True
+                        elif current_time - state.close_eye_start_time >= 1:
                             return "Fatigue Detected: Open Mouth and Close Eye"
                     else:
-                        self.is_close_eye = False
-                        self.close_eye_start_time = 0
+                        state.is_close_eye = False
+                        state.close_eye_start_time = 0
                     return "Fatigue Detected: Open Mouth"
             else:
-                self.is_open_mouth = False
-                self.open_mouth_start_time = 0
+                state.is_open_mouth = False
+                state.open_mouth_start_time = 0
 
             # if open_mouth_score > threshold and close_eye_count >= 2:
             #     if not self.is_open_mouth and self.is_close_eye:
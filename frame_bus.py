@@ -0,0 +1,367 @@
+import importlib
+import logging
+import multiprocessing as mp
+import queue
+import sys
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from camera_stream import CameraStream
+from queues import put_latest
+
+logger = logging.getLogger(__name__)
+
+# Metadata of one frame in the ring; only this tuple travels through the queues
+FrameMeta = namedtuple("FrameMeta", ["camera", "slot", "seq", "timestamp"])
+
+
+def _crowd_result(detector, frame):
+    _, detection_data = detector.detect(frame)
+    return {"status": "success", "num_people": len(detection_data), "detections": detection_data}
+
+
+def _fatigue_result(detector, frame):
+    return {"status": detector.get_fatigue_category(detector.detect(frame))}
+
+
+# Inference tasks: (module, detector class, function turning a frame into a result)
+TASKS = {
+    "crowd": ("crowd_detector", "YOLOv11CrowdDetector", _crowd_result),
+    "fatigue": ("fatigue_detector", "YOLOv11FatigueDetector", _fatigue_result),
+}
+
+
+class FrameRing:
+    """
+    Fixed-size frame slots in shared memory, `slots` per camera.
+
+    The segment starts with one int64 sequence number per slot, then one
+    float64 capture timestamp per slot, followed by the pixel data of every
+    slot. A writer marks the slot as being written (-1), copies the frame and
+    then stores the frame's sequence number, so a reader holding `FrameMeta`
+    can check with `valid` that the slot still holds its frame after using
+    the zero-copy `view`.
+    """
+
+    def __init__(self, cameras, slots, shape, name=None):
+        """
+        Args:
+            cameras (int): Number of cameras.
+            slots (int): Slots per camera.
+            shape (tuple): (height, width) of the stored frames.
+            name (str, optional): Attach to an existing ring instead of creating one.
+        """
+        self.cameras = cameras
+        self.slots = slots
+        self.shape = tuple(shape)
+        frame_shape = (cameras, slots, self.shape[0], self.shape[1], 3)
+        seq_size = cameras * slots * np.dtype(np.int64).itemsize
+        header_size = seq_size + cameras * slots * np.dtype(np.float64).itemsize
+        size = header_size + int(np.prod(frame_shape))
+
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.header = np.ndarray((cameras, slots), dtype=np.int64, buffer=self.shm.buf)
+        self.timestamps = np.ndarray((cameras, slots), dtype=np.float64, buffer=self.shm.buf, offset=seq_size)
+        self.frames = np.ndarray(frame_shape, dtype=np.uint8, buffer=self.shm.buf, offset=header_size)
+        if self.owner:
+            self.header[:] = 0
+            self.timestamps[:] = 0
+
+    @property
+    def spec(self):
+        """Picklable arguments to attach to this ring from another process."""
+        return self.cameras, self.slots, self.shape, self.shm.name
+
+    @classmethod
+    def attach(cls, spec):
+        cameras, slots, shape, name = spec
+        return cls(cameras, slots, shape, name=name)
+
+    def write(self, camera, seq, frame, timestamp=0.0):
+        """Copy a BGR frame into the next slot of a camera (resized to the ring shape)."""
+        slot = seq % self.slots
+        self.header[camera, slot] = -1
+        dst = self.frames[camera, slot]
+        if frame.shape[:2] == self.shape:
+            np.copyto(dst, frame)
+        else:
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=dst)
+        self.timestamps[camera, slot] = timestamp
+        self.header[camera, slot] = seq
+        return slot
+
+    def view(self, meta):
+        """Read-only view of the slot of a frame, without copying it."""
+        frame = self.frames[meta.camera, meta.slot]
+        frame.flags.writeable = False
+        return frame
+
+    def valid(self, meta):
+        """True while the slot still holds the frame described by `meta`."""
+        return self.header[meta.camera, meta.slot] == meta.seq
+
+    def latest(self, camera):
+        """`FrameMeta` of the newest complete frame of a camera, or None before the first one."""
+        slot = int(np.argmax(self.header[camera]))
+        seq = int(self.header[camera, slot])
+        if seq <= 0:
+            return None
+        return FrameMeta(camera, slot, seq, float(self.timestamps[camera, slot]))
+
+    def close(self):
+        # Views must be released before the segment can be closed
+        self.header = self.timestamps = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingReader:
+    """
+    Frames of one camera of a `FrameRing`, read like a `CameraStream`.
+
+    Lets consumers in the bus's own process (the MJPEG feeds) follow a
+    camera that a capture process writes into the ring. `read` polls the
+    slot headers for a frame newer than the caller's and returns a private
+    copy of it, taken only if the slot was not overwritten during the copy.
+    """
+
+    def __init__(self, ring, camera, name=None, alive=None, poll_interval=0.005):
+        """
+        Args:
+            ring (FrameRing): Ring the frames are read from.
+            camera (int): Camera index in the ring.
+            name (str, optional): Camera name used in metrics and log messages.
+            alive (callable, optional): alive() -> False once no frame will be
+                written any more (capture process ended).
+            poll_interval (float): Seconds between polls of the slot headers.
+        """
+        self.ring = ring
+        self.camera = camera
+        self.name = name or str(camera)
+        self._alive = alive
+        self.poll_interval = poll_interval
+
+    @property
+    def closed(self):
+        return self.ring.header is None or (self._alive is not None and not self._alive())
+
+    def read(self, last_seq=0, timeout=None):
+        """
+        Wait for a frame newer than `last_seq`.
+
+        Returns:
+            tuple or None: (seq, timestamp, frame), or None on timeout or once
+            the ring is closed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.closed:
+            meta = self.ring.latest(self.camera)
+            if meta is not None and meta.seq > last_seq:
+                frame = self.ring.frames[meta.camera, meta.slot].copy()
+                if self.ring.valid(meta):
+                    return meta.seq, meta.timestamp, frame
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(self.poll_interval)
+        return None
+
+
+def fork_supported():
+    """
+    The bus forks its workers: spawned ones would re-import the app's main
+    module and rebuild the Flask app and detectors in every worker. fork
+    does not exist on Windows and is unsafe on macOS, where system
+    frameworks do not survive a fork.
+    """
+    return "fork" in mp.get_all_start_methods() and sys.platform != "darwin"
+
+
+def capture_worker(ring_spec, camera, source, frame_queues, dropped, stop, decimation=1):
+    """
+    Capture process: decode a camera into the ring and announce every frame
+    to the queue of each inference task. Announcements pushed out of a full
+    queue are counted in the task's `dropped` counter.
+    """
+    ring = FrameRing.attach(ring_spec)
+    stream = CameraStream(source, name=f"bus-{camera}", decimation=decimation).start()
+    last_seq = 0
+    try:
+        while not stop.is_set():
+            item = stream.read(last_seq, timeout=0.5)
+            if item is None:
+                if stream.closed:
+                    break
+                continue
+            last_seq, timestamp, frame = item
+            slot = ring.write(camera, last_seq, frame, timestamp)
+            meta = FrameMeta(camera, slot, last_seq, timestamp)
+            for frame_queue, counter in zip(frame_queues, dropped):
+                n = put_latest(frame_queue, meta)
+                if n:
+                    with counter.get_lock():
+                        counter.value += n
+    finally:
+        stream.stop(timeout=1.0)
+        ring.close()
+
+
+def inference_worker(ring_spec, task, frame_queue, result_queue, dropped, stop):
+    """
+    Inference process: run the detector of `task` on the frames announced in
+    `frame_queue`, reading them straight from the ring, and put
+    (task, meta, result, timings) tuples on `result_queue`. `timings` holds
+    the seconds the frame waited in the queue and spent in the detector, for
+    the metrics of the parent process.
+    """
+    module_name, class_name, run = TASKS[task]
+    detector = getattr(importlib.import_module(module_name), class_name)()
+    ring = FrameRing.attach(ring_spec)
+    try:
+        while not stop.is_set():
+            try:
+                meta = frame_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            start = time.time()
+            if ring.valid(meta):
+                result = run(detector, ring.view(meta))
+                # The slot may have been overwritten while the detector was reading it
+                if ring.valid(meta):
+                    timings = {"queue": start - meta.timestamp, "detect": time.time() - start}
+                    result_queue.put((task, meta, result, timings))
+                    continue
+            logger.debug(f"[{task}] Dropped overwritten frame {meta.seq} of camera {meta.camera}")
+            with dropped.get_lock():
+                dropped.value += 1
+    finally:
+        ring.close()
+
+
+class FrameBus:
+    """
+    Multiprocess camera pipeline: capture processes decode the cameras into
+    a shared-memory `FrameRing` and inference processes run the detectors on
+    the frames in place, so frames are never pickled between processes and
+    decoding and inference run on separate cores instead of sharing the GIL.
+
+    Each task has a small queue of `FrameMeta`; when the detectors fall
+    behind the oldest announcements are dropped, like `CameraStream` drops
+    frames for a slow consumer.
+    """
+
+    def __init__(
+        self,
+        sources,
+        tasks=("crowd", "fatigue"),
+        shape=(480, 640),
+        slots=4,
+        workers_per_task=1,
+        queue_size=2,
+        decimation=1,
+    ):
+        """
+        Args:
+            sources (list): Camera sources, see `camera_stream.open_capture`.
+            tasks (tuple): Inference tasks to run on every frame (keys of `TASKS`).
+            shape (tuple): (height, width) frames are stored at.
+            slots (int): Ring slots per camera; must exceed the frames a task can
+                have queued plus in flight (queue_size + workers_per_task).
+            workers_per_task (int): Inference processes per task.
+            queue_size (int): Frames announced to a task before old ones are dropped.
+            decimation (int): Only decode every n-th frame of each camera.
+        """
+        self.sources = list(sources)
+        self.tasks = tuple(tasks)
+        self.shape = shape
+        self.slots = max(slots, queue_size + workers_per_task + 1)
+        self.workers_per_task = workers_per_task
+        self.queue_size = queue_size
+        self.decimation = decimation
+
+        # Forked workers build their own detectors, so the bus must be started
+        # before any detector or thread pool is created in this process
+        if not fork_supported():
+            raise RuntimeError(f"FrameBus needs the fork start method, which is not usable on {sys.platform}")
+        self._ctx = mp.get_context("fork")
+        self.ring = None
+        self.results = None
+        self._frame_queues = {}
+        self._dropped = {}
+        self._stop = None
+        self._processes = []
+        self._captures = {}
+
+    def start(self):
+        ctx = self._ctx
+        self.ring = FrameRing(len(self.sources), self.slots, self.shape)
+        self.results = ctx.Queue()
+        self._stop = ctx.Event()
+
+        self._frame_queues = {task: ctx.Queue(maxsize=self.queue_size) for task in self.tasks}
+        self._dropped = {task: ctx.Value("Q", 0) for task in self.tasks}
+        for task, frame_queue in self._frame_queues.items():
+            for i in range(self.workers_per_task):
+                self._processes.append(
+                    ctx.Process(
+                        target=inference_worker,
+                        args=(self.ring.spec, task, frame_queue, self.results, self._dropped[task], self._stop),
+                        name=f"inference-{task}-{i}",
+                        daemon=True,
+                    )
+                )
+        for camera, source in enumerate(self.sources):
+            self._captures[camera] = ctx.Process(
+                target=capture_worker,
+                args=(
+                    self.ring.spec,
+                    camera,
+                    source,
+                    [self._frame_queues[task] for task in self.tasks],
+                    [self._dropped[task] for task in self.tasks],
+                    self._stop,
+                    self.decimation,
+                ),
+                name=f"capture-{camera}",
+                daemon=True,
+            )
+            self._processes.append(self._captures[camera])
+        for process in self._processes:
+            process.start()
+        return self
+
+    def reader(self, camera):
+        """`RingReader` of a camera, for consumers in this process."""
+        capture = self._captures[camera]
+        return RingReader(self.ring, camera, name=str(self.sources[camera]),
+                          alive=lambda: capture.is_alive() and not self._stop.is_set())
+
+    def queue_depths(self):
+        """Frames announced to each task and not yet taken by a worker."""
+        return {task: q.qsize() for task, q in self._frame_queues.items()}
+
+    def dropped_counts(self):
+        """Frames each task never produced a result for (queue overflow or overwritten slot)."""
+        return {task: counter.value for task, counter in self._dropped.items()}
+
+    def get_result(self, timeout=None):
+        """Next (task, FrameMeta, result, timings) tuple, or None on timeout."""
+        try:
+            return self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self.ring.close()
@@ -0,0 +1,103 @@
+import struct
+
+import cv2
+import numpy as np
+
+# IMREAD_REDUCED_COLOR_<n> flags by reduction factor; libjpeg scales during
+# the DCT, so a reduced decode is cheaper than a full one
+REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+# JPEG start-of-frame markers (baseline, progressive, ...); C4, C8 and CC are not frames
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(data):
+    """
+    (width, height) from the start-of-frame header of a JPEG, without decoding it.
+
+    Returns:
+        tuple: (width, height), or None when `data` is not a JPEG.
+    """
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    n = len(data)
+    while i + 9 <= n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in _SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[i + 5 : i + 9])
+            return width, height
+        # Every other segment before the frame header carries its length
+        (length,) = struct.unpack(">H", data[i + 2 : i + 4])
+        i += 2 + length
+    return None
+
+
+class FrameDecoder:
+    """
+    Decodes JPEG/PNG payloads into BGR frames sized for the detectors.
+
+    `cv2.imdecode` writes BGR directly, so no colour conversion is needed,
+    and JPEGs whose long side is at least twice `min_size` are decoded at
+    1/2, 1/4 or 1/8 scale with `IMREAD_REDUCED_COLOR_*`: the models resize
+    their input to 640 anyway, so the extra pixels were only decoded to be
+    thrown away, and the decoded frame is up to 64 times smaller. Frames
+    still larger than `max_size` (PNGs, or JPEGs when `max_size` is below
+    twice `min_size`) are resized down.
+
+    Every frame is a new array owned by the caller: the Python binding of
+    `cv2.imdecode` cannot decode into an existing buffer, and a reduced
+    decode is already no larger than the model input. `decode` also returns
+    the size of the encoded image, so coordinates found on the smaller frame
+    can be mapped back to the image the client sent.
+    """
+
+    def __init__(self, min_size=640, max_size=None):
+        """
+        Args:
+            min_size (int): Long side a reduced decode must keep (the model input size).
+            max_size (int, optional): Long side frames are resized down to; None keeps
+                the decoded size.
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def reduction(self, size):
+        """IMREAD flag and factor for an image of (width, height)."""
+        if size is not None:
+            long_side = max(size)
+            for factor, flag in REDUCED_FLAGS:
+                if long_side // factor >= self.min_size:
+                    return flag, factor
+        return cv2.IMREAD_COLOR, 1
+
+    def decode(self, data):
+        """
+        Decode an encoded image.
+
+        Args:
+            data (bytes): JPEG/PNG bytes (any buffer-protocol object).
+
+        Returns:
+            tuple: (frame, (width, height)) with the BGR frame and the size of
+            the encoded image, or (None, None) if `data` could not be decoded.
+        """
+        size = jpeg_size(data)
+        flag, factor = self.reduction(size)
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+        if frame is None:
+            return None, None
+        height, width = frame.shape[:2]
+        if factor == 1 or size is None:
+            size = (width, height)
+        if self.max_size and max(height, width) > self.max_size:
+            scale = self.max_size / max(height, width)
+            frame = cv2.resize(
+                frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA
+            )
+        return frame, size
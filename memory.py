@@ -0,0 +1,249 @@
+"""
+Memory budgets and garbage collector tuning for the serving processes.
+
+The serving path allocates large, short-lived NumPy frames and few
+reference cycles, so the collector mostly spends its time traversing the
+long-lived model objects. `tune_gc` freezes everything allocated at startup
+and raises the collection thresholds, `install_gc_metrics` records the
+pause of every collection, `BudgetCache` bounds caches by bytes instead of
+entries, and `MemoryMonitor` samples the RSS (and tracemalloc, when
+tracing) into metrics and runs a full collection only when the process
+exceeds its budget:
+
+    memory.tune_gc()
+    memory.install_gc_metrics()
+    memory.MemoryMonitor(budget_bytes=2 << 30).start()
+"""
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import OrderedDict
+
+import metrics
+
+try:
+    import psutil
+except ImportError:  # optional: /proc is read instead, which only exists on Linux
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+GC_PAUSE_SECONDS = metrics.REGISTRY.histogram(
+    "python_gc_pause_seconds",
+    "Duration of garbage collections.",
+    ("generation",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+)
+RSS_BYTES = metrics.REGISTRY.gauge("process_resident_memory_bytes", "Resident set size of the process.")
+TRACED_BYTES = metrics.REGISTRY.gauge(
+    "python_tracemalloc_bytes", "Memory traced by tracemalloc, total and per top allocation site.", ("site",)
+)
+BUDGET_EXCEEDED = metrics.REGISTRY.counter(
+    "memory_budget_exceeded_total", "Samples where the RSS exceeded the memory budget."
+)
+
+# Caches reported by the cache metrics; weak so dropped caches disappear
+_caches = weakref.WeakSet()
+
+
+def _cache_values(attribute):
+    return {(cache.name,): getattr(cache, attribute) for cache in list(_caches)}
+
+
+metrics.REGISTRY.gauge(
+    "cache_bytes", "Bytes held by a bounded cache.", ("cache",), callback=lambda: _cache_values("bytes")
+)
+metrics.REGISTRY.counter(
+    "cache_evictions_total", "Entries evicted to keep a cache within its budget.", ("cache",),
+    callback=lambda: _cache_values("evictions"),
+)
+
+
+def rss_bytes():
+    """Resident set size of this process (psutil, or /proc without it), or None where neither is available."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def nbytes(value):
+    """Size of an array, bytes object or sequence of them."""
+    if hasattr(value, "nbytes"):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(nbytes(v) for v in value)
+    return 0
+
+
+class BudgetCache:
+    """
+    Least-recently-used mapping bounded by the bytes of its values.
+
+    Adding a value evicts the least recently used entries until the cache is
+    back within `max_bytes`; a value larger than the whole budget is not
+    stored.
+    """
+
+    def __init__(self, name, max_bytes, sizeof=nbytes):
+        """
+        Args:
+            name (str): Cache label in the metrics.
+            max_bytes (int): Byte budget of the cache.
+            sizeof (callable): sizeof(value) -> bytes.
+        """
+        self.name = name
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self.bytes -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+def tune_gc(thresholds=(10000, 50, 100), freeze=True):
+    """
+    Tune the collector for steady-state inference.
+
+    Args:
+        thresholds (tuple): gc.set_threshold values; the defaults run a young
+            collection every 10000 allocations and a full one very rarely.
+        freeze (bool): Move everything allocated so far (models, modules) to the
+            permanent generation, so collections no longer traverse it. Call
+            after the models are loaded.
+    """
+    if freeze:
+        gc.collect()
+        gc.freeze()
+    gc.set_threshold(*thresholds)
+
+
+_gc_start = threading.local()
+
+
+def _on_gc(phase, info):
+    if phase == "start":
+        _gc_start.time = time.perf_counter()
+    else:
+        start = getattr(_gc_start, "time", None)
+        if start is not None:
+            GC_PAUSE_SECONDS.observe(time.perf_counter() - start, generation=str(info["generation"]))
+
+
+def install_gc_metrics():
+    """Record the pause of every collection in `python_gc_pause_seconds`."""
+    if _on_gc not in gc.callbacks:
+        gc.callbacks.append(_on_gc)
+
+
+class MemoryMonitor:
+    """
+    Background sampler of the process memory.
+
+    Every `interval` seconds it stores the RSS and, while tracemalloc is
+    tracing, the traced total and its `top` largest allocation sites in the
+    metrics. When the RSS exceeds `budget_bytes` it logs a warning and runs
+    a full collection, at most once per `collect_interval` seconds, instead
+    of collecting on a fixed schedule.
+    """
+
+    def __init__(self, budget_bytes=None, interval=10.0, top=10, collect_interval=60.0):
+        self.budget_bytes = budget_bytes
+        self.interval = interval
+        self.top = top
+        self.collect_interval = collect_interval
+        self._last_collect = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if rss_bytes() is None:
+            logger.warning(
+                f"Process RSS is not available on {sys.platform} without psutil: "
+                + (f"the memory budget of {self.budget_bytes >> 20} MiB is not enforced" if self.budget_bytes
+                   else "process_resident_memory_bytes is not reported")
+            )
+        self._thread = threading.Thread(target=self._run, name="memory-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def sample(self):
+        rss = rss_bytes()
+        if rss is not None:
+            RSS_BYTES.set(rss)
+        if tracemalloc.is_tracing():
+            # Sites that left the top are dropped instead of reporting stale sizes
+            TRACED_BYTES.clear()
+            TRACED_BYTES.set(tracemalloc.get_traced_memory()[0], site="total")
+            if self.top:
+                for stat in tracemalloc.take_snapshot().statistics("lineno")[: self.top]:
+                    frame = stat.traceback[0]
+                    TRACED_BYTES.set(stat.size, site=f"{frame.filename}:{frame.lineno}")
+        if rss is not None and self.budget_bytes and rss > self.budget_bytes:
+            BUDGET_EXCEEDED.inc()
+            now = time.monotonic()
+            if now - self._last_collect >= self.collect_interval:
+                self._last_collect = now
+                logger.warning(f"RSS {rss >> 20} MiB exceeds the budget of {self.budget_bytes >> 20} MiB, collecting")
+                gc.collect()
+        return rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Memory sampling failed: {e}")
@@ -0,0 +1,268 @@
+"""
+Low-overhead serving metrics in the Prometheus text format.
+
+Stages of the serving path are timed with `stage`, which records into the
+`pipeline_stage_seconds` histogram labelled by stage, model and camera:
+
+    with metrics.context(camera="cam0"):
+        with metrics.stage("decode"):
+            frame = decode(payload)
+        with metrics.stage("infer", model="crowd"):
+            result = model(frame)
+
+Labels set with `context` apply to every stage recorded by the same thread,
+so code deep in a detector does not need to know which camera it serves.
+`REGISTRY.render()` produces the body of a `/metrics` endpoint;
+`start_http_server` serves it for scripts without a web server.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds, from 0.5 ms to 5 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class _Metric:
+    """
+    Base of all metrics. Values are kept per label tuple; `callback() ->
+    {label tuple: value}` adds values that are only read at scrape time (e.g.
+    queue sizes or counters owned by other processes).
+    """
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), callback=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def clear(self):
+        """Drop all recorded series."""
+        with self._lock:
+            self._values.clear()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        with self._lock:
+            items = dict(self._values)
+        if self.callback is not None:
+            items.update(self.callback())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items.items()
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        self.observe_key(value, self._key(labels))
+
+    def observe_key(self, value, key):
+        # Per-bucket counts; made cumulative when rendering
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def snapshot(self):
+        """{label tuple: (count, sum)} of every series."""
+        with self._lock:
+            return {k: (sum(counts), total) for k, (counts, total) in self._values.items()}
+
+    def render(self):
+        with self._lock:
+            items = [(k, list(counts), total) for k, (counts, total) in self._values.items()]
+        lines = self.header()
+        names = self.labelnames + ("le",)
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help, labelnames=(), callback=None):
+        return self._get(Counter, name, help, labelnames, callback=callback)
+
+    def gauge(self, name, help, labelnames=(), callback=None):
+        return self._get(Gauge, name, help, labelnames, callback=callback)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "pipeline_stage_seconds", "Latency of one serving stage.", ("stage", "model", "camera")
+)
+FRAMES_DROPPED = REGISTRY.counter(
+    "pipeline_frames_dropped_total", "Frames skipped because a consumer fell behind.", ("consumer", "camera")
+)
+INFERENCE_BUSY = REGISTRY.counter(
+    "inference_busy_seconds_total",
+    "Time spent in model inference; its rate is the device utilization.",
+    ("model", "device"),
+)
+
+_local = threading.local()
+
+
+def _context():
+    labels = getattr(_local, "labels", None)
+    if labels is None:
+        labels = _local.labels = {"model": "", "camera": ""}
+    return labels
+
+
+@contextmanager
+def context(**labels):
+    """Default `model`/`camera` labels for the stages recorded by this thread."""
+    current = _context()
+    previous = dict(current)
+    current.update(labels)
+    try:
+        yield
+    finally:
+        current.clear()
+        current.update(previous)
+
+
+def labels():
+    """Copy of the `model`/`camera` labels set by `context` on this thread."""
+    return dict(_context())
+
+
+def observe(stage, seconds, model=None, camera=None):
+    """Record a duration measured elsewhere (e.g. timings reported by a model)."""
+    labels = _context()
+    STAGE_SECONDS.observe_key(
+        seconds, (stage, labels["model"] if model is None else model, labels["camera"] if camera is None else camera)
+    )
+
+
+@contextmanager
+def stage(name, model=None, camera=None):
+    """Time the enclosed block as one `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, model, camera)
+
+
+def stage_snapshot():
+    """{(stage, model, camera): (count, seconds)} recorded so far, e.g. to diff two points in time."""
+    return STAGE_SECONDS.snapshot()
+
+
+def observe_inference(speed, model, device):
+    """Record the preprocess/infer/postprocess times (ms) of an Ultralytics result."""
+    observe("preprocess", speed["preprocess"] / 1e3, model)
+    observe("infer", speed["inference"] / 1e3, model)
+    observe("postprocess", speed["postprocess"] / 1e3, model)
+    INFERENCE_BUSY.inc(speed["inference"] / 1e3, model=model, device=device)
+
+
+def count_dropped(consumer, dropped, camera=None):
+    if dropped > 0:
+        FRAMES_DROPPED.inc(dropped, consumer=consumer, camera=_context()["camera"] if camera is None else camera)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host="0.0.0.0"):
+    """Serve `/metrics` from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
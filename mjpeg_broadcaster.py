@@ -0,0 +1,132 @@
+import logging
+import threading
+
+import cv2
+
+import metrics
+from camera_stream import LatestSlot
+
+logger = logging.getLogger(__name__)
+
+
+class MjpegBroadcaster:
+    """
+    One inference loop per camera and task, shared by every viewer of its
+    MJPEG feed.
+
+    The loop takes the newest frame of a `CameraStream` (or of a camera of
+    the frame bus, through `frame_bus.RingReader`), runs `process` on a
+    copy, encodes the annotated frame to JPEG once and stores the finished
+    multipart chunk in a `LatestSlot`. Each viewer only sends the newest
+    chunk, so a slow client skips frames instead of holding back the loop or
+    the other viewers, and the number of viewers does not change the
+    inference load. The loop runs only while the feed has viewers: it stops
+    after the last one disconnects and starts again with the next one.
+    """
+
+    def __init__(self, name, camera, process, quality=80, width=None):
+        """
+        Args:
+            name (str): Name used in log messages and the thread name.
+            camera (CameraStream or RingReader): Frame source.
+            process (callable): process(frame) -> annotated frame. Runs the
+                inference (and publishes its results) or draws results
+                computed elsewhere, on a private copy.
+            quality (int): JPEG quality (0-100).
+            width (int, optional): Width the stream is scaled to (aspect ratio
+                kept); None sends frames at camera resolution.
+        """
+        self.name = name
+        self.camera = camera
+        self.process = process
+        self.quality = quality
+        self.width = width
+
+        self._slot = LatestSlot()
+        self._thread = None
+        self._stop = None
+        self._viewers = 0
+        self._lock = threading.Lock()
+
+        self.frames_encoded = 0
+
+    @property
+    def viewers(self):
+        return self._viewers
+
+    def start(self):
+        """Start the inference loop unless it is running; a stopping loop is replaced."""
+        with self._lock:
+            if self._thread is None or self._stop.is_set():
+                previous = self._thread
+                self._stop = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._stop, previous), name=f"mjpeg-{self.name}", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the inference loop after the frame it is working on."""
+        with self._lock:
+            if self._stop is not None:
+                self._stop.set()
+
+    def encode(self, frame):
+        """Scale and encode a frame into a ready-to-send multipart chunk."""
+        if self.width and frame.shape[1] != self.width:
+            height = round(frame.shape[0] * self.width / frame.shape[1])
+            frame = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ret:
+            return None
+        return b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + buffer.tobytes() + b"\r\n"
+
+    def _run(self, stop, previous):
+        # A restarted loop waits for the stopping one, so they never run together
+        if previous is not None:
+            previous.join()
+        last_seq = 0
+        with metrics.context(camera=self.camera.name, model=self.name):
+            while not stop.is_set():
+                item = self.camera.read(last_seq, timeout=0.5)
+                if item is None:
+                    if self.camera.closed:
+                        # The camera ended; viewers get the last frame and finish
+                        self._slot.close()
+                        return
+                    continue
+                seq, timestamp, frame = item
+                if last_seq:
+                    metrics.count_dropped(self.name, seq - last_seq - 1)
+                last_seq = seq
+                try:
+                    # Frames are shared with the other camera consumers, so annotate a copy
+                    frame = self.process(frame.copy())
+                    with metrics.stage("encode"):
+                        chunk = self.encode(frame)
+                except Exception as e:
+                    logger.error(f"[{self.name}] Error processing frame {seq}: {e}")
+                    continue
+                if chunk is not None:
+                    self.frames_encoded += 1
+                    self._slot.publish(chunk, timestamp)
+
+    def stream(self):
+        """Multipart body for one viewer; the inference loop runs while any viewer is connected."""
+        with self._lock:
+            self._viewers += 1
+        try:
+            self.start()
+            last_seq = 0
+            for seq, _, chunk in self._slot.values():
+                if last_seq:
+                    metrics.count_dropped(f"{self.name}_viewer", seq - last_seq - 1, camera=self.camera.name)
+                last_seq = seq
+                yield chunk
+        finally:
+            # Runs when the client disconnects and the server closes the generator
+            with self._lock:
+                self._viewers -= 1
+                if self._viewers == 0 and self._stop is not None:
+                    self._stop.set()
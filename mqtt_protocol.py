@@ -0,0 +1,226 @@
+"""
+Versioned MQTT message schema and per-camera routing.
+
+Frames are published per camera to `<task>/<camera>/frame` (e.g.
+`crowd/gate-1/frame`) and results come back on `<task>/<camera>/result`.
+A frame message (schema version 1) is a JSON object:
+
+    {"v": 1, "camera": "gate-1", "seq": 42, "ts": 1718000000.123,
+     "id": "optional request id", "frame": "<base64 JPEG/PNG>"}
+
+`seq` increases per camera and `ts` is the capture time (Unix seconds).
+The payload may also be the raw image bytes, in which case the camera is
+taken from the topic. Messages without "v" are the legacy format of the
+`mqtt-<task>-frame` topics ({"frame": ..., "id": ...}, single-quoted
+payloads included) and are read as version 0.
+
+Results repeat the routing fields of their frame (`v`, `camera`, `seq`,
+`ts`, `id`), so consumers can match results to sources and order them.
+"""
+import json
+import threading
+import time
+from collections import namedtuple
+
+import metrics
+
+SCHEMA_VERSION = 1
+DEFAULT_CAMERA = "default"
+
+# Largest non-JSON payload read as a legacy single-quoted object
+LEGACY_MAX_BYTES = 16 << 20
+
+# One frame to process; `frame` is base64 text (encoding "base64") or image bytes ("raw")
+FrameMessage = namedtuple("FrameMessage", ["version", "task", "camera", "seq", "ts", "id", "frame", "encoding"])
+
+
+def frame_topic(task, camera="+"):
+    """Frame topic of a camera; the default `+` gives the subscription filter of all cameras."""
+    return f"{task}/{camera}/frame"
+
+
+def result_topic(task, camera):
+    return f"{task}/{camera}/result"
+
+
+def parse_topic(topic):
+    """
+    (task, camera) of a `<task>/<camera>/frame` topic.
+
+    Returns:
+        tuple: (task, camera), or None for other topics.
+    """
+    parts = topic.split("/")
+    if len(parts) == 3 and parts[2] == "frame" and parts[0] and parts[1]:
+        return parts[0], parts[1]
+    return None
+
+
+def topic_matches(pattern, topic):
+    """MQTT filter matching with single-level `+` and multi-level `#` wildcards."""
+    pattern_levels = pattern.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(pattern_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels) or (level != "+" and level != topic_levels[i]):
+            return False
+    return len(pattern_levels) == len(topic_levels)
+
+
+def _load_json(payload):
+    text = payload.decode("utf-8")
+    try:
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            # Legacy clients publish str(dict), with single quotes; parsed as
+            # before the schema existed, by swapping the quotes. Only tried on
+            # payloads of frame size, as the swap copies the whole text
+            if len(payload) > LEGACY_MAX_BYTES:
+                raise ValueError(f"payload of {len(payload)} bytes is not JSON")
+            try:
+                data = json.loads(text.replace("'", '"'))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"payload is neither JSON nor a single-quoted object: {e}") from e
+    except RecursionError as e:
+        raise ValueError("payload is nested too deeply") from e
+    if not isinstance(data, dict):
+        raise ValueError("payload is not an object")
+    return data
+
+
+def parse_frame_message(payload, topic, task=None):
+    """
+    Parse a frame payload received on `topic`.
+
+    Args:
+        payload (bytes): MQTT payload (JSON object or raw image bytes).
+        topic (str): Topic it was received on.
+        task (str, optional): Task of legacy topics, which do not name it.
+
+    Returns:
+        FrameMessage
+
+    Raises:
+        ValueError: Malformed payload or unsupported schema version.
+    """
+    routed = parse_topic(topic)
+    if routed is not None:
+        task, topic_camera = routed
+    else:
+        topic_camera = None
+
+    if payload[:1] != b"{":
+        return FrameMessage(0, task, topic_camera or DEFAULT_CAMERA, None, None, None, payload, "raw")
+
+    data = _load_json(payload)
+    version = int(data.get("v", 0))
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"unsupported schema version {version}")
+    if "frame" not in data:
+        raise ValueError("missing 'frame'")
+    # The topic names the camera on routed topics; the payload on legacy ones
+    camera = topic_camera or str(data.get("camera") or DEFAULT_CAMERA)
+    seq = data.get("seq")
+    ts = data.get("ts")
+    return FrameMessage(
+        version,
+        task,
+        camera,
+        int(seq) if seq is not None else None,
+        float(ts) if ts is not None else None,
+        data.get("id"),
+        data["frame"],
+        "base64",
+    )
+
+
+def result_message(message, result):
+    """Result dict carrying the routing fields of the frame it was computed from."""
+    routing = {"v": SCHEMA_VERSION, "task": message.task, "camera": message.camera}
+    for field in ("seq", "ts", "id"):
+        value = getattr(message, field)
+        if value is not None:
+            routing[field] = value
+    return dict(routing, **result)
+
+
+class CameraRouter:
+    """
+    Per-camera state for the frames of many cameras arriving on one topic
+    filter.
+
+    `get` returns the state object of a camera, created by `factory(camera)`
+    on its first frame, so stateful processing (fatigue timers, zones,
+    trackers) never mixes cameras. `accept` checks the sequence number of a
+    frame: frames older than the newest one seen are rejected, and gaps are
+    counted as dropped frames of the camera. A sequence number more than
+    `restart_gap` behind is taken as a restarted camera and accepted. Cameras
+    silent for `idle_timeout` seconds lose their state.
+
+    Set `count_gaps` to False when the frames of a camera are spread over
+    several workers (shared subscriptions): each worker then sees gaps that
+    are frames of the other workers, not dropped ones.
+    """
+
+    def __init__(self, factory, idle_timeout=600.0, restart_gap=100, name="mqtt", count_gaps=True):
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self.restart_gap = restart_gap
+        self.name = name
+        self.count_gaps = count_gaps
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._states)
+
+    def cameras(self):
+        with self._lock:
+            return list(self._states)
+
+    def _entry(self, camera):
+        # [state, newest seq, last seen]; caller holds the lock
+        entry = self._states.get(camera)
+        if entry is None:
+            entry = self._states[camera] = [self.factory(camera), None, 0.0]
+        entry[2] = time.monotonic()
+        return entry
+
+    def get(self, camera):
+        with self._lock:
+            return self._entry(camera)[0]
+
+    def accept(self, camera, seq):
+        """
+        Returns:
+            bool: False for a frame not newer than the last accepted one of its camera.
+        """
+        if seq is None:
+            return True
+        with self._lock:
+            entry = self._entry(camera)
+            last = entry[1]
+            if last is not None and seq <= last:
+                if last - seq <= self.restart_gap:
+                    return False
+                last = None
+            entry[1] = seq
+        if last is not None and self.count_gaps:
+            metrics.count_dropped(self.name, seq - last - 1, camera=camera)
+        return True
+
+    def discard(self, camera):
+        """Drop the state of a camera, e.g. after it moved to another worker."""
+        with self._lock:
+            return self._states.pop(camera, None) is not None
+
+    def evict_idle(self):
+        """Drop the state of cameras idle for `idle_timeout` seconds; returns their names."""
+        deadline = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [camera for camera, entry in self._states.items() if entry[2] < deadline]
+            for camera in idle:
+                del self._states[camera]
+        return idle
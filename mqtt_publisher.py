@@ -0,0 +1,183 @@
+import json
+import logging
+import queue
+import threading
+import time
+import weakref
+from collections import defaultdict
+
+import metrics
+from queues import put_latest
+
+logger = logging.getLogger(__name__)
+
+PUBLISH_DROPPED = metrics.REGISTRY.counter(
+    "mqtt_publish_dropped_total",
+    "Results not published: pushed out of a full outbound queue or refused by the client.",
+    ("publisher", "reason"),
+)
+PUBLISH_MESSAGES = metrics.REGISTRY.counter(
+    "mqtt_publish_messages_total", "Messages handed to the MQTT client.", ("topic", "batched")
+)
+
+_STOP = object()
+
+# Publishers reported by the queue depth gauge
+_publishers = weakref.WeakSet()
+
+metrics.REGISTRY.gauge(
+    "mqtt_publish_queue_depth", "Results waiting to be published.", ("publisher",),
+    callback=lambda: {(p.name,): p._queue.qsize() for p in list(_publishers)},
+)
+
+
+def _publish_rc(info):
+    """Return code of a publish call: paho's MQTTMessageInfo, flask_mqtt's (rc, mid) or None."""
+    if info is None:
+        return 0
+    if isinstance(info, tuple):
+        return info[0]
+    return getattr(info, "rc", 0)
+
+
+class ResultPublisher:
+    """
+    Outbound queue between the inference threads and the MQTT client.
+
+    `submit` only enqueues the result, so inference never waits on
+    serialization or on socket writes to a slow broker; one thread
+    serializes and publishes in order. When the broker falls behind the
+    queue fills up and its oldest results are dropped, counted in
+    `mqtt_publish_dropped_total`, while `mqtt_publish_queue_depth` and the
+    `publish_queue` stage show the backlog.
+
+    Results whose topic `batch_topic` maps to a batch topic are not
+    published one by one: they are collected for `batch_interval` seconds
+    and sent as one `{"count": n, "results": [...]}` message to the batch
+    topic, which coalesces the results of all cameras into a few messages.
+    """
+
+    def __init__(
+        self,
+        publish,
+        qos=None,
+        default_qos=0,
+        batch_topic=None,
+        batch_interval=0.5,
+        max_queue=1024,
+        serializer=json.dumps,
+        name="mqtt",
+    ):
+        """
+        Args:
+            publish (callable): publish(topic, payload, qos) of the MQTT client.
+            qos (dict, optional): QoS per topic; other topics use `default_qos`.
+            default_qos (int): QoS of topics not in `qos`.
+            batch_topic (callable, optional): batch_topic(topic) -> topic of the batch the
+                result joins, or None to publish it on its own. None disables batching.
+            batch_interval (float): Seconds results of batched topics are collected.
+            max_queue (int): Results queued before the oldest are dropped.
+            serializer (callable): serializer(data) -> payload.
+            name (str): Name of the publishing thread.
+        """
+        self.publish = publish
+        self.qos = dict(qos or {})
+        self.default_qos = default_qos
+        self.batch_topic = batch_topic or (lambda topic: None)
+        self.batch_interval = batch_interval
+        self.serializer = serializer
+        self.name = name
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._batches = defaultdict(list)
+        self._thread = None
+        _publishers.add(self)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-publisher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Publish what is queued (including open batches) and stop the thread."""
+        if self._thread is not None:
+            # Wait for room instead of pushing out a queued result; a thread
+            # too slow to make room within `timeout` is not waited for
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                logger.warning(f"[{self.name}] Outbound queue still full after {timeout}s, not draining it")
+                return
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, topic, data, model=""):
+        """Queue a result for publishing without blocking."""
+        labels = metrics.labels()
+        item = (topic, data, model or labels["model"], labels["camera"], time.perf_counter())
+        dropped = put_latest(self._queue, item)
+        if dropped:
+            PUBLISH_DROPPED.inc(dropped, publisher=self.name, reason="queue_full")
+
+    def _send(self, topic, data, model, camera, batched=False):
+        with metrics.stage("serialize", model=model, camera=camera):
+            payload = self.serializer(data)
+        with metrics.stage("publish", model=model, camera=camera):
+            rc = _publish_rc(self.publish(topic, payload, self.qos.get(topic, self.default_qos)))
+        if rc:
+            PUBLISH_DROPPED.inc(publisher=self.name, reason=f"rc_{rc}")
+        else:
+            PUBLISH_MESSAGES.inc(topic=topic, batched=str(batched).lower())
+
+    def _flush(self):
+        batches, self._batches = self._batches, defaultdict(list)
+        for batch_topic, results in batches.items():
+            self._send(batch_topic, {"count": len(results), "results": results}, "", "", batched=True)
+
+    def _handle(self, topic, data, model, camera):
+        batch_topic = self.batch_topic(topic)
+        if batch_topic is not None:
+            self._batches[batch_topic].append(data)
+        else:
+            self._send(topic, data, model, camera)
+
+    def _run(self):
+        next_flush = time.perf_counter() + self.batch_interval
+        while True:
+            timeout = max(next_flush - time.perf_counter(), 0.0) if self._batches else 0.5
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                break
+            if item is not None:
+                topic, data, model, camera, enqueued = item
+                metrics.observe("publish_queue", time.perf_counter() - enqueued, model, camera)
+                self._handle_safely(topic, data, model, camera)
+            now = time.perf_counter()
+            if now >= next_flush:
+                self._flush_safely()
+                next_flush = now + self.batch_interval
+
+        # Drain what was queued before stop
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                self._handle_safely(*item[:4])
+        self._flush_safely()
+
+    def _handle_safely(self, topic, data, model, camera):
+        try:
+            self._handle(topic, data, model, camera)
+        except Exception as e:
+            logger.error(f"[{self.name}] Error publishing to {topic}: {e}")
+
+    def _flush_safely(self):
+        try:
+            self._flush()
+        except Exception as e:
+            logger.error(f"[{self.name}] Error publishing batch: {e}")
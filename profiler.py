@@ -0,0 +1,236 @@
+"""
+On-demand profiling of a running service.
+
+`Profiler.start` captures a time-bounded profile of the live process from a
+background thread and writes it to `<directory>/profile-<time>.json`, with
+the sampled stacks also in `.folded` (collapsed stack) format for flame
+graph tools:
+
+    profiler = Profiler("profiles")
+    profiler.start(seconds=10, on_done=lambda path: print(path))
+
+A capture contains:
+    stacks   the stacks of every thread (inference loops, Flask request
+             threads, MQTT loop, ...) sampled from `sys._current_frames()`
+             every `interval` seconds, counted per thread and stack
+    stages   count, total and mean time of every `metrics.stage` recorded
+             during the capture
+    memory   with `memory=True`, the largest allocations made during the
+             capture that are still alive at its end (tracemalloc)
+
+Nothing runs between captures; tracemalloc is only enabled for the duration
+of a capture (unless it was already tracing).
+
+A capture holds stack frames and source paths of the service, so commands
+arriving over MQTT must carry the admin token (see `command_authorized`).
+"""
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_SECONDS = 300.0
+MIN_INTERVAL = 0.001
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})".replace(";", ":")
+
+
+def _folded_stack(frame):
+    """Root-first `;`-joined frames of a stack, the collapsed format of flame graph tools."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def sample_stacks(duration, interval):
+    """
+    Sample the stacks of all other threads for `duration` seconds.
+
+    Returns:
+        tuple: (Counter of "<thread>;<stack>" -> samples, number of sampling rounds).
+    """
+    own = threading.get_ident()
+    stacks = Counter()
+    rounds = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != own:
+                thread = names.get(ident, str(ident)).replace(";", ":")
+                stacks[f"{thread};{_folded_stack(frame)}"] += 1
+        rounds += 1
+        time.sleep(interval)
+    return stacks, rounds
+
+
+def stage_delta(before, after):
+    """Per-stage count and time recorded between two `metrics.stage_snapshot` calls."""
+    stages = []
+    for key, (count, total) in after.items():
+        count_before, total_before = before.get(key, (0, 0.0))
+        if count > count_before:
+            n, seconds = count - count_before, total - total_before
+            stage, model, camera = key
+            stages.append(
+                {
+                    "stage": stage,
+                    "model": model,
+                    "camera": camera,
+                    "count": n,
+                    "total_s": seconds,
+                    "mean_ms": 1e3 * seconds / n,
+                }
+            )
+    return sorted(stages, key=lambda s: s["total_s"], reverse=True)
+
+
+def memory_top(snapshot, limit, frames):
+    """Largest allocation sites of a tracemalloc snapshot, outside the tracer itself."""
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    stats = snapshot.statistics("traceback" if frames > 1 else "lineno")
+    return [
+        {
+            "size_kb": stat.size / 1024,
+            "count": stat.count,
+            "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        }
+        for stat in stats[:limit]
+    ]
+
+
+def command_authorized(params, token):
+    """
+    True if a capture command payload carries `token` in its "token" field.
+
+    Always False without a configured token, so the command topic must only
+    be subscribed when one is set. The comparison takes constant time.
+    """
+    given = params.get("token") if isinstance(params, dict) else None
+    if not token or not isinstance(given, str):
+        return False
+    return hmac.compare_digest(given.encode("utf-8"), token.encode("utf-8"))
+
+
+class Profiler:
+    """Runs one capture at a time; requests made while a capture runs are refused."""
+
+    def __init__(self, directory="profiles"):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._thread = None
+        self.current = None
+
+    @property
+    def running(self):
+        return self.current is not None
+
+    def start(self, seconds=10.0, interval=0.005, memory=True, memory_top=50, memory_frames=1, on_done=None):
+        """
+        Start a capture in a background thread.
+
+        Args:
+            seconds (float): Capture length (at most `MAX_SECONDS`).
+            interval (float): Seconds between stack samples.
+            memory (bool): Also trace allocations (slows allocations while it runs).
+            memory_top (int): Allocation sites kept in the capture.
+            memory_frames (int): Frames stored per allocation traceback.
+            on_done (callable, optional): on_done(path) once the capture is written.
+
+        Returns:
+            str: Path the capture will be written to, or None while another capture runs.
+        """
+        with self._lock:
+            if self.current is not None:
+                return None
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.json"
+            self.current = os.path.join(self.directory, name)
+            options = {
+                "seconds": min(max(float(seconds), 0.0), MAX_SECONDS),
+                "interval": max(float(interval), MIN_INTERVAL),
+                "memory": bool(memory),
+                "memory_top": int(memory_top),
+                "memory_frames": max(int(memory_frames), 1),
+            }
+            self._thread = threading.Thread(
+                target=self._run, args=(self.current, options, on_done), name="profiler", daemon=True
+            )
+            self._thread.start()
+            return self.current
+
+    def start_from(self, params, on_done=None):
+        """`start` with options from a mapping of strings (query string or command payload)."""
+        options = {}
+        for key, cast in (("seconds", float), ("interval", float), ("memory_top", int), ("memory_frames", int)):
+            if key in params:
+                options[key] = cast(params[key])
+        if "memory" in params:
+            options["memory"] = str(params["memory"]).lower() not in ("0", "false", "no")
+        return self.start(on_done=on_done, **options)
+
+    def captures(self):
+        """File names of the finished captures, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        names = [n for n in os.listdir(self.directory) if n.endswith(".json")]
+        return sorted(names, reverse=True)
+
+    def _run(self, path, options, on_done):
+        started = datetime.now()
+        trace = options["memory"] and not tracemalloc.is_tracing()
+        try:
+            if trace:
+                tracemalloc.start(options["memory_frames"])
+            stages_before = metrics.stage_snapshot()
+            stacks, rounds = sample_stacks(options["seconds"], options["interval"])
+            stages = stage_delta(stages_before, metrics.stage_snapshot())
+            memory = None
+            if options["memory"]:
+                current, peak = tracemalloc.get_traced_memory()
+                memory = {
+                    "traced_kb": current / 1024,
+                    "peak_kb": peak / 1024,
+                    "top": memory_top(tracemalloc.take_snapshot(), options["memory_top"], options["memory_frames"]),
+                }
+        except Exception as e:
+            logger.error(f"Profile capture failed: {e}")
+            path = None
+        else:
+            report = {
+                "started": started.isoformat(timespec="seconds"),
+                "pid": os.getpid(),
+                "options": options,
+                "rounds": rounds,
+                "threads": sorted({key.split(";", 1)[0] for key in stacks}),
+                "stacks": [{"stack": key, "samples": n} for key, n in stacks.most_common()],
+                "stages": stages,
+                "memory": memory,
+            }
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+            with open(path[: -len(".json")] + ".folded", "w") as f:
+                f.writelines(f"{key} {n}\n" for key, n in stacks.items())
+            logger.info(f"Profile written to {path}")
+        finally:
+            if trace:
+                tracemalloc.stop()
+            with self._lock:
+                self.current = None
+        if on_done is not None:
+            on_done(path)
@@ -0,0 +1,27 @@
+"""
+Queue helpers shared by the frame bus and the MQTT result publisher.
+
+Kept free of OpenCV, multiprocessing and camera imports so that modules
+which only need a queue policy stay light.
+"""
+import queue
+
+
+def put_latest(q, item):
+    """
+    Put without blocking; when the queue is full its oldest item is dropped.
+
+    Returns:
+        int: Number of items dropped.
+    """
+    dropped = 0
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
@@ -0,0 +1,220 @@
+"""
+Async push layer for the dashboards.
+
+An ASGI app that forwards the MQTT result stream to browsers over
+Server-Sent Events and WebSocket from one asyncio event loop, so hundreds of
+dashboard clients cost a queue each instead of a worker thread each:
+
+    uvicorn realtime:app --host 0.0.0.0 --port 8000
+
+    GET /events?topics=mqtt-crowd-result      Server-Sent Events
+    WS  /ws?topics=mqtt-fatigue-result        WebSocket, one JSON text message per result
+
+`topics` is an optional comma-separated subset of the bridged topics; MQTT
+wildcards select cameras, e.g. `topics=crowd/gate-1/result` or
+`topics=crowd/+/result`. The broker and the bridged topics are configured with MQTT_BROKER_URL,
+MQTT_BROKER_PORT and REALTIME_TOPICS (comma-separated; add the frame
+topics to stream frames as well).
+"""
+import asyncio
+import json
+import logging
+import os
+from urllib.parse import parse_qs
+
+import paho.mqtt.client as paho
+
+from mqtt_protocol import topic_matches
+
+logger = logging.getLogger(__name__)
+
+MQTT_BROKER_URL = os.environ.get("MQTT_BROKER_URL", "localhost")
+MQTT_BROKER_PORT = int(os.environ.get("MQTT_BROKER_PORT", 1883))
+REALTIME_TOPICS = os.environ.get(
+    "REALTIME_TOPICS", "mqtt-crowd-result,mqtt-fatigue-result,crowd/+/result,fatigue/+/result"
+).split(",")
+
+# Messages buffered per client before its oldest ones are dropped
+CLIENT_QUEUE_SIZE = 32
+# Seconds between SSE keep-alive comments on an idle stream
+KEEPALIVE_INTERVAL = 15.0
+
+
+class Message:
+    """One MQTT message, serialized once for every client and transport."""
+
+    __slots__ = ("topic", "text", "sse")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        data = payload.decode("utf-8", errors="replace")
+        try:
+            data = json.loads(data)
+        except ValueError:
+            pass
+        self.text = json.dumps({"topic": topic, "data": data})
+        self.sse = f"event: {topic}\ndata: {self.text}\n\n".encode("utf-8")
+
+
+class ResultHub:
+    """
+    Fan-out of messages to the connected clients, used from the event loop
+    only. Every client owns a bounded queue; a slow client loses its oldest
+    messages instead of delaying the others.
+    """
+
+    def __init__(self, queue_size=CLIENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.clients = {}  # asyncio.Queue -> set of topic filters
+
+    def subscribe(self, topics):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.clients[queue] = set(topics)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.clients.pop(queue, None)
+
+    def publish(self, message):
+        for queue, topics in self.clients.items():
+            if message.topic not in topics and not any(topic_matches(t, message.topic) for t in topics):
+                continue
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+
+class MqttBridge:
+    """Subscribes to the result topics and hands every message to the hub's loop."""
+
+    def __init__(self, hub, loop, host=MQTT_BROKER_URL, port=MQTT_BROKER_PORT, topics=REALTIME_TOPICS):
+        self.hub = hub
+        self.loop = loop
+        self.host = host
+        self.port = port
+        self.topics = topics
+        if hasattr(paho, "CallbackAPIVersion"):
+            self.client = paho.Client(paho.CallbackAPIVersion.VERSION1)
+        else:
+            self.client = paho.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+
+    def start(self):
+        self.client.connect_async(self.host, self.port)
+        self.client.loop_start()
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        # (Re)subscribe on every connect so a broker restart is survived
+        client.subscribe([(topic, 0) for topic in self.topics])
+        logger.info(f"Realtime bridge subscribed to {', '.join(self.topics)}")
+
+    def _on_message(self, client, userdata, message):
+        # Runs on the paho network thread; parse here, fan out on the loop
+        self.loop.call_soon_threadsafe(self.hub.publish, Message(message.topic, message.payload))
+
+
+hub = ResultHub()
+bridge = None
+
+
+def requested_topics(scope):
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    topics = [t for value in query.get("topics", []) for t in value.split(",") if t]
+    allowed = [t for t in topics if any(topic_matches(f, t) for f in REALTIME_TOPICS)]
+    return allowed if topics else list(REALTIME_TOPICS)
+
+
+async def wait_disconnect(receive, disconnect_type):
+    while (await receive())["type"] != disconnect_type:
+        pass
+
+
+async def next_message(queue, disconnected, timeout=None):
+    """Next message of a client's queue; None on timeout or once the client is gone."""
+    get = asyncio.ensure_future(queue.get())
+    await asyncio.wait({get, disconnected}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    if not get.done():
+        get.cancel()
+        return None
+    return get.result()
+
+
+async def stream_events(scope, receive, send):
+    """Server-Sent Events: one `event: <topic>` per message."""
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ],
+    })
+    queue = hub.subscribe(requested_topics(scope))
+    disconnected = asyncio.ensure_future(wait_disconnect(receive, "http.disconnect"))
+    try:
+        while True:
+            message = await next_message(queue, disconnected, KEEPALIVE_INTERVAL)
+            if disconnected.done():
+                break
+            body = message.sse if message is not None else b": keep-alive\n\n"
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+    except OSError:
+        pass
+    finally:
+        hub.unsubscribe(queue)
+        disconnected.cancel()
+
+
+async def stream_websocket(scope, receive, send):
+    """WebSocket: one JSON text message {"topic", "data"} per message."""
+    if (await receive())["type"] != "websocket.connect":
+        return
+    await send({"type": "websocket.accept"})
+    queue = hub.subscribe(requested_topics(scope))
+    disconnected = asyncio.ensure_future(wait_disconnect(receive, "websocket.disconnect"))
+    try:
+        while True:
+            message = await next_message(queue, disconnected)
+            if disconnected.done():
+                break
+            await send({"type": "websocket.send", "text": message.text})
+    except OSError:
+        pass
+    finally:
+        hub.unsubscribe(queue)
+        disconnected.cancel()
+
+
+async def lifespan(receive, send):
+    global bridge
+    while True:
+        event = await receive()
+        if event["type"] == "lifespan.startup":
+            bridge = MqttBridge(hub, asyncio.get_running_loop())
+            bridge.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif event["type"] == "lifespan.shutdown":
+            if bridge is not None:
+                bridge.stop()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/events":
+        await stream_events(scope, receive, send)
+    elif scope["type"] == "websocket" and scope["path"] == "/ws":
+        await stream_websocket(scope, receive, send)
+    elif scope["type"] == "http":
+        await send({"type": "http.response.start", "status": 404, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"Not Found"})
+    else:
+        await send({"type": "websocket.close", "code": 1008})
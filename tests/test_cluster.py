@@ -0,0 +1,109 @@
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cluster import HashRing, Membership, worker_topic  # noqa: E402
+
+CAMERAS = [f"cam-{i}" for i in range(1000)]
+
+
+def heartbeat(worker, ts=None):
+    return json.dumps({"worker": worker, "ts": time.time() if ts is None else ts}).encode()
+
+
+def make_membership(worker="w-a", timeout=15.0):
+    published, rings = [], []
+    membership = Membership(
+        "g", worker, lambda *args: published.append(args), timeout=timeout, on_change=rings.append
+    )
+    return membership, published, rings
+
+
+def test_ring_is_deterministic_and_balanced():
+    ring = HashRing(["w-a", "w-b", "w-c"])
+    assert ring.node_for("cam-1") == HashRing(["w-c", "w-b", "w-a"]).node_for("cam-1")
+    counts = {node: 0 for node in ring.nodes}
+    for camera in CAMERAS:
+        counts[ring.node_for(camera)] += 1
+    assert all(200 < count < 470 for count in counts.values())
+
+
+def test_ring_moves_only_cameras_of_the_added_node():
+    before = HashRing(["w-a", "w-b", "w-c"])
+    after = HashRing(["w-a", "w-b", "w-c", "w-d"])
+    moved = [camera for camera in CAMERAS if before.node_for(camera) != after.node_for(camera)]
+    assert all(after.node_for(camera) == "w-d" for camera in moved)
+    assert 150 < len(moved) < 350
+
+
+def test_empty_ring():
+    assert HashRing().node_for("cam-1") is None
+
+
+def test_alone_owns_every_camera():
+    membership, _, _ = make_membership()
+    assert all(membership.owns(camera) for camera in CAMERAS)
+
+
+def test_join_and_leave_rebuild_the_ring():
+    membership, _, rings = make_membership()
+    topic = worker_topic("g", "w-b")
+
+    membership.handle(topic, heartbeat("w-b"))
+    assert membership.ring.nodes == ["w-a", "w-b"]
+    assert len(rings) == 1
+    owned = sum(membership.owns(camera) for camera in CAMERAS)
+    assert 0 < owned < len(CAMERAS)
+
+    # Repeated heartbeats do not rebalance
+    membership.handle(topic, heartbeat("w-b"))
+    assert len(rings) == 1
+
+    # Last will / clean leave: empty retained message
+    membership.handle(topic, b"")
+    assert membership.ring.nodes == ["w-a"]
+    assert len(rings) == 2
+    assert all(membership.owns(camera) for camera in CAMERAS)
+
+
+def test_own_heartbeat_is_ignored():
+    membership, _, rings = make_membership()
+    membership.handle(worker_topic("g", "w-a"), b"")
+    assert membership.ring.nodes == ["w-a"] and not rings
+
+
+def test_silent_worker_expires():
+    membership, _, rings = make_membership(timeout=0.05)
+    membership.handle(worker_topic("g", "w-b"), heartbeat("w-b"))
+    assert not membership._expire()
+    time.sleep(0.1)
+    assert membership._expire()
+    membership._rebuild()
+    assert membership.ring.nodes == ["w-a"]
+    assert rings[-1].nodes == ["w-a"]
+
+
+def test_stale_retained_heartbeat_is_ignored():
+    membership, _, rings = make_membership(timeout=15.0)
+    membership.handle(worker_topic("g", "w-dead"), heartbeat("w-dead", ts=time.time() - 3600))
+    assert membership.ring.nodes == ["w-a"] and not rings
+
+
+def test_recent_retained_heartbeat_expires_from_its_timestamp():
+    membership, _, _ = make_membership(timeout=1.0)
+    membership.handle(worker_topic("g", "w-b"), heartbeat("w-b", ts=time.time() - 0.9))
+    assert membership.ring.nodes == ["w-a", "w-b"]
+    time.sleep(0.2)
+    assert membership._expire()
+
+
+def test_heartbeat_and_stop_publish_retained():
+    membership, published, _ = make_membership()
+    membership.heartbeat()
+    membership.stop()
+    (topic, payload, qos, retain), last = published
+    assert topic == worker_topic("g", "w-a") and retain and json.loads(payload)["worker"] == "w-a"
+    assert last == (topic, "", 1, True)
@@ -0,0 +1,62 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "face-recognition-master")
+)
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("torch")
+
+from face_detection.scrfd.detector import SCRFD  # noqa: E402
+from face_recognition.track_cache import face_quality  # noqa: E402
+
+INPUT_SIZE = (128, 128)
+
+
+def make_detector(faces):
+    """SCRFD whose network output is `faces`: (x1, y1, x2, y2, score) in detector input pixels."""
+    faces = np.array(faces, dtype=np.float32)
+    detector = SCRFD.__new__(SCRFD)
+    detector.input_size = INPUT_SIZE
+    detector.use_kps = True
+    detector.nms_thresh = 0.4
+    kpss = np.zeros((len(faces), 5, 2), dtype=np.float32)
+    detector.forward = lambda img, thresh: ([faces[:, 4:5]], [faces[:, :4]], [kpss])
+    return detector
+
+
+def detect(frame_size, faces):
+    frame = np.zeros((frame_size, frame_size, 3), dtype=np.uint8)
+    return make_detector(faces).detect_tracking(image=frame, input_size=INPUT_SIZE)
+
+
+@pytest.mark.parametrize("frame_size", [64, 128, 512])
+def test_quality_uses_float_score_and_frame_box(frame_size):
+    scale = frame_size / INPUT_SIZE[0]
+    outputs, _, bboxes, _ = detect(frame_size, [(10, 10, 40, 50, 0.9), (60, 60, 120, 80, 0.6)])
+
+    for j, (score, short_side) in enumerate([(0.9, 30), (0.6, 20)]):
+        quality = face_quality(bboxes[j], outputs[j, 4])
+        assert quality == pytest.approx(score * int(short_side * scale), rel=1e-3)
+
+
+def test_integer_score_column_is_not_the_score():
+    # At det_scale >= 1 the fifth column of `bboxes` is 0 for every face
+    outputs, _, bboxes, _ = detect(64, [(10, 10, 40, 50, 0.9)])
+    assert bboxes[0, 4] == 0
+    assert face_quality(bboxes[0], outputs[0, 4]) > 0
+
+
+def test_larger_and_more_confident_faces_rank_higher():
+    outputs, _, bboxes, _ = detect(
+        256, [(10, 10, 40, 40, 0.9), (50, 50, 100, 100, 0.9), (10, 60, 60, 110, 0.7)]
+    )
+    qualities = {
+        tuple(bboxes[j, :4]): face_quality(bboxes[j], outputs[j, 4]) for j in range(len(bboxes))
+    }
+    big, small, weak = (100, 100, 200, 200), (20, 20, 80, 80), (20, 120, 120, 220)
+    assert qualities[big] > qualities[weak] > qualities[small]
@@ -0,0 +1,115 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "face-recognition-master")
+)
+
+from face_recognition.arcface import feature_store  # noqa: E402
+from face_recognition.arcface.feature_store import FeatureStore  # noqa: E402
+
+DIM = 4
+
+
+def rows(*values):
+    return np.array([[value] * DIM for value in values], dtype=np.float32)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FeatureStore(str(tmp_path), dim=DIM, create=True, max_deleted_ratio=None)
+    store.append(["a", "b"], rows(1, 2))
+    return store
+
+
+def reopen(store):
+    return FeatureStore(store.root, max_deleted_ratio=None)
+
+
+def test_torn_index_line_is_cut_before_the_next_append(store):
+    with open(store._path("index"), "a") as f:
+        f.write('{"op": "add", "ro')
+
+    store = reopen(store)
+    assert list(store.load()[0]) == ["a", "b"]
+    store.append(["c"], rows(3))
+
+    names, embeddings = reopen(store).load()
+    assert list(names) == ["a", "b", "c"]
+    assert embeddings[2].tolist() == [3.0] * DIM
+
+
+def test_interrupted_append_is_truncated(store):
+    # Data written, index line never committed
+    with open(store._path("embeddings"), "ab") as f:
+        f.write(rows(9).tobytes())
+
+    store = reopen(store)
+    assert len(store) == 2
+    store.append(["c"], rows(3))
+
+    names, embeddings = reopen(store).load()
+    assert list(names) == ["a", "b", "c"]
+    assert embeddings.tolist() == rows(1, 2, 3).tolist()
+    assert os.path.getsize(store._path("embeddings")) == 3 * DIM * 4
+
+
+def test_compaction_keeps_live_rows(store):
+    store.append(["c"], rows(3))
+    store.delete([0])
+    store.compact()
+
+    assert store.generation == 1
+    for opened in (store, reopen(store)):
+        names, embeddings = opened.load()
+        assert list(names) == ["b", "c"]
+        assert embeddings.tolist() == rows(2, 3).tolist()
+    assert sorted(os.listdir(store.root)) == ["embeddings.1.bin", "index.1.jsonl", "meta.json"]
+
+
+def test_compaction_carries_over_concurrent_appends_and_deletes(store, monkeypatch):
+    store.append(["c"], rows(3))
+    store.delete([0])
+
+    # Runs while the new generation is written without the store lock
+    add_entry = feature_store._add_entry
+    state = {"done": False}
+
+    def concurrent_add_entry(row, name, source):
+        if not state["done"]:
+            state["done"] = True
+            store.append(["d", "e"], rows(4, 5))
+            store.delete([1, 3])  # "b" from the snapshot, "d" appended after it
+        return add_entry(row, name, source)
+
+    monkeypatch.setattr(feature_store, "_add_entry", concurrent_add_entry)
+    store.compact()
+    monkeypatch.setattr(feature_store, "_add_entry", add_entry)
+
+    assert state["done"]
+    for opened in (store, reopen(store)):
+        names, embeddings = opened.load()
+        assert list(names) == ["c", "e"]
+        assert embeddings.tolist() == rows(3, 5).tolist()
+
+
+def test_old_generation_still_in_use_is_removed_later(store, monkeypatch):
+    store.delete([0])
+    remove = os.remove
+
+    def locked_remove(path):
+        raise PermissionError(13, "in use", path)
+
+    monkeypatch.setattr(feature_store.os, "remove", locked_remove)
+    store.compact()
+    monkeypatch.setattr(feature_store.os, "remove", remove)
+
+    assert store.generation == 1
+    assert os.path.exists(os.path.join(store.root, "embeddings.0.bin"))
+
+    store = reopen(store)
+    assert list(store.load()[0]) == ["b"]
+    assert sorted(os.listdir(store.root)) == ["embeddings.1.bin", "index.1.jsonl", "meta.json"]
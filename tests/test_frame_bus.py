@@ -0,0 +1,89 @@
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_bus import FrameRing, RingReader  # noqa: E402
+from mjpeg_broadcaster import MjpegBroadcaster  # noqa: E402
+
+SHAPE = (24, 32)
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(cameras=2, slots=3, shape=SHAPE)
+    yield ring
+    if ring.header is not None:
+        ring.close()
+
+
+def frame(value):
+    return np.full(SHAPE + (3,), value, dtype=np.uint8)
+
+
+def test_latest_is_the_newest_complete_frame(ring):
+    assert ring.latest(0) is None
+    for seq in (1, 2, 3, 4):
+        ring.write(0, seq, frame(seq), timestamp=100.0 + seq)
+    meta = ring.latest(0)
+    assert (meta.camera, meta.slot, meta.seq, meta.timestamp) == (0, 4 % 3, 4, 104.0)
+    assert ring.latest(1) is None
+
+    # A slot being written is never the latest one
+    ring.header[0, meta.slot] = -1
+    assert ring.latest(0).seq == 3
+
+
+def test_reader_returns_a_copy_of_newer_frames(ring):
+    reader = RingReader(ring, 0, name="cam")
+    assert reader.read(0, timeout=0.05) is None
+
+    ring.write(0, 1, frame(1), timestamp=10.0)
+    ring.write(1, 1, frame(9), timestamp=11.0)
+    seq, timestamp, image = reader.read(0, timeout=0.05)
+    assert (seq, timestamp) == (1, 10.0) and (image == 1).all()
+
+    ring.write(0, 2, frame(2))
+    ring.write(0, 3, frame(3))
+    assert (image == 1).all()
+    assert reader.read(1, timeout=0.05)[0] == 3
+    assert reader.read(3, timeout=0.05) is None
+
+
+def test_reader_wakes_up_for_a_frame_written_while_waiting(ring):
+    reader = RingReader(ring, 0)
+    timer = threading.Timer(0.05, ring.write, (0, 1, frame(1)))
+    timer.start()
+    item = reader.read(0, timeout=2.0)
+    timer.join()
+    assert item is not None and item[0] == 1
+
+
+def test_reader_closes_with_the_ring_or_its_capture(ring):
+    alive = [True]
+    reader = RingReader(ring, 0, alive=lambda: alive[0])
+    assert not reader.closed
+    alive[0] = False
+    assert reader.closed and reader.read(0, timeout=5.0) is None
+
+    reader = RingReader(ring, 0)
+    ring.close()
+    assert reader.closed and reader.read(0) is None
+
+
+def test_broadcaster_streams_frames_of_the_ring(ring):
+    ring.write(0, 1, frame(50))
+    processed = []
+    broadcaster = MjpegBroadcaster("test", RingReader(ring, 0, name="cam"), lambda f: processed.append(f) or f)
+    stream = broadcaster.stream()
+    chunk = next(stream)
+    assert chunk.startswith(b"--frame\r\nContent-Type: image/jpeg")
+    assert processed and (processed[0] == 50).all()
+    stream.close()
+    assert broadcaster.viewers == 0
+    broadcaster._thread.join(2.0)
+    assert not broadcaster._thread.is_alive()
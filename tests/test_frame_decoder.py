@@ -0,0 +1,49 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_decoder import FrameDecoder, jpeg_size  # noqa: E402
+
+
+def encode(ext, width, height, value=128):
+    image = np.full((height, width, 3), value, dtype=np.uint8)
+    return cv2.imencode(ext, image)[1].tobytes()
+
+
+def test_jpeg_size_reads_the_frame_header():
+    assert jpeg_size(encode(".jpg", 320, 200)) == (320, 200)
+    assert jpeg_size(encode(".png", 320, 200)) is None
+    assert jpeg_size(b"\xff\xd8\xff") is None
+
+
+@pytest.mark.parametrize(
+    "width, height, shape",
+    [(640, 480, (480, 640)), (1280, 720, (360, 640)), (1920, 1080, (540, 960)), (5120, 2880, (360, 640))],
+)
+def test_large_jpegs_are_decoded_reduced_down_to_min_size(width, height, shape):
+    frame, size = FrameDecoder(min_size=640, max_size=1280).decode(encode(".jpg", width, height))
+    assert frame.shape == shape + (3,)
+    assert size == (width, height)
+
+
+def test_frames_over_max_size_are_resized():
+    frame, size = FrameDecoder(min_size=640, max_size=800).decode(encode(".png", 1600, 1200))
+    assert frame.shape == (600, 800, 3)
+    assert size == (1600, 1200)
+
+
+def test_frames_are_independent_arrays():
+    decoder = FrameDecoder(min_size=640, max_size=800)
+    first, _ = decoder.decode(encode(".png", 1600, 1200, value=10))
+    second, _ = decoder.decode(encode(".png", 1600, 1200, value=200))
+    assert not np.shares_memory(first, second)
+    assert (first == 10).all() and (second == 200).all()
+
+
+def test_undecodable_data():
+    assert FrameDecoder().decode(b"not an image") == (None, None)
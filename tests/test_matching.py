@@ -0,0 +1,54 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "face-recognition-master")
+)
+
+from face_tracking.tracker.matching import linear_assignment  # noqa: E402
+
+THRESH = 0.8
+
+
+def assign(cost):
+    matches, unmatched_a, unmatched_b = linear_assignment(np.array(cost, dtype=np.float64), THRESH)
+    return sorted(map(tuple, matches.tolist())), unmatched_a, unmatched_b
+
+
+@pytest.mark.parametrize("shape", [(0, 0), (0, 3), (2, 0)])
+def test_empty_matrix(shape):
+    matches, unmatched_a, unmatched_b = linear_assignment(np.empty(shape), THRESH)
+    assert matches.shape == (0, 2)
+    assert unmatched_a == tuple(range(shape[0]))
+    assert unmatched_b == tuple(range(shape[1]))
+
+
+def test_all_pairs_over_threshold():
+    assert assign([[0.9, 1.0], [0.95, 0.99]]) == ([], (0, 1), (0, 1))
+
+
+def test_without_conflicts_every_candidate_matches():
+    assert assign([[0.1, 0.9], [0.9, 0.2]]) == ([(0, 0), (1, 1)], (), ())
+
+
+def test_conflict_takes_the_cheapest_total():
+    # (0, 1) + (1, 0) = 0.35 beats (0, 0) alone, which leaves a row and a column over
+    assert assign([[0.1, 0.2], [0.15, 0.9]]) == ([(0, 1), (1, 0)], (), ())
+
+
+def test_pair_dearer_than_leaving_both_unmatched_is_dropped():
+    # (0, 1) + (1, 0) = 1.4 is below threshold pair by pair, but (0, 0) plus an
+    # unmatched row and column costs 0.1 + 2 * THRESH / 2 = 0.9
+    assert assign([[0.1, 0.7], [0.7, 0.95]]) == ([(0, 0)], (1,), (1,))
+
+
+def test_row_without_candidate_stays_unmatched():
+    # (0, 0) + (2, 1) = 0.8 beats (2, 0) + unmatched row 0 and column 1 = 1.0
+    assert assign([[0.3, 0.9], [0.9, 0.9], [0.2, 0.5]]) == ([(0, 0), (2, 1)], (1,), ())
+
+
+def test_cost_equal_to_threshold_is_a_candidate():
+    assert assign([[THRESH]]) == ([(0, 0)], (), ())
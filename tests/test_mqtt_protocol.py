@@ -0,0 +1,57 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mqtt_protocol  # noqa: E402
+from mqtt_protocol import parse_frame_message  # noqa: E402
+
+
+def test_versioned_message_on_a_camera_topic():
+    payload = json.dumps({"v": 1, "camera": "ignored", "seq": 3, "ts": 1.5, "frame": "abc"}).encode()
+    msg = parse_frame_message(payload, "crowd/gate-1/frame")
+    assert (msg.version, msg.task, msg.camera, msg.seq, msg.ts, msg.frame) == (1, "crowd", "gate-1", 3, 1.5, "abc")
+
+
+def test_legacy_single_quoted_payload():
+    payload = str({"frame": "aGVsbG8=", "id": 6}).encode()
+    msg = parse_frame_message(payload, "mqtt-crowd-frame", task="crowd")
+    assert (msg.version, msg.task, msg.camera, msg.id, msg.frame) == (0, "crowd", "default", 6, "aGVsbG8=")
+
+
+def test_raw_image_bytes():
+    msg = parse_frame_message(b"\xff\xd8\xff", "fatigue/cam-a/frame")
+    assert (msg.task, msg.camera, msg.encoding, msg.frame) == ("fatigue", "cam-a", "raw", b"\xff\xd8\xff")
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        b"{'frame': (1, 2)}",  # a Python literal, but not JSON after the quote swap
+        b"{'frame': 'x', 'id': __import__('os')}",
+        b"{" + b"[" * 100000 + b"]" * 100000 + b"}",
+        b'{"frame": "x"',
+        b"{\xff}",
+    ],
+)
+def test_malformed_payloads_raise_value_error(payload):
+    with pytest.raises(ValueError):
+        parse_frame_message(payload, "mqtt-crowd-frame", task="crowd")
+
+
+def test_legacy_fallback_is_not_tried_on_oversized_payloads(monkeypatch):
+    monkeypatch.setattr(mqtt_protocol, "LEGACY_MAX_BYTES", 64)
+    small = str({"frame": "x" * 10}).encode()
+    assert parse_frame_message(small, "mqtt-crowd-frame", task="crowd").frame == "x" * 10
+    with pytest.raises(ValueError, match="is not JSON"):
+        parse_frame_message(str({"frame": "x" * 100}).encode(), "mqtt-crowd-frame", task="crowd")
+    # Valid JSON is not subject to the limit
+    assert parse_frame_message(json.dumps({"frame": "x" * 100}).encode(), "mqtt-crowd-frame").frame == "x" * 100
+
+
+def test_unsupported_version():
+    with pytest.raises(ValueError, match="version"):
+        parse_frame_message(b'{"v": 2, "frame": "x"}', "crowd/cam/frame")
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from profiler import command_authorized  # noqa: E402
+
+
+def test_command_with_the_token_is_authorized():
+    assert command_authorized({"token": "s3cret", "seconds": 10}, "s3cret")
+
+
+@pytest.mark.parametrize(
+    "params",
+    [{}, {"token": ""}, {"token": "wrong"}, {"token": "s3cre"}, {"token": 123}, ["s3cret"], "s3cret", None],
+)
+def test_command_without_the_token_is_refused(params):
+    assert not command_authorized(params, "s3cret")
+
+
+@pytest.mark.parametrize("token", [None, ""])
+def test_commands_are_refused_without_a_configured_token(token):
+    assert not command_authorized({"token": ""}, token)
+    assert not command_authorized({"token": "anything"}, token)
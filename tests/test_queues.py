@@ -0,0 +1,21 @@
+import os
+import queue
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from queues import put_latest  # noqa: E402
+
+
+def test_put_latest_drops_the_oldest_items():
+    q = queue.Queue(maxsize=2)
+    assert [put_latest(q, i) for i in range(4)] == [0, 0, 1, 1]
+    assert [q.get_nowait() for _ in range(2)] == [2, 3]
+
+
+def test_publisher_does_not_import_the_frame_bus():
+    code = "import sys, mqtt_publisher; print(sorted({'cv2', 'frame_bus', 'camera_stream'} & set(sys.modules)))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
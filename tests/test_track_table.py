@@ -0,0 +1,175 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import scipy.linalg
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "face-recognition-master")
+)
+
+from face_tracking.tracker.basetrack import TrackState  # noqa: E402
+from face_tracking.tracker.kalman_filter import KalmanFilter  # noqa: E402
+from face_tracking.tracker.track_table import TrackTable, tlbr_to_xyah  # noqa: E402
+
+KF = KalmanFilter()
+
+
+# Per-track reference: the original deep_sort predict / update / gating_distance
+def ref_predict(mean, covariance, tracked=True):
+    mean = mean.copy()
+    if not tracked:
+        mean[7] = 0
+    h = mean[3]
+    std = [h / 20, h / 20, 1e-2, h / 20, h / 160, h / 160, 1e-5, h / 160]
+    mean = KF._motion_mat @ mean
+    covariance = KF._motion_mat @ covariance @ KF._motion_mat.T + np.diag(np.square(std))
+    return mean, covariance
+
+
+def ref_project(mean, covariance):
+    h = mean[3]
+    innovation_cov = np.diag(np.square([h / 20, h / 20, 1e-1, h / 20]))
+    return mean[:4], covariance[:4, :4] + innovation_cov
+
+
+def ref_update(mean, covariance, measurement):
+    projected_mean, projected_cov = ref_project(mean, covariance)
+    chol_factor, lower = scipy.linalg.cho_factor(projected_cov, lower=True, check_finite=False)
+    kalman_gain = scipy.linalg.cho_solve(
+        (chol_factor, lower), (covariance @ KF._update_mat.T).T, check_finite=False
+    ).T
+    new_mean = mean + (measurement - projected_mean) @ kalman_gain.T
+    new_covariance = covariance - kalman_gain @ projected_cov @ kalman_gain.T
+    return new_mean, new_covariance
+
+
+def ref_gating_distance(mean, covariance, measurements, only_position=False):
+    mean, covariance = ref_project(mean, covariance)
+    if only_position:
+        mean, covariance = mean[:2], covariance[:2, :2]
+        measurements = measurements[:, :2]
+    cholesky_factor = np.linalg.cholesky(covariance)
+    d = measurements - mean
+    z = scipy.linalg.solve_triangular(cholesky_factor, d.T, lower=True, check_finite=False)
+    return np.sum(z * z, axis=0)
+
+
+def random_boxes(rng, n):
+    xy = rng.uniform(0, 500, size=(n, 2))
+    wh = rng.uniform(20, 120, size=(n, 2))
+    return np.hstack([xy, xy + wh])
+
+
+def jitter(rng, tlbrs):
+    return tlbrs + rng.normal(0, 3, size=tlbrs.shape)
+
+
+def random_states(rng, n, steps=3):
+    mean, covariance = KF.multi_initiate(tlbr_to_xyah(random_boxes(rng, n)))
+    for _ in range(steps):
+        mean, covariance = KF.multi_predict(mean, covariance)
+        measurement = mean[:, :4] + rng.normal(0, 2, size=(n, 4)) * [1, 1, 0.01, 1]
+        mean, covariance = KF.multi_update(mean, covariance, measurement)
+    return mean, covariance
+
+
+def test_multi_update_matches_per_track_reference():
+    rng = np.random.default_rng(0)
+    mean, covariance = random_states(rng, 6)
+    mean, covariance = KF.multi_predict(mean, covariance)
+    measurement = tlbr_to_xyah(jitter(rng, KF.multi_project(mean, covariance)[0][:, :4]))
+
+    new_mean, new_covariance = KF.multi_update(mean, covariance, measurement)
+
+    for i in range(len(mean)):
+        ref_mean, ref_covariance = ref_update(mean[i], covariance[i], measurement[i])
+        np.testing.assert_allclose(new_mean[i], ref_mean, rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(new_covariance[i], ref_covariance, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("only_position", [False, True])
+def test_multi_gating_distance_matches_per_track_reference(only_position):
+    rng = np.random.default_rng(1)
+    mean, covariance = random_states(rng, 5)
+    measurements = tlbr_to_xyah(random_boxes(rng, 7))
+
+    distances = KF.multi_gating_distance(mean, covariance, measurements, only_position)
+
+    assert distances.shape == (5, 7)
+    for i in range(len(mean)):
+        expected = ref_gating_distance(mean[i], covariance[i], measurements, only_position)
+        np.testing.assert_allclose(distances[i], expected, rtol=1e-6)
+
+
+def test_multi_gating_distance_without_measurements():
+    mean, covariance = random_states(np.random.default_rng(2), 3)
+    assert KF.multi_gating_distance(mean, covariance, np.empty((0, 4))).shape == (3, 0)
+
+
+def assert_rows_follow_reference(table, reference):
+    assert sorted(table.track_id.tolist()) == sorted(reference)
+    for row, track_id in enumerate(table.track_id):
+        ref_mean, ref_covariance = reference[track_id]
+        np.testing.assert_allclose(table.mean[row], ref_mean, rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(table.covariance[row], ref_covariance, rtol=1e-9, atol=1e-9)
+
+
+def test_table_rows_follow_their_tracks_through_removal_and_reuse():
+    rng = np.random.default_rng(3)
+    table = TrackTable(KF)
+    reference = {}
+
+    def add(track_ids, frame_id):
+        tlbrs = random_boxes(rng, len(track_ids))
+        table.add(tlbrs, np.full(len(track_ids), 0.9), np.arange(len(track_ids)), track_ids, frame_id)
+        for track_id, xyah in zip(track_ids, tlbr_to_xyah(tlbrs)):
+            reference[track_id] = KF.initiate(xyah)
+
+    def step(frame_id, matched_ids):
+        rows = np.arange(len(table))
+        tracked = table.state[rows] == TrackState.Tracked
+        for track_id, is_tracked in zip(table.track_id[rows], tracked):
+            reference[track_id] = ref_predict(*reference[track_id], tracked=is_tracked)
+        table.predict(rows)
+
+        matched = np.flatnonzero(np.isin(table.track_id, matched_ids))
+        tlbrs = jitter(rng, table.tlbr(matched))
+        for track_id, xyah in zip(table.track_id[matched], tlbr_to_xyah(tlbrs)):
+            reference[track_id] = ref_update(*reference[track_id], xyah)
+        table.update(matched, tlbrs, np.full(len(matched), 0.8), np.arange(len(matched)), frame_id)
+        return matched
+
+    add(np.array([1, 2, 3, 4]), frame_id=1)
+    step(2, [1, 2, 3, 4])
+    step(3, [1, 3, 4])
+    assert_rows_follow_reference(table, reference)
+
+    # Track 2 is removed and track 4 lost; dropping closes the gap left by
+    # track 2 and new tracks are appended after the survivors
+    table.state[table.track_id == 2] = TrackState.Removed
+    table.state[table.track_id == 4] = TrackState.Lost
+    table.drop_removed()
+    del reference[2]
+    assert table.track_id.tolist() == [1, 3, 4]
+    assert table.tracklet_len.tolist() == [2, 2, 2]
+
+    add(np.array([5, 6]), frame_id=4)
+    assert table.track_id.tolist() == [1, 3, 4, 5, 6]
+    assert table.state.tolist() == [TrackState.Tracked] * 2 + [TrackState.Lost] + [TrackState.Tracked] * 2
+    assert not table.is_activated[3:].any()
+
+    # Lost track 4 does not grow while it is predicted, then is re-found
+    step(5, [1, 5, 6])
+    step(6, [1, 3, 4, 5, 6])
+    assert_rows_follow_reference(table, reference)
+    assert table.state.tolist() == [TrackState.Tracked] * 5
+    assert table.tracklet_len.tolist() == [4, 3, 0, 2, 2]
+    assert table.is_activated.all()
+    assert table.frame_id.tolist() == [6] * 5
+
+    # Dropping with nothing removed keeps every row as it is
+    mean = table.mean.copy()
+    table.drop_removed()
+    np.testing.assert_array_equal(table.mean, mean)